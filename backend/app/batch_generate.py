@@ -0,0 +1,170 @@
+# app/batch_generate.py
+import argparse, asyncio, json, sys, time
+from dataclasses import asdict
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .config import settings
+from .db import get_sessionmaker
+from .models import Big5Score, CachedResponse
+from .services.batch import (
+    BatchClient,
+    BatchItem,
+    LocalBatchClient,
+    OpenAIBatchClient,
+    load_results,
+    parse_output,
+    request_lines,
+    wait,
+    write_jsonl,
+)
+from .services.big5 import TRAITS
+from .services.exporting import stream_rows
+from .services.llm import CONDITION_ORDER, get_cache, get_client, system_prompt_for, task_inputs
+from .services.personas import personas_from_traits
+from .services.warmup import load_study_tasks
+
+# arms whose prompts do not depend on the participant's traits
+SHARED_CONDITIONS = ("baseline", "creative")
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+async def _load_traits(sessions: async_sessionmaker, participant_ids=None):
+    """Each participant's latest O/C/E/A/N; every scored participant when participant_ids is None."""
+    latest = {}
+    q = (
+        select(Big5Score.participant_id, *(getattr(Big5Score, t) for t in TRAITS))
+        .order_by(Big5Score.created_at, Big5Score.id)
+    )
+    if participant_ids is not None:
+        q = q.where(Big5Score.participant_id.in_(participant_ids))
+    async with sessions() as session:
+        async for pid, *scores in stream_rows(session, q):
+            latest[pid] = dict(zip(TRAITS, scores))  # later rows overwrite earlier ones
+    return latest
+
+async def _generated(sessions: async_sessionmaker, participant_ids=None) -> set:
+    """(participant_id, task_id, condition) already in cached_responses; every participant's when participant_ids is None."""
+    q = select(CachedResponse.participant_id, CachedResponse.task_id, CachedResponse.condition).distinct()
+    if participant_ids is not None:
+        q = q.where(CachedResponse.participant_id.in_(participant_ids))
+    async with sessions() as session:
+        return {tuple(row) async for row in stream_rows(session, q)}
+
+def build_items(tasks, traits, generated=frozenset()):
+    """
+    The shared arms of every task, plus all four conditions per participant
+    in `traits` except those in `generated` (already shown to them live).
+    Style and prompts are resolved and rendered exactly like warm-up and
+    the live path (llm.task_inputs).
+    """
+    shared = dict(zip(CONDITION_ORDER, personas_from_traits({})))
+    items = []
+    for task in tasks:
+        style, prompt_text = task_inputs(task.task_id, task.prompt_text)
+        for cond in SHARED_CONDITIONS:
+            sys_prompt = system_prompt_for(style, cond, shared[cond]["persona"])
+            items.append(BatchItem(None, task.task_id, cond, sys_prompt, prompt_text))
+        for pid, mirror in traits.items():
+            for cond, persona in zip(CONDITION_ORDER, personas_from_traits(mirror)):
+                if (pid, task.task_id, cond) in generated:
+                    continue
+                sys_prompt = system_prompt_for(style, cond, persona["persona"])
+                items.append(BatchItem(pid, task.task_id, cond, sys_prompt, prompt_text))
+    return items
+
+def _make_client(name: str, work_dir: Path, local_dir) -> BatchClient:
+    if name == "local":
+        return LocalBatchClient(local_dir or work_dir / "local")
+    client = get_client()
+    if client is None:
+        sys.exit("--client openai needs OPENAI_API_KEY and the openai package")
+    return OpenAIBatchClient(client)
+
+def _require_shared_cache(client: BatchClient) -> None:
+    # the live path only reads the cache: results loaded into this process would be lost on exit
+    if client.name != "local" and get_cache().stats()["backend"] == "memory":
+        sys.exit(f"--client {client.name} needs REDIS_URL: the live server only sees batch results "
+                 "through a shared cache")
+
+async def _submit(args, sessions: async_sessionmaker, client) -> tuple:
+    tasks = await load_study_tasks(sessions)
+    traits, generated = {}, set()
+    if args.all_participants or args.participants:
+        who = None if args.all_participants else args.participants
+        traits = await _load_traits(sessions, who)
+        for pid in set(args.participants or []) - set(traits):
+            print(f"{pid}: no Big5 score, skipped", file=sys.stderr)
+        generated = await _generated(sessions, who)
+    items = build_items(tasks, traits, generated)
+
+    work_dir = args.work_dir or BASE_DIR / "batches" / time.strftime("%Y%m%d-%H%M%S")
+    work_dir.mkdir(parents=True, exist_ok=True)
+    n = write_jsonl(work_dir / "input.jsonl", request_lines(items))
+    client = client or _make_client(args.client, work_dir, args.local_dir)
+    _require_shared_cache(client)
+    batch_id = await client.submit(work_dir / "input.jsonl")
+    manifest = {"client": client.name, "batch_id": batch_id, "items": [asdict(i) for i in items]}
+    (work_dir / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    print(f"Submitted {batch_id}: {n} requests for {len(items)} generations ({len(tasks)} tasks, "
+          f"{len(traits)} participants) -> {work_dir}", file=sys.stderr)
+    return work_dir, client, batch_id, items
+
+async def _run(args, sessions: async_sessionmaker, client) -> None:
+    if args.resume:
+        work_dir = args.resume
+        manifest = json.loads((work_dir / "manifest.json").read_text(encoding="utf-8"))
+        client = client or _make_client(args.client or manifest["client"], work_dir, args.local_dir)
+        _require_shared_cache(client)
+        batch_id, items = manifest["batch_id"], [BatchItem(**i) for i in manifest["items"]]
+    else:
+        work_dir, client, batch_id, items = await _submit(args, sessions, client)
+        if args.no_wait:
+            print(f"Finish later with --resume {work_dir}", file=sys.stderr)
+            return
+
+    state = await wait(client, batch_id, args.poll_s)
+    if state["status"] != "completed" or not state.get("output_file_id"):
+        sys.exit(f"batch {batch_id} ended as {state['status']}")
+    results, failed = parse_output(await client.download(state["output_file_id"]))
+    cache = get_cache()
+    loaded = await load_results(items, results, cache)
+    print(f"Loaded {loaded['generations']} generations, {loaded['participantRows']} participant rows "
+          f"({loaded['skipped']} already generated live, {failed} failed requests, "
+          f"{loaded['missing']} generations left to the live path)", file=sys.stderr)
+    if cache.stats()["backend"] == "memory":
+        print("Cache is in-process: set REDIS_URL so the live server sees these results", file=sys.stderr)
+    if not settings.CACHE_CONTENT_KEYS:
+        print("Shared arms are served to other participants only with CACHE_CONTENT_KEYS=true", file=sys.stderr)
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Pre-generate study arms offline through a Batch API")
+    who = p.add_mutually_exclusive_group()
+    who.add_argument("--participants", nargs="+", metavar="ID",
+                     help="also fill all four conditions for these scored participants")
+    who.add_argument("--all-participants", action="store_true",
+                     help="also fill all four conditions for every participant with a Big5 score")
+    p.add_argument("--resume", type=Path, default=None, metavar="WORK_DIR",
+                   help="poll and load a batch submitted earlier instead of building a new one")
+    p.add_argument("--client", choices=["openai", "local"], default=None,
+                   help="batch provider (default: openai with OPENAI_API_KEY, else the local stand-in)")
+    p.add_argument("--local-dir", type=Path, default=None,
+                   help="files of the local stand-in (default: WORK_DIR/local)")
+    p.add_argument("--work-dir", type=Path, default=None,
+                   help="input file and manifest (default: backend/batches/<timestamp>)")
+    p.add_argument("--poll-s", type=float, default=30.0, help="seconds between status checks")
+    p.add_argument("--no-wait", action="store_true", help="submit and exit; finish later with --resume")
+    args = p.parse_args(argv)
+    if args.resume and (args.participants or args.all_participants or args.no_wait):
+        p.error("--resume only polls and loads an existing batch")
+    if args.client is None and not args.resume:
+        args.client = "openai" if settings.OPENAI_API_KEY else "local"
+    return args
+
+def main(argv=None, sessions: async_sessionmaker | None = None, client: BatchClient | None = None):
+    args = _parse_args(argv)
+    asyncio.run(_run(args, sessions or get_sessionmaker(), client))
+
+if __name__ == "__main__":
+    main()
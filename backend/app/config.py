@@ -5,29 +5,91 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
     # Core
-    DATABASE_URL: str
+    DATABASE_URL: str = "sqlite+aiosqlite:///./study.db"
     OPENAI_API_KEY: str = ""
     LLM_MODEL: str = "gpt-4o-mini"          # set your default
     LLM_TEMPERATURE: float = 0.8
     LLM_TOP_P: float = 1.0
     LLM_MAX_TOKENS: int = 800
     LLM_SEED: int | None = None
+    LLM_PROVIDER: str = "auto"               # auto | openai | mock (inline, no network)
+    LLM_BASE_URL: str | None = None          # OpenAI-compatible endpoint, e.g. python -m app.mock_llm
+
+    # Database engine (app/db.py)
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5                    # persistent connections per worker
+    DB_MAX_OVERFLOW: int = 10                # extra connections under burst (not SQLite)
+    DB_POOL_TIMEOUT_S: float = 30            # max wait for a free connection
+    DB_POOL_RECYCLE_S: int = 1800            # reconnect older connections (Postgres idle timeouts)
+    DB_POOL_PRE_PING: bool = True            # Postgres only; SQLite files cannot go stale
+    DB_STATEMENT_CACHE_SIZE: int = 500       # asyncpg prepared statements per connection
+    SQLITE_WAL: bool = True                  # journal_mode=WAL: readers don't block the writer
+    SQLITE_SYNCHRONOUS: str = "NORMAL"       # safe with WAL; FULL fsyncs every commit
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000       # wait for the write lock instead of failing
+    DB_MIGRATE: bool = True                  # bring the schema up to date at startup (db.init_db)
 
     # Infra
     REDIS_URL: str | None = None
     CACHE_TTL_S: int = 60 * 60              # 1 hour
-    TIMEOUT_S: int = 25
+    CACHE_MAX_ENTRIES: int = 10_000          # in-memory cache only
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_SWEEP_S: float = 60.0
+    CACHE_L1_MAX_ENTRIES: int = 1_000        # per-worker L1 in front of Redis
+    CACHE_L1_TTL_S: int = 30                 # 0 disables the L1 tier
+    CACHE_CONTENT_KEYS: bool = False         # share generations by model + params + prompts (for seeded configs)
+    BATCH_CACHE_TTL_S: int = 0               # batch-loaded generations (app.batch_generate); 0 = no expiry
+    TIMEOUT_S: int = 25                      # admission wait + OpenAI call
+    LLM_MAX_CONCURRENCY: int = 16            # in-flight OpenAI calls per worker; 0 = unlimited
+    LLM_RPM: float = 0                       # requests/min bucket; 0 = off
+    LLM_TPM: float = 0                       # tokens/min bucket; 0 = off
+    LLM_MAX_ATTEMPTS: int = 3                # per condition, incl. the first try
+    LLM_RETRY_BASE_S: float = 0.25           # decorrelated jitter backoff
+    LLM_RETRY_CAP_S: float = 4.0
+    LLM_HEDGE_PERCENTILE: float = 95         # hedge once slower than this; 0 = off
+    PARTIAL_RESULTS: bool = False            # /generate-task returns what succeeded
+
+    # Write-behind of generations (cached_responses) and scores (big5_scores)
+    PERSIST_GENERATIONS: bool = True
+    PERSIST_BATCH_SIZE: int = 200            # rows per INSERT batch
+    PERSIST_FLUSH_S: float = 1.0             # max age of a partial batch
+    PERSIST_QUEUE_SIZE: int = 10_000         # rows beyond this are dropped
+    PERSIST_SCORES: bool = True              # /score-big5 -> participants + big5_scores
 
     # Tasks config
     TASKS_STYLE_A: int = 2                   # 2–3
     TASKS_STYLE_B: int = 2
 
+    # Pre-generation after /score-big5
+    WARMUP_ENABLED: bool = False
+    WARMUP_CONCURRENCY: int = 2              # participants warmed in parallel
+    WARMUP_QUEUE_SIZE: int = 100             # submissions beyond this are dropped
+
     # Governance
     LOG_PROMPT_VERSION: str = "v1"
+    PROMPT_RELOAD_S: float = 2.0             # mtime poll for app/prompts; 0 disables
+    PROMPT_CACHE_LAYOUT: bool = False        # static template first, trait values last (provider prefix cache)
+    PROMPT_BLOBS: bool = False               # store prompts once in prompt_blobs, referenced by hash
     STRIP_PII: bool = True
 
 @lru_cache
 def get_settings() -> Settings:
     return Settings()
 
-settings = get_settings()
+class _LazySettings:
+    """
+    Module-level handle on get_settings(): nothing reads the environment or
+    .env until the first attribute access, so importing app modules has no
+    side effects. Assignments go to the real Settings (tests monkeypatch it).
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(get_settings(), name, value)
+
+    def __repr__(self) -> str:
+        return repr(get_settings())
+
+settings = _LazySettings()
@@ -1,21 +1,171 @@
 # app/db.py
 from __future__ import annotations
-import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from functools import lru_cache
+from time import perf_counter
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./study.db")
+from app.config import settings
 
 class Base(DeclarativeBase):
     pass
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
-AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+class PoolMetrics:
+    """How long checkouts wait for a free pooled connection; a rising wait means the pool is starved."""
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
 
-async def init_db() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    def record(self, waited_ms: float) -> None:
+        self.checkouts += 1
+        self.wait_ms_total += waited_ms
+        self.wait_ms_max = max(self.wait_ms_max, waited_ms)
+
+    def stats(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "waitMsAvg": round(self.wait_ms_total / self.checkouts, 2) if self.checkouts else 0.0,
+            "waitMsMax": round(self.wait_ms_max, 2),
+        }
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records the time each checkout spends waiting in `metrics`."""
+    metrics = PoolMetrics()
+
+    def _do_get(self):
+        t0 = perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record((perf_counter() - t0) * 1000)
+        return conn
+
+def _sqlite_pragmas(in_memory: bool):
+    pragmas = [f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+               f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}"]
+    if settings.SQLITE_WAL and not in_memory:
+        pragmas.insert(0, "PRAGMA journal_mode=WAL")
+
+    def on_connect(dbapi_conn, _record) -> None:
+        cur = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cur.execute(pragma)
+        cur.close()
+    return on_connect
+
+def build_engine(url: str) -> AsyncEngine:
+    """
+    Engine for `url`, configured from Settings per dialect:
+      postgresql: sized QueuePool with recycle + pre-ping; asyncpg prepared
+                  statement cache
+      sqlite:     file DBs get a small persistent pool instead of NullPool
+                  (one connection per session) and WAL / synchronous /
+                  busy_timeout pragmas on every new connection
+    """
+    u = make_url(url)
+    kwargs: dict = {"echo": settings.DB_ECHO, "future": True}
+    in_memory = u.get_backend_name() == "sqlite" and u.database in (None, "", ":memory:")
+    if u.get_backend_name() == "sqlite":
+        if not in_memory:
+            kwargs.update(poolclass=TimedQueuePool, pool_size=settings.DB_POOL_SIZE, max_overflow=0,
+                          pool_timeout=settings.DB_POOL_TIMEOUT_S)
+    else:
+        kwargs.update(
+            poolclass=TimedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_S,
+            pool_recycle=settings.DB_POOL_RECYCLE_S,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+        if u.get_driver_name() == "asyncpg" and "prepared_statement_cache_size" not in u.query:
+            u = u.update_query_dict({"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)})
+
+    eng = create_async_engine(u, **kwargs)
+    if u.get_backend_name() == "sqlite":
+        event.listen(eng.sync_engine, "connect", _sqlite_pragmas(in_memory))
+    return eng
+
+def pool_stats(eng: AsyncEngine | None = None) -> dict:
+    pool = (eng or get_engine()).sync_engine.pool
+    out = {"pool": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        out.update(size=pool.size(), checkedOut=pool.checkedout(), overflow=pool.overflow())
+    out.update(TimedQueuePool.metrics.stats())
+    return out
+
+# built on first use, so importing app.db reads no settings and opens nothing
+@lru_cache
+def get_engine() -> AsyncEngine:
+    return build_engine(settings.DATABASE_URL)
+
+@lru_cache
+def get_sessionmaker() -> async_sessionmaker:
+    # also the dependency for streaming responses: the body outlives the
+    # request's dependencies, so the generator opens (and closes) its own session
+    return async_sessionmaker(get_engine(), expire_on_commit=False, class_=AsyncSession)
+
+def __getattr__(name: str):
+    # `engine` / `AsyncSessionLocal` remain importable, built on first access
+    if name == "engine":
+        return get_engine()
+    if name == "AsyncSessionLocal":
+        return get_sessionmaker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# nullable columns added to tables older databases already have; create_all
+# skips existing tables, so init_db adds these with ALTER TABLE
+ADDED_COLUMNS = {
+    "big5_scores": ("answers",),
+    "cached_responses": ("system_prompt_hash", "user_prompt_hash"),
+}
+
+def _migrate(conn) -> None:
+    Base.metadata.create_all(conn)
+    insp = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    for table_name, names in ADDED_COLUMNS.items():
+        table = Base.metadata.tables[table_name]
+        have = {c["name"] for c in insp.get_columns(table_name)}
+        for name in names:
+            if name not in have:
+                col_type = table.c[name].type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(name)} {col_type}"))
+    # indexes declared since a table was created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+async def init_db(eng: AsyncEngine | None = None) -> None:
+    """
+    Bring an existing database up to the current models: create_all adds the
+    tables it is missing, ADDED_COLUMNS and any missing indexes are added to
+    the ones it already has, and existing rows are left alone. Safe to run
+    on every startup.
+    """
+    import app.models  # noqa: F401  registers every table on Base.metadata
+    async with (eng or get_engine()).begin() as conn:
+        await conn.run_sync(_migrate)
 
 async def get_session():
-    async with AsyncSessionLocal() as session:
+    async with get_sessionmaker()() as session:
         yield session
+
+async def insert_ignore(session: AsyncSession, model, rows: list[dict]) -> None:
+    """Multi-row INSERT that skips rows whose primary/unique key already exists."""
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"insert_ignore: unsupported dialect {dialect}")
+    await session.execute(dialect_insert(model).on_conflict_do_nothing(), rows)
@@ -1,109 +1,240 @@
 # app/export_csv.py
-import asyncio, csv, json, os
+import argparse, asyncio, csv, os, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy import select
 
 from .config import settings
+from .db import build_engine, init_db
 from .models import Big5Score, CachedResponse, Rating
+from .services.exporting import (
+    BIG5_DTYPES,
+    GENERATION_COLUMNS,
+    GENERATION_DTYPES,
+    RATING_DTYPES,
+    encode_generation_batch,
+    expand_generation_row,
+    get_watermark,
+    high_water_mark,
+    merge_columns,
+    observe_texts,
+    raw_generation_rows,
+    rebuild_registry,
+    registry_columns,
+    set_watermark,
+    stream_rows,
+    table_rows,
+    window,
+)
+from .services.formats import ARROW_FORMATS, FORMATS, arrow_available, encode, encode_batch, encode_header
 
-def _flatten(value, parent_key="", sep="_"):
-    items = {}
-    if isinstance(value, dict):
-        for key, nested in value.items():
-            new_key = f"{parent_key}{sep}{key}" if parent_key else key
-            items.update(_flatten(nested, new_key, sep))
-    elif isinstance(value, list):
-        for idx, nested in enumerate(value):
-            new_key = f"{parent_key}{sep}{idx}" if parent_key else str(idx)
-            items.update(_flatten(nested, new_key, sep))
-    elif parent_key:
-        items[parent_key] = value
-    return items
-
-async def main():
+# rows per batch handed to a worker process
+POOL_BATCH_ROWS = 5_000
+
+def _read_header(path: Path):
+    if not path.exists():
+        return None
+    with path.open(newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), None)
+
+async def _batches(rows, size: int):
+    batch = []
+    async for row in rows:
+        batch.append(tuple(row))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def _pooled(pool, fn, batches, depth: int):
+    """Run fn over each batch in the pool, at most `depth` at once, yielding results in order."""
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    async for batch in batches:
+        pending.append(loop.run_in_executor(pool, fn, batch))
+        if len(pending) >= depth:
+            yield await pending.popleft()
+    while pending:
+        yield await pending.popleft()
+
+class _Export:
+    """One CLI run: output format, optional worker pool, per-table stats."""
+    def __init__(self, fmt: str, pool, depth: int) -> None:
+        self.fmt = fmt
+        # Arrow/Parquet encoding is already native code; only csv/ndjson.gz batches go to the pool
+        self.pool = pool if fmt not in ARROW_FORMATS else None
+        self.depth = depth
+
+    async def scan_columns(self, s, max_id: int, after_id: int = 0):
+        texts = stream_rows(s, window(select(CachedResponse.text), CachedResponse, max_id, after_id))
+        columns = {}
+        if self.pool is None:
+            async for batch in _batches(texts, POOL_BATCH_ROWS):
+                merge_columns(columns, observe_texts([t for (t,) in batch]))
+            return columns
+        texts_only = (([t for (t,) in batch]) async for batch in _batches(texts, POOL_BATCH_ROWS))
+        async for observed in _pooled(self.pool, observe_texts, texts_only, self.depth):
+            merge_columns(columns, observed)
+        return columns
+
+    async def chunks(self, dtypes, rows, flattened_keys=None, header: bool = True):
+        names = list(dtypes)
+        if self.pool is None:
+            if flattened_keys is not None:
+                rows = (expand_generation_row(r, flattened_keys) async for r in rows)
+            async for chunk in encode(self.fmt, dtypes, rows, header=header):
+                yield chunk
+            return
+        if self.fmt == "csv" and header:
+            yield encode_header(names)
+        if flattened_keys is not None:
+            fn = partial(encode_generation_batch, self.fmt, names, flattened_keys=flattened_keys)
+        else:
+            fn = partial(encode_batch, self.fmt, names)
+        async for chunk in _pooled(self.pool, fn, _batches(rows, POOL_BATCH_ROWS), self.depth):
+            yield chunk
+
+    async def write(self, path: Path, dtypes, rows, flattened_keys=None, append: bool = False) -> int:
+        # rows arrive from a server-side cursor; nothing is held in memory
+        n = 0
+
+        async def counted():
+            nonlocal n
+            async for row in rows:
+                n += 1
+                yield row
+
+        with path.open("ab" if append else "wb") as f:
+            async for chunk in self.chunks(dtypes, counted(), flattened_keys, header=not append):
+                f.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        return n
+
+def _watermark_key(model, fmt: str) -> str:
+    # each output file tracks its own watermark; csv keeps the bare table name
+    return model.__tablename__ if fmt == "csv" else f"{model.__tablename__}:{fmt}"
+
+async def _resume_from(s, table_name: str, path: Path, header, append: bool) -> int:
+    """Watermark to append after, or 0 for a full rewrite (no --append, no file, or a different CSV header)."""
+    if not append:
+        return 0
+    after_id = await get_watermark(s, table_name)
+    if after_id and header is not None and path.suffix == ".csv" and _read_header(path) != header:
+        print(f"{path.name}: header changed, rewriting in full")
+        return 0
+    return after_id if path.exists() else 0
+
+def _report(name: str, path: Path, n: int, start_size: int, elapsed: float, after_id: int, max_id: int) -> None:
+    written = path.stat().st_size - start_size
+    elapsed = max(elapsed, 1e-9)
+    ids = f", ids {after_id + 1}..{max_id}" if after_id else ""
+    print(f"{name}: {n} rows, {written} bytes in {elapsed:.2f}s "
+          f"({n / elapsed:,.0f} rows/s, {written / elapsed / 1e6:.1f} MB/s{ids}) -> {path}")
+
+async def _export_table(sessions, run: _Export, path: Path, model, dtypes, append: bool) -> None:
+    t0 = time.perf_counter()
+    async with sessions() as s:
+        max_id = await high_water_mark(s, model)
+        columns = list(dtypes)
+        after_id = await _resume_from(s, _watermark_key(model, run.fmt), path, columns, append)
+        start_size = path.stat().st_size if after_id else 0
+        n = await run.write(path, dtypes, table_rows(s, model, columns, max_id, after_id), append=bool(after_id))
+        if append:
+            await set_watermark(s, _watermark_key(model, run.fmt), max_id)
+            await s.commit()
+    _report(model.__name__, path, n, start_size, time.perf_counter() - t0, after_id, max_id)
+
+async def _export_generations(sessions, run: _Export, path: Path, columns: str, append: bool) -> None:
+    t0 = time.perf_counter()
+    async with sessions() as s:
+        max_id = await high_water_mark(s, CachedResponse)
+        after_id = await _resume_from(s, _watermark_key(CachedResponse, run.fmt), path, None, append)
+        if columns == "registry":
+            flattened = await registry_columns(s)
+        else:
+            flattened = await run.scan_columns(s, max_id, after_id)
+
+        if run.fmt == "csv" and after_id:
+            existing = _read_header(path)
+            base = len(GENERATION_COLUMNS)
+            if existing is not None and existing[:base] == GENERATION_COLUMNS and set(flattened) <= set(existing[base:]):
+                # new rows fit the file's columns: keep its order and append
+                flattened = {k: flattened.get(k, "null") for k in existing[base:]}
+            else:
+                # new flattened keys cannot be added to rows already on disk
+                print(f"{path.name}: new columns, rewriting in full")
+                after_id = 0
+                if columns == "scan":
+                    flattened = await run.scan_columns(s, max_id)
+
+        start_size = path.stat().st_size if after_id else 0
+        rows = raw_generation_rows(s, max_id, after_id)
+        n = await run.write(path, GENERATION_DTYPES | flattened, rows, list(flattened), append=bool(after_id))
+        if append:
+            await set_watermark(s, _watermark_key(CachedResponse, run.fmt), max_id)
+            await s.commit()
+    _report("CachedResponse", path, n, start_size, time.perf_counter() - t0, after_id, max_id)
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Export study tables to backend/exports/")
+    p.add_argument("--format", choices=list(FORMATS), default="csv",
+                   help="csv, parquet / arrow (typed, need pyarrow) or gzip-compressed ndjson")
+    p.add_argument("--columns", choices=["scan", "registry"], default="scan",
+                   help="how generations.csv discovers flattened JSON columns: "
+                        "a first pass over `text` (scan) or the export_columns table (registry)")
+    p.add_argument("--rebuild-columns", action="store_true",
+                   help="backfill export_columns from every stored generation before exporting")
+    p.add_argument("--append", action="store_true",
+                   help="only append rows newer than each table's export watermark to the existing files "
+                        "(csv and ndjson.gz); watermarks are only read and written with this flag")
+    p.add_argument("--out-dir", type=Path, default=None,
+                   help="directory for the exported files (default: backend/exports)")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                   help="processes for JSON flattening and csv/ndjson encoding; 0 encodes in-process")
+    args = p.parse_args(argv)
+    if args.format in ARROW_FORMATS and not arrow_available():
+        p.error(f"--format {args.format} requires pyarrow")
+    if args.append and args.format in ARROW_FORMATS:
+        p.error(f"--append is not supported for {args.format} files")
+    return args
+
+async def main(argv=None):
+    args = _parse_args(argv)
     print("CWD:", os.getcwd())
     print("DATABASE_URL:", settings.DATABASE_URL)
 
-    engine = create_async_engine(settings.DATABASE_URL, future=True)
+    engine = build_engine(settings.DATABASE_URL)
+    if settings.DB_MIGRATE:
+        await init_db(engine)  # same schema upgrade as the server's startup
     async_session = async_sessionmaker(engine, expire_on_commit=False)
 
     # Use an absolute export dir (next to your backend folder)
     base_dir = Path(__file__).resolve().parents[1]
-    export_dir = base_dir / "exports"
+    export_dir = args.out_dir or base_dir / "exports"
     export_dir.mkdir(parents=True, exist_ok=True)
     print("Export dir:", export_dir)
 
-    async with async_session() as s:
-        # ---------- CachedResponse ----------
-        res = await s.execute(select(CachedResponse).order_by(CachedResponse.id))
-        rows = res.scalars().all()
-        print("CachedResponse rows:", len(rows))
-        gen_path = export_dir / "generations.csv"
-
-        base_header = [
-            "participant_id","task_id","condition","response_id","model",
-            "tokens_in","tokens_out","latency_ms","created_at",
-            "system_prompt","user_prompt","prompt_text","text",
-        ]
-        processed_rows = []
-        flattened_keys = []
-        seen_keys = set()
-
-        for r in rows:
-            row_values = [
-                r.participant_id, r.task_id, r.condition, r.response_id,
-                r.model, r.tokens_in, r.tokens_out, r.latency_ms,
-                r.created_at, r.system_prompt, r.user_prompt, r.prompt_text,
-                r.text,
-            ]
-            flattened = {}
-            if r.text:
-                try:
-                    parsed = json.loads(r.text)
-                    if isinstance(parsed, (dict, list)):
-                        flattened = _flatten(parsed)
-                except json.JSONDecodeError:
-                    pass
-            for key in flattened:
-                if key not in seen_keys:
-                    seen_keys.add(key)
-                    flattened_keys.append(key)
-            processed_rows.append((row_values, flattened))
-
-        header = base_header + flattened_keys
-        with gen_path.open("w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(header)
-            for row_values, flattened in processed_rows:
-                appended = [flattened.get(key, "") for key in flattened_keys]
-                w.writerow(row_values + appended)
-
-        print(f"Wrote {gen_path} ({gen_path.stat().st_size} bytes)")
-
-        # ---------- Big Five ----------
-        res = await s.execute(select(Big5Score))
-        rows = res.scalars().all()
-        print("Big5Score rows:", len(rows))
-        big5_path = export_dir / "big5_scores.csv"
-        with big5_path.open("w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(["participant_id","O","C","E","A","N","created_at"])
-            for r in rows:
-                w.writerow([r.participant_id, r.O, r.C, r.E, r.A, r.N, r.created_at])
-        print(f"Wrote {big5_path} ({big5_path.stat().st_size} bytes)")
-
-        # ---------- Ratings ----------
-        res = await s.execute(select(Rating))
-        rows = res.scalars().all()
-        print("Rating rows:", len(rows))
-        ratings_path = export_dir / "ratings.csv"
-        with ratings_path.open("w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(["participant_id","task_id","condition","response_id","usefulness","novelty","shown_slot","created_at"])
-            for r in rows:
-                w.writerow([r.participant_id, r.task_id, r.condition, r.response_id, r.usefulness, r.novelty, r.shown_slot, r.created_at])
-        print(f"Wrote {ratings_path} ({ratings_path.stat().st_size} bytes)")
+    if args.rebuild_columns:
+        async with async_session() as s:
+            print("Registered columns:", len(await rebuild_registry(s)))
+
+    pool = ProcessPoolExecutor(args.workers) if args.workers > 0 else None
+    try:
+        run = _Export(args.format, pool, depth=2 * max(args.workers, 1))
+        ext = FORMATS[args.format][0]
+        # one session (and so one connection) per table, all three in parallel
+        await asyncio.gather(
+            _export_generations(async_session, run, export_dir / f"generations.{ext}", args.columns, args.append),
+            _export_table(async_session, run, export_dir / f"big5_scores.{ext}", Big5Score, BIG5_DTYPES, args.append),
+            _export_table(async_session, run, export_dir / f"ratings.{ext}", Rating, RATING_DTYPES, args.append),
+        )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        await engine.dispose()
 
 if __name__ == "__main__":
     asyncio.run(main())
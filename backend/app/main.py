@@ -1,9 +1,41 @@
 # app/main.py
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import scoring, generate
+from app.routes import admin, export, personas, scoring, generate
+from app.config import settings
+from app.db import init_db
+from app.services.llm import get_generation_writer, get_score_writer
+from app.services.prompts import get_registry
+from app.services.warmup import get_warmup
 
-app = FastAPI(title="Creativity Study Backend", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.DB_MIGRATE:
+        # tables added since the database was created (export registry, watermarks, ...)
+        await init_db()
+    # load + compile every prompt file before the first request
+    prompts = get_registry()
+    watcher = asyncio.create_task(prompts.watch(settings.PROMPT_RELOAD_S)) if settings.PROMPT_RELOAD_S > 0 else None
+    if settings.PERSIST_GENERATIONS:
+        get_generation_writer().start()
+    if settings.PERSIST_SCORES:
+        get_score_writer().start()
+    if settings.WARMUP_ENABLED:
+        get_warmup().start()
+    yield
+    if settings.WARMUP_ENABLED:
+        await get_warmup().stop()
+    if settings.PERSIST_GENERATIONS:
+        # after warm-up stops, so its last generations are flushed too
+        await get_generation_writer().stop()
+    if settings.PERSIST_SCORES:
+        await get_score_writer().stop()
+    if watcher:
+        watcher.cancel()
+
+app = FastAPI(title="Creativity Study Backend", version="1.0.0", lifespan=lifespan)
 
 allowed_origins = [
     "http://localhost:3000",
@@ -27,3 +59,6 @@ def health():
 
 app.include_router(scoring.router, prefix="/api", tags=["scoring"])
 app.include_router(generate.router, prefix="/api", tags=["generate"])
+app.include_router(personas.router, prefix="/api", tags=["personas"])
+app.include_router(export.router, prefix="/api", tags=["export"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
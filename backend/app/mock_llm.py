@@ -0,0 +1,157 @@
+# app/mock_llm.py
+import argparse, asyncio, hashlib, json, random, time, uuid
+from dataclasses import dataclass, fields
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORDS = (
+    "idea plan novel bold careful team risk market design test user story build signal "
+    "simple clear value rapid small growth learn craft vision focus trust open mix"
+).split()
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 800.0        # median total latency of one completion
+    latency_sigma: float = 0.5       # lognormal shape; 0 makes every call take latency_ms
+    ttft_ms: float = 200.0           # streaming: part of the latency spent before the first token
+    min_tokens: int = 50             # completion length range, capped by the request's max_tokens
+    max_tokens: int = 400
+    chunk_tokens: int = 8            # tokens per streamed chunk
+    rate_429: float = 0.0            # share of requests answered 429
+    rate_timeout: float = 0.0        # share of requests that hang for hang_s
+    hang_s: float = 600.0
+    retry_after_s: float = 1.0
+    seed: int = 0
+
+class _Stats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.completed = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.in_flight = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+def _completion_text(body: dict, cfg: MockConfig) -> tuple[str, int]:
+    """Deterministic JSON answer for the request's messages: same prompt, same text."""
+    digest = hashlib.sha256(json.dumps([cfg.seed, body.get("messages")], sort_keys=True).encode()).digest()
+    rng = random.Random(digest)
+    cap = body.get("max_tokens") or cfg.max_tokens
+    n = max(1, min(cap, rng.randint(cfg.min_tokens, cfg.max_tokens)))
+    words = " ".join(rng.choice(_WORDS) for _ in range(n))
+    return json.dumps({"narrative": words}), n
+
+def _prompt_tokens(body: dict) -> int:
+    # ~4 characters per token, like ratelimit.estimate_tokens
+    return sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+
+def create_app(cfg: MockConfig | None = None) -> FastAPI:
+    """
+    OpenAI-compatible POST /v1/chat/completions (plain and streamed) with
+    simulated latency, token counts, 429s and hung requests, plus GET /stats.
+    Text depends only on the prompt and seed; latency and faults come from
+    one seeded RNG, so a run's sequence is reproducible.
+    """
+    cfg = cfg or MockConfig()
+    rng = random.Random(cfg.seed)
+    stats = _Stats()
+    app = FastAPI(title="mock-llm")
+
+    def latency_s() -> float:
+        median = cfg.latency_ms / 1000
+        return median * rng.lognormvariate(0, cfg.latency_sigma) if cfg.latency_sigma > 0 else median
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.as_dict()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats.requests += 1
+        roll = rng.random()
+        if roll < cfg.rate_429:
+            stats.rate_limited += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": f"{cfg.retry_after_s:g}"},
+            )
+        if roll < cfg.rate_429 + cfg.rate_timeout:
+            stats.timeouts += 1
+            await asyncio.sleep(cfg.hang_s)
+            return JSONResponse({"error": {"message": "Timed out (mock)", "type": "timeout"}}, status_code=504)
+
+        text, n_out = _completion_text(body, cfg)
+        usage = {"prompt_tokens": _prompt_tokens(body), "completion_tokens": n_out,
+                 "total_tokens": _prompt_tokens(body) + n_out}
+        model = body.get("model", "mock")
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": model}
+        total = latency_s()
+
+        if not body.get("stream"):
+            stats.in_flight += 1
+            try:
+                await asyncio.sleep(total)
+            finally:
+                stats.in_flight -= 1
+            stats.completed += 1
+            return base | {
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        step = max(1, cfg.chunk_tokens) * 4  # characters per chunk at ~4 per token
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        ttft = min(total, cfg.ttft_ms / 1000)
+        gap = (total - ttft) / max(1, len(pieces))
+
+        def event(choices, **extra) -> str:
+            return "data: " + json.dumps(base | {"object": "chat.completion.chunk", "choices": choices} | extra) + "\n\n"
+
+        async def stream():
+            stats.in_flight += 1
+            try:
+                await asyncio.sleep(ttft)
+                for i, piece in enumerate(pieces):
+                    if i:
+                        await asyncio.sleep(gap)
+                    yield event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                if include_usage:
+                    yield event([], usage=usage)
+                yield "data: [DONE]\n\n"
+                stats.completed += 1
+            finally:
+                stats.in_flight -= 1
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(
+        description="Local OpenAI-compatible mock for load tests; point the backend at it with "
+                    "LLM_BASE_URL=http://HOST:PORT/v1",
+    )
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8001)
+    defaults = MockConfig()
+    for f in fields(MockConfig):
+        p.add_argument(f"--{f.name.replace('_', '-')}", type=type(getattr(defaults, f.name)),
+                       default=getattr(defaults, f.name))
+    return p.parse_args(argv)
+
+def main(argv=None):
+    import uvicorn
+    args = _parse_args(argv)
+    cfg = MockConfig(**{f.name: getattr(args, f.name) for f in fields(MockConfig)})
+    uvicorn.run(create_app(cfg), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
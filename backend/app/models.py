@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Integer, String, Text, ForeignKey, DateTime, Index
 from sqlalchemy.sql import func
 from .db import Base
 from datetime import datetime
@@ -18,8 +18,12 @@ class Big5Score(Base):
     E: Mapped[int] = mapped_column(Integer)
     A: Mapped[int] = mapped_column(Integer)
     N: Mapped[int] = mapped_column(Integer)
+    answers: Mapped[str | None] = mapped_column(Text, nullable=True)  # raw IPIP-50 answers, JSON list
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
+    # latest score per participant (persona lookup)
+    __table_args__ = (Index("ix_big5_scores_participant_created", "participant_id", "created_at"),)
+
 class Task(Base):
     __tablename__ = "tasks"
     task_id: Mapped[str] = mapped_column(String(64), primary_key=True)
@@ -37,6 +41,9 @@ class CachedResponse(Base):
     system_prompt: Mapped[str] = mapped_column(Text)
     user_prompt:   Mapped[str] = mapped_column(Text)
     prompt_text: Mapped[str] = mapped_column(Text)      
+    # with PROMPT_BLOBS the three prompt columns are "" and the text lives in prompt_blobs
+    system_prompt_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    user_prompt_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
     text: Mapped[str] = mapped_column(Text)            
     model: Mapped[str] = mapped_column(String(64))
     tokens_in: Mapped[int] = mapped_column(Integer)
@@ -54,4 +61,24 @@ class Rating(Base):
     usefulness: Mapped[int] = mapped_column(Integer)
     novelty: Mapped[int] = mapped_column(Integer)
     shown_slot: Mapped[int] = mapped_column(Integer)
-    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class ExportColumn(Base):
+    # flattened JSON keys seen in cached_responses.text, registered at write time
+    __tablename__ = "export_columns"
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    position: Mapped[int] = mapped_column(Integer)
+    dtype: Mapped[str] = mapped_column(String(16))  # "int" | "float" | "bool" | "str" | "null"
+
+class ExportWatermark(Base):
+    # highest id already exported per table, for incremental/append exports
+    __tablename__ = "export_watermarks"
+    table_name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_id: Mapped[int] = mapped_column(Integer)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class PromptBlob(Base):
+    # content-addressed prompt text, shared by every cached_responses row that used it
+    __tablename__ = "prompt_blobs"
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 hex of text
+    text: Mapped[str] = mapped_column(Text)
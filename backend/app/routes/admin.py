@@ -1,18 +1,42 @@
 from fastapi import APIRouter
 from app.config import settings
-from app.services.llm import cache
+from app.db import pool_stats
+from app.services.llm import (
+    get_admission,
+    get_cache,
+    get_generation_writer,
+    get_inflight,
+    get_provider,
+    get_resilience,
+    get_score_writer,
+)
+from app.services.prompts import get_registry
+from app.services.warmup import get_warmup
 
 router = APIRouter()
 
 @router.get("/health")
 async def health():
-    return {"ok": True, "model": settings.LLM_MODEL}
+    return {"ok": True, "model": settings.LLM_MODEL, "provider": get_provider().name}
 
 @router.get("/version")
 async def version():
-    return {"promptVersion": settings.LOG_PROMPT_VERSION}
+    return {"promptVersion": settings.LOG_PROMPT_VERSION, "promptFilesVersion": get_registry().version}
 
 @router.post("/reset-cache")
 async def reset_cache():
-    await cache.clear()
+    await get_cache().clear()
     return {"cleared": True}
+
+@router.get("/stats")
+async def stats():
+    return {
+        "singleflight": get_inflight().stats(),
+        "cache": get_cache().stats(),
+        "llmAdmission": get_admission().stats(),
+        "llmResilience": get_resilience().stats(),
+        "warmup": get_warmup().stats(),
+        "generationWriter": get_generation_writer().stats(),
+        "scoreWriter": get_score_writer().stats(),
+        "dbPool": pool_stats(),
+    }
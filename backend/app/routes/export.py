@@ -1,126 +1,116 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from starlette.responses import StreamingResponse
-from io import StringIO
-import csv
-import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, Literal, Optional
 
-from app.db import get_session
+from app.db import get_sessionmaker
 from app.models import CachedResponse, Rating, Big5Score
+from app.services.exporting import (
+    BIG5_DTYPES,
+    GENERATION_DTYPES,
+    RATING_DTYPES,
+    generation_rows,
+    high_water_mark,
+    registry_columns,
+    scan_columns,
+    table_rows,
+)
+from app.services.formats import ARROW_FORMATS, FORMATS, arrow_available, encode
 
 router = APIRouter()
 
-def _flatten(value, parent_key="", sep="_"):
-    items = {}
-    if isinstance(value, dict):
-        for key, nested in value.items():
-            new_key = f"{parent_key}{sep}{key}" if parent_key else key
-            items.update(_flatten(nested, new_key, sep))
-    elif isinstance(value, list):
-        for idx, nested in enumerate(value):
-            new_key = f"{parent_key}{sep}{idx}" if parent_key else str(idx)
-            items.update(_flatten(nested, new_key, sep))
-    elif parent_key:
-        items[parent_key] = value
-    return items
-
-def _to_csv(rows, header):
-    def gen():
-        buf = StringIO()
-        w = csv.writer(buf)
-        w.writerow(header); yield buf.getvalue(); buf.seek(0); buf.truncate(0)
-        for row in rows:
-            w.writerow(row); yield buf.getvalue(); buf.seek(0); buf.truncate(0)
-    return gen()
-
-@router.get("/export/generations.csv")
-async def export_generations(session: AsyncSession = Depends(get_session)):
-    q = select(
-        CachedResponse.participant_id,
-        CachedResponse.task_id,
-        CachedResponse.condition,
-        CachedResponse.response_id,
-        CachedResponse.model,
-        CachedResponse.tokens_in,
-        CachedResponse.tokens_out,
-        CachedResponse.latency_ms,
-        CachedResponse.created_at,
-        CachedResponse.system_prompt,
-        CachedResponse.user_prompt,
-        CachedResponse.prompt_text,
-        CachedResponse.text,
-    ).order_by(CachedResponse.id)
-    rows = (await session.execute(q)).all()
-    base_header = [
-        "participant_id",
-        "task_id",
-        "condition",
-        "response_id",
-        "model",
-        "tokens_in",
-        "tokens_out",
-        "latency_ms",
-        "created_at",
-        "system_prompt",
-        "user_prompt",
-        "prompt_text",
-        "text",
-    ]
-    processed_rows = []
-    flattened_keys = []
-    seen_keys = set()
-    for row in rows:
-        row_values = list(row)
-        raw_text = row_values[-1]
-        flattened = {}
-        if raw_text:
-            try:
-                parsed = json.loads(raw_text)
-            except json.JSONDecodeError:
-                parsed = None
-            if isinstance(parsed, (dict, list)):
-                flattened = _flatten(parsed)
-        for key in flattened:
-            if key not in seen_keys:
-                seen_keys.add(key)
-                flattened_keys.append(key)
-        processed_rows.append((row_values, flattened))
-    header = base_header + flattened_keys
-    final_rows = []
-    for row_values, flattened in processed_rows:
-        appended = []
-        for key in flattened_keys:
-            value = flattened.get(key)
-            appended.append("" if value is None else value)
-        final_rows.append(row_values + appended)
-    return StreamingResponse(_to_csv(final_rows, header),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=generations.csv"}
-    )
+# response header carrying the last id included; pass it back as ?since_id=
+HIGH_WATER_MARK_HEADER = "X-Export-High-Water-Mark"
 
-@router.get("/export/ratings.csv")
-async def export_ratings(session: AsyncSession = Depends(get_session)):
-    q = select(
-        Rating.participant_id, Rating.task_id, Rating.condition, Rating.response_id,
-        Rating.usefulness, Rating.novelty, Rating.shown_slot, Rating.created_at
-    ).order_by(Rating.id)
-    rows = (await session.execute(q)).all()
-    header = ["participant_id","task_id","condition","response_id",
-              "usefulness","novelty","shown_slot","created_at"]
-    return StreamingResponse(_to_csv(rows, header),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=ratings.csv"}
-    )
+ExportFormat = Literal["csv", "parquet", "arrow", "ndjson.gz"]
 
-@router.get("/export/big5_scores.csv")
-async def export_big5(session: AsyncSession = Depends(get_session)):
-    q = select(
-        Big5Score.participant_id, Big5Score.O, Big5Score.C, Big5Score.E, Big5Score.A, Big5Score.N, Big5Score.created_at
-    ).order_by(Big5Score.id)
-    rows = (await session.execute(q)).all()
-    header = ["participant_id","O","C","E","A","N","created_at"]
-    return StreamingResponse(_to_csv(rows, header),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=big5_scores.csv"}
+def _check_format(fmt: str) -> None:
+    if fmt in ARROW_FORMATS and not arrow_available():
+        raise HTTPException(status_code=501, detail=f"{fmt} export requires pyarrow on the server")
+
+def _response(body: AsyncIterator, name: str, fmt: str, max_id: int) -> StreamingResponse:
+    ext, media_type = FORMATS[fmt]
+    return StreamingResponse(body,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={name}.{ext}",
+            HIGH_WATER_MARK_HEADER: str(max_id),
+        }
     )
+
+async def _high_water_mark(sessions: async_sessionmaker, model) -> int:
+    # resolved before the body starts so it can go out as a response header
+    async with sessions() as session:
+        return await high_water_mark(session, model)
+
+@router.get("/export/generations.{fmt}")
+async def export_generations(
+    fmt: ExportFormat,
+    columns: Literal["scan", "registry"] = "scan",
+    since_id: int = Query(0, ge=0),
+    since: Optional[datetime] = None,
+    sessions: async_sessionmaker = Depends(get_sessionmaker),
+):
+    """
+    fmt: csv, parquet or arrow (Arrow IPC stream, one record batch at a
+    time; both need pyarrow) or ndjson.gz. Columnar formats are typed, and
+    flattened JSON fields take the dtype recorded by the scan or registry.
+
+    columns=scan: a first pass over `text` alone discovers the flattened keys
+    (of the exported rows only, when since_id/since narrow them).
+    columns=registry: the header comes from export_columns (kept up to date at
+    write time), so rows stream out with no first pass and every incremental
+    export shares one header.
+    """
+    _check_format(fmt)
+    max_id = await _high_water_mark(sessions, CachedResponse)
+
+    async def body():
+        async with sessions() as session:
+            # pin the row set so the header and the rows agree
+            if columns == "registry":
+                flattened: Dict[str, str] = await registry_columns(session)
+            else:
+                flattened = await scan_columns(session, max_id, since_id, since)
+            rows = generation_rows(session, list(flattened), max_id, since_id, since)
+            async for chunk in encode(fmt, GENERATION_DTYPES | flattened, rows):
+                yield chunk
+
+    return _response(body(), "generations", fmt, max_id)
+
+@router.get("/export/ratings.{fmt}")
+async def export_ratings(
+    fmt: ExportFormat,
+    since_id: int = Query(0, ge=0),
+    since: Optional[datetime] = None,
+    sessions: async_sessionmaker = Depends(get_sessionmaker),
+):
+    _check_format(fmt)
+    max_id = await _high_water_mark(sessions, Rating)
+
+    async def body():
+        async with sessions() as session:
+            rows = table_rows(session, Rating, list(RATING_DTYPES), max_id, since_id, since)
+            async for chunk in encode(fmt, RATING_DTYPES, rows):
+                yield chunk
+
+    return _response(body(), "ratings", fmt, max_id)
+
+@router.get("/export/big5_scores.{fmt}")
+async def export_big5(
+    fmt: ExportFormat,
+    since_id: int = Query(0, ge=0),
+    since: Optional[datetime] = None,
+    sessions: async_sessionmaker = Depends(get_sessionmaker),
+):
+    _check_format(fmt)
+    max_id = await _high_water_mark(sessions, Big5Score)
+
+    async def body():
+        async with sessions() as session:
+            rows = table_rows(session, Big5Score, list(BIG5_DTYPES), max_id, since_id, since)
+            async for chunk in encode(fmt, BIG5_DTYPES, rows):
+                yield chunk
+
+    return _response(body(), "big5_scores", fmt, max_id)
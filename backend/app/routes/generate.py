@@ -1,24 +1,15 @@
 # app/routes/generate.py
 from fastapi import APIRouter, HTTPException
+from starlette.responses import StreamingResponse
 from app.schemas import TaskIn, TaskOut, OneText
-from app.services.llm import generate_four
-from pathlib import Path
+from app.config import settings
+from app.services.llm import generate_four, stream_four, task_inputs
+from app.services.personas import personas_from_traits
 import json
 
 router = APIRouter()
 
 # ----------------- helpers -----------------
-def _clamp(v: int, lo: int = 10, hi: int = 50) -> int:
-    return max(lo, min(hi, v))
-
-def _read_creative_profile():
-    p = Path(__file__).resolve().parents[1] / "prompts" / "creative_profile.json"
-    if p.exists():
-        data = json.loads(p.read_text(encoding="utf-8"))
-        return {"persona": data.get("persona", data), "guidance": data.get("guidance")}
-    # default fallback persona if file missing
-    return {"persona": {"O": 48, "C": 28, "E": 44, "A": 40, "N": 18}, "guidance": None}
-
 # prefer to show a single text field to raters
 _PREFERRED_FIELDS = ("narrative", "answer", "text", "idea", "output", "summary")
 
@@ -40,31 +31,44 @@ def _extract_text_from_json(s: str) -> str:
     # if it's a list or something else, compact it
     return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
+# map internal -> Qualtrics labels
+_NAME_MAP = {
+    "baseline": "baseline",
+    "mirror": "mirroring",
+    "comp": "complementing",
+    "creative": "creative",
+}
+
+def _personas_for(payload: TaskIn) -> list[dict]:
+    # Build Big Five dict from Qualtrics fields
+    mirror = {
+        "O": payload.trait_openness,
+        "C": payload.trait_conscientiousness,
+        "E": payload.trait_extraversion,
+        "A": payload.trait_agreeableness,
+        "N": payload.trait_neuroticism,
+    }
+    # same persona set the warm-up job builds after /score-big5
+    return personas_from_traits(mirror)
+
+def _to_one_text(r: dict) -> OneText:
+    # pick a single display string from each JSON response (prefer "narrative")
+    if "error" in r:
+        return OneText(condition=_NAME_MAP[r["condition"]], response="", status="failed")
+    return OneText(condition=_NAME_MAP[r["condition"]], response=_extract_text_from_json(r["text"]))
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 # ----------------- route -----------------
 @router.post("/generate-task", response_model=TaskOut)
 async def generate_task(payload: TaskIn) -> TaskOut:
     try:
-        # Build Big Five dict from Qualtrics fields
-        mirror = {
-            "O": payload.trait_openness,
-            "C": payload.trait_conscientiousness,
-            "E": payload.trait_extraversion,
-            "A": payload.trait_agreeableness,
-            "N": payload.trait_neuroticism,
-        }
-        comp = {k: _clamp(60 - v) for k, v in mirror.items()}
-        creative = _read_creative_profile()
-
-        personas = [
-            {"type": "baseline", "persona": {"O": 30, "C": 30, "E": 30, "A": 30, "N": 30}, "guidance": None},
-            {"type": "mirror",   "persona": mirror,   "guidance": None},
-            {"type": "comp",     "persona": comp,     "guidance": None},
-            {"type": "creative", "persona": creative["persona"], "guidance": creative.get("guidance")},
-        ]
-
-        # choose style family (A/B). Keep "A" unless you split by task blocks/arms.
-        style = "A"
-        prompt_text = payload.taskPrompt or payload.taskId
+        personas = _personas_for(payload)
+
+        # style family and prompt, shared with warm-up and the batch pipeline
+        style, prompt_text = task_inputs(payload.taskId, payload.taskPrompt)
+        partial = settings.PARTIAL_RESULTS if payload.allowPartial is None else payload.allowPartial
 
         # four independent generations (run concurrently inside generate_four)
         results = await generate_four(
@@ -73,27 +77,53 @@ async def generate_task(payload: TaskIn) -> TaskOut:
             payload.taskId,
             style,
             prompt_text,
+            partial=partial,
         )
 
-        # map internal -> Qualtrics labels
-        name_map = {
-            "baseline": "baseline",
-            "mirror": "mirroring",
-            "comp": "complementing",
-            "creative": "creative",
-        }
-
-        # pick a single display string from each JSON response (prefer "narrative")
-        out = [
-            OneText(condition=name_map[r["condition"]], response=_extract_text_from_json(r["text"]))
-            for r in results
-        ]
+        out = [_to_one_text(r) for r in results]
 
         # ensure fixed order for Qualtrics piping
         order = {"baseline": 0, "mirroring": 1, "complementing": 2, "creative": 3}
         out.sort(key=lambda x: order[x.condition])
 
-        return TaskOut(responses=out)
+        missing = [o.condition for o in out if o.status == "failed"]
+        return TaskOut(responses=out, missing=missing)
 
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Generation temporarily unavailable: {e}")
+
+@router.post("/generate-task/stream")
+async def generate_task_stream(payload: TaskIn, tokens: bool = False) -> StreamingResponse:
+    """
+    Server-Sent Events variant of /generate-task. Emits one `condition` event
+    (a OneText) per condition as soon as it is ready, in completion order;
+    with ?tokens=true also `token` events {"condition", "delta"} while text is
+    generated (a preview: a retried call starts its tokens over). Ends with
+    `done` {"missing": [...]}, or `error` if generation failed outright.
+    """
+    personas = _personas_for(payload)
+    style, prompt_text = task_inputs(payload.taskId, payload.taskPrompt)
+
+    async def events():
+        missing = []
+        try:
+            async for kind, item in stream_four(
+                personas, payload.participantId, payload.taskId, style, prompt_text, tokens=tokens,
+            ):
+                if kind == "token":
+                    yield _sse("token", {"condition": _NAME_MAP[item["condition"]], "delta": item["delta"]})
+                    continue
+                one = _to_one_text(item)
+                if one.status == "failed":
+                    missing.append(one.condition)
+                yield _sse("condition", one.model_dump())
+        except Exception as e:
+            yield _sse("error", {"detail": f"Generation temporarily unavailable: {e}"})
+            return
+        yield _sse("done", {"missing": missing})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,10 +1,23 @@
 # app/routes/scoring.py
 from fastapi import APIRouter, HTTPException
-from app.schemas import ScoreRequest, Big5Out
-from app.services.big5 import score_ipip50  # your existing scorer
+from app.schemas import ScoreRequest, Big5Out, BatchScoreRequest, BatchBig5Out
+from app.services.big5 import score_ipip50, score_ipip50_batch, sums_to_dicts  # your existing scorer
+from app.config import settings
+from app.services.llm import get_score_writer
+from app.services.persistence import score_row
+from app.services.warmup import get_warmup
 
 router = APIRouter()
 
+def _traits(sums: dict) -> dict:
+    return {
+        "trait_openness":          sums["O"],
+        "trait_conscientiousness": sums["C"],
+        "trait_extraversion":      sums["E"],
+        "trait_agreeableness":     sums["A"],
+        "trait_neuroticism":       sums["N"],
+    }
+
 @router.post("/score-big5", response_model=Big5Out)
 async def score_big5(payload: ScoreRequest):
     try:
@@ -12,11 +25,25 @@ async def score_big5(payload: ScoreRequest):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    traits = {
-        "trait_openness":          sums["O"],
-        "trait_conscientiousness": sums["C"],
-        "trait_extraversion":      sums["E"],
-        "trait_agreeableness":     sums["A"],
-        "trait_neuroticism":       sums["N"],
-    }
+    traits = _traits(sums)
+    if settings.PERSIST_SCORES:
+        # queued for the batched writer; never waits on the database
+        get_score_writer().put(score_row(payload.participantId, payload.answers, sums))
+    if settings.WARMUP_ENABLED:
+        # fire-and-forget; dropped if the warm-up queue is full
+        get_warmup().submit(payload.participantId, sums)
     return {"traits": traits}
+
+@router.post("/score-big5/batch", response_model=BatchBig5Out)
+async def score_big5_batch(payload: BatchScoreRequest):
+    """Re-score many participants in one vectorized pass; no warm-up is triggered."""
+    if not payload.items:
+        return {"results": []}
+    try:
+        sums = score_ipip50_batch([item.answers for item in payload.items])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": [
+        {"participantId": item.participantId, "traits": _traits(row)}
+        for item, row in zip(payload.items, sums_to_dicts(sums))
+    ]}
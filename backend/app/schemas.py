@@ -1,5 +1,5 @@
 # app/schemas.py
-from typing import List, Dict, Union, Literal
+from typing import List, Dict, Optional, Union, Literal
 from pydantic import BaseModel, field_validator
 import json
 
@@ -32,6 +32,29 @@ class Big5Out(BaseModel):
     # Qualtrics-friendly wrapper (map traits.trait_*)
     traits: Dict[str, int]  # keys: trait_openness, trait_conscientiousness, trait_extraversion, trait_agreeableness, trait_neuroticism
 
+class BatchScoreRequest(BaseModel):
+    items: List[ScoreRequest]
+
+class ParticipantBig5(Big5Out):
+    participantId: str
+
+class BatchBig5Out(BaseModel):
+    results: List[ParticipantBig5]  # same order as the request items
+
+# ---------- Personas ----------
+class PersonaRequest(BaseModel):
+    participantId: str
+
+class PersonaPayload(BaseModel):
+    type: Literal["baseline", "mirror", "comp", "creative"]
+    persona: Dict[str, int]  # O/C/E/A/N
+    guidance: Optional[str] = None
+    version: str
+
+class PersonaResponse(BaseModel):
+    participantId: str
+    personas: List[PersonaPayload]  # CONDITION_ORDER
+
 # ---------- Generation (Qualtrics-friendly) ----------
 Condition = Literal["baseline", "mirroring", "complementing", "creative"]
 
@@ -45,10 +68,14 @@ class TaskIn(BaseModel):
     trait_agreeableness: int
     trait_neuroticism: int
     taskPrompt: str | None = None  # optional
+    allowPartial: bool | None = None  # overrides PARTIAL_RESULTS for this call
 
 class OneText(BaseModel):
     condition: Condition
     response: str
+    status: Literal["ok", "failed"] = "ok"
 
 class TaskOut(BaseModel):
     responses: List[OneText]  # fixed order for easy Qualtrics mapping
+    # partial mode: conditions to retry; a retry only regenerates these (the rest are cached)
+    missing: List[Condition] = []
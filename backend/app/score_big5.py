@@ -0,0 +1,112 @@
+# app/score_big5.py
+import argparse, asyncio, csv, json, sys
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .config import settings
+from .db import build_engine, init_db
+from .models import Big5Score
+from .services.big5 import N_ITEMS, TRAITS, score_ipip50_batch, sums_to_dicts
+from .services.exporting import stream_rows
+from .services.llm import get_cache, write_scores
+from .services.persistence import score_row
+
+def _read_answers(path: Path):
+    """
+    participant ids and an N x 50 answer matrix from either
+      .jsonl: one {"participantId": ..., "answers": [...] or "[...]"} per line
+      .csv:   participant_id followed by 50 answer columns (header row optional)
+    """
+    ids, answers = [], []
+    with path.open(newline="", encoding="utf-8") as f:
+        if path.suffix == ".jsonl":
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                a = rec["answers"]
+                ids.append(rec["participantId"])
+                answers.append(json.loads(a) if isinstance(a, str) else a)
+        else:
+            for row in csv.reader(f):
+                if not row or not row[1].strip().lstrip("-").isdigit():
+                    continue  # blank line or header
+                ids.append(row[0])
+                answers.append([int(x) for x in row[1:1 + N_ITEMS]])
+    return ids, answers
+
+async def _load_stored_answers(sessions: async_sessionmaker):
+    """Each participant's most recent stored raw answers (scores written before answers were kept are skipped)."""
+    latest = {}
+    q = (
+        select(Big5Score.participant_id, Big5Score.answers)
+        .where(Big5Score.answers.is_not(None))
+        .order_by(Big5Score.created_at, Big5Score.id)
+    )
+    async with sessions() as session:
+        async for pid, answers in stream_rows(session, q):
+            latest[pid] = answers  # later rows overwrite earlier ones
+    return list(latest), [json.loads(a) for a in latest.values()]
+
+async def _save_scores(sessions: async_sessionmaker, ids, answers, sums) -> None:
+    # the /score-big5 write path: a new latest score per participant, and their cached personas dropped
+    rows = [score_row(pid, a, s) for pid, a, s in zip(ids, answers, sums_to_dicts(sums))]
+    await write_scores(rows, sessions)
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Re-score IPIP-50 answers in one vectorized pass")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("answers", nargs="?", type=Path, help=".csv (participant_id + 50 answers) or .jsonl file")
+    src.add_argument("--from-db", action="store_true",
+                     help="re-score every participant from the raw answers stored in big5_scores")
+    p.add_argument("--save", action="store_true",
+                   help="with --from-db: store the new sums as each participant's latest score")
+    p.add_argument("--out", type=Path, default=None, help="output CSV (default: stdout)")
+    args = p.parse_args(argv)
+    if args.save and not args.from_db:
+        p.error("--save requires --from-db")
+    return args
+
+async def _score(args, sessions: async_sessionmaker | None):
+    """Load, score and optionally save in one event loop, on one engine disposed at the end."""
+    if not args.from_db:
+        ids, answers = _read_answers(args.answers)
+        return ids, score_ipip50_batch(answers) if ids else []
+    engine = None
+    if sessions is None:
+        engine = build_engine(settings.DATABASE_URL)
+        if settings.DB_MIGRATE:
+            await init_db(engine)  # same schema upgrade as the server's startup
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        ids, answers = await _load_stored_answers(sessions)
+        sums = score_ipip50_batch(answers) if ids else []
+        if args.save and ids:
+            await _save_scores(sessions, ids, answers, sums)
+    finally:
+        if engine is not None:
+            await engine.dispose()
+    return ids, sums
+
+def main(argv=None, sessions: async_sessionmaker | None = None):
+    args = _parse_args(argv)
+    ids, sums = asyncio.run(_score(args, sessions))
+
+    out = args.out.open("w", newline="", encoding="utf-8") if args.out else sys.stdout
+    try:
+        w = csv.writer(out)
+        w.writerow(["participant_id", *TRAITS])
+        for pid, row in zip(ids, sums):
+            w.writerow([pid, *map(int, row)])
+    finally:
+        if args.out:
+            out.close()
+    print(f"Scored {len(ids)} participants" + (" (saved)" if args.save else ""), file=sys.stderr)
+    if args.save and ids and get_cache().stats()["backend"] == "memory":
+        print("Persona cache is in-process: set REDIS_URL (or restart the server) so it drops "
+              "the old personas", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
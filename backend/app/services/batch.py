@@ -0,0 +1,255 @@
+# app/services/batch.py
+from __future__ import annotations
+
+import asyncio
+import json
+import shutil
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.services.cache import Cache
+from app.services.llm import alias_to, chat_request, content_key, scrub_pii
+from app.services.persistence import generation_row, insert_generations
+from app.services.providers import mock_text
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# terminal Batch API statuses; anything else (validating, in_progress, finalizing) is still running
+DONE_STATUSES = ("completed", "failed", "expired", "cancelled")
+# cached_responses rows per insert when loading results
+LOAD_CHUNK_ROWS = 1000
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    """
+    One generation the batch fills. participant_id None marks a shared arm
+    (baseline/creative), which the live path only finds via content keys.
+    """
+    participant_id: Optional[str]
+    task_id: str
+    condition: str
+    system_prompt: str
+    user_prompt: str
+
+    @property
+    def key(self) -> str:
+        return content_key(self.system_prompt, self.user_prompt)
+
+
+def request_lines(items: Iterable[BatchItem]) -> List[dict]:
+    """One Batch API request per distinct content key; the key is its custom_id, so repeats collapse."""
+    lines: Dict[str, dict] = {}
+    for item in items:
+        if item.key not in lines:
+            lines[item.key] = {
+                "custom_id": item.key,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": chat_request(item.system_prompt, item.user_prompt),
+            }
+    return list(lines.values())
+
+
+def write_jsonl(path: Path, records: Iterable[dict]) -> int:
+    n = 0
+    with path.open("w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def read_jsonl(text: str) -> List[dict]:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def parse_output(text: str) -> Tuple[Dict[str, dict], int]:
+    """custom_id -> {"text", "model", "usage"} for each successful line of a batch output file, plus the failure count."""
+    results: Dict[str, dict] = {}
+    failed = 0
+    for line in read_jsonl(text):
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            failed += 1
+            continue
+        body = response["body"]
+        results[line["custom_id"]] = {
+            "text": (body["choices"][0]["message"]["content"] or "").strip(),
+            "model": body.get("model", settings.LLM_MODEL),
+            "usage": body.get("usage") or {},
+        }
+    return results, failed
+
+
+class BatchClient:
+    """
+    What the pipeline needs from a batch provider. status() returns
+    {"status", "output_file_id"} with OpenAI Batch API status names.
+    """
+    name = "base"
+
+    async def submit(self, input_path: Path) -> str:
+        raise NotImplementedError
+
+    async def status(self, batch_id: str) -> dict:
+        raise NotImplementedError
+
+    async def download(self, file_id: str) -> str:
+        raise NotImplementedError
+
+
+class OpenAIBatchClient(BatchClient):
+    """The OpenAI Batch API through an AsyncOpenAI client."""
+    name = "openai"
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+    async def submit(self, input_path: Path) -> str:
+        with input_path.open("rb") as f:
+            uploaded = await self.client.files.create(file=f, purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window="24h",
+        )
+        return batch.id
+
+    async def status(self, batch_id: str) -> dict:
+        batch = await self.client.batches.retrieve(batch_id)
+        return {"status": batch.status, "output_file_id": batch.output_file_id}
+
+    async def download(self, file_id: str) -> str:
+        return (await self.client.files.content(file_id)).text
+
+
+def _mock_text(body: dict) -> str:
+    # same text as the live path's MockProvider
+    return mock_text(body["messages"][-1]["content"])
+
+
+class LocalBatchClient(BatchClient):
+    """
+    File-based stand-in for tests and dry runs: submit() copies the input
+    into `root`, and the batch completes on the polls_until_done-th status()
+    call by writing an output file answered by `respond(request_body)`.
+    A finished batch stays completed across runs since its output is on disk.
+    """
+    name = "local"
+
+    def __init__(self, root: Path, respond: Callable[[dict], str] = _mock_text, polls_until_done: int = 1) -> None:
+        self.root = root
+        self.respond = respond
+        self.polls_until_done = polls_until_done
+        self._polls: Dict[str, int] = {}
+
+    def _path(self, file_id: str) -> Path:
+        return self.root / f"{file_id}.jsonl"
+
+    async def submit(self, input_path: Path) -> str:
+        self.root.mkdir(parents=True, exist_ok=True)
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        shutil.copyfile(input_path, self._path(f"{batch_id}.input"))
+        return batch_id
+
+    async def status(self, batch_id: str) -> dict:
+        output_id = f"{batch_id}.output"
+        if not self._path(output_id).exists():
+            self._polls[batch_id] = self._polls.get(batch_id, 0) + 1
+            if self._polls[batch_id] < self.polls_until_done:
+                return {"status": "in_progress", "output_file_id": None}
+            requests = read_jsonl(self._path(f"{batch_id}.input").read_text(encoding="utf-8"))
+            write_jsonl(self._path(output_id), (self._answer(i, r) for i, r in enumerate(requests)))
+        return {"status": "completed", "output_file_id": output_id}
+
+    def _answer(self, i: int, request: dict) -> dict:
+        body = request["body"]
+        return {
+            "id": f"batch_req_{i}",
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "object": "chat.completion",
+                    "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": self.respond(body)},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0},
+                },
+            },
+            "error": None,
+        }
+
+    async def download(self, file_id: str) -> str:
+        return self._path(file_id).read_text(encoding="utf-8")
+
+
+async def wait(client: BatchClient, batch_id: str, poll_s: float) -> dict:
+    """Poll until the batch reaches a terminal status."""
+    while True:
+        state = await client.status(batch_id)
+        if state["status"] in DONE_STATUSES:
+            return state
+        await asyncio.sleep(poll_s)
+
+
+def _payload(item: BatchItem, result: dict) -> dict:
+    # the same shape llm._generate caches for a live generation
+    text = scrub_pii(result["text"]) if settings.STRIP_PII else result["text"]
+    return {
+        "condition": item.condition,
+        "responseId": str(uuid.uuid4()),
+        "text": text,
+        "model": result["model"],
+        "tokensIn": result["usage"].get("prompt_tokens", 0),
+        "tokensOut": result["usage"].get("completion_tokens", 0),
+        "generationTimeMs": 0,
+        "systemPrompt": item.system_prompt,
+        "userPrompt": item.user_prompt,
+    }
+
+
+async def load_results(items: List[BatchItem], results: Dict[str, dict], cache: Cache) -> Dict[str, int]:
+    """
+    Cache each result under its content key, alias every participant's
+    per-participant key to it under a responseId of their own and store
+    their cached_responses rows, exactly as a live generation would have been.
+    Keys already in the cache win: a participant generated live since the
+    batch was submitted keeps what they were shown, and a content key
+    generated meanwhile keeps its text for everyone aliased to it. Entries
+    are written with BATCH_CACHE_TTL_S, since results may be loaded long
+    before they are used.
+    """
+    pkeys = {i: Cache.make_key(i.participant_id, i.task_id, i.condition) for i in items if i.participant_id is not None}
+    content_keys = {i.key for i in items if i.key in results}
+    existing = {k: v for k, v in (await cache.get_many([*content_keys, *pkeys.values()])).items() if v}
+
+    payloads: Dict[str, dict] = {}
+    for item in items:
+        if item.key in results and item.key not in payloads:
+            cached = existing.get(item.key)
+            payloads[item.key] = json.loads(cached) if cached else _payload(item, results[item.key])
+
+    aliases: Dict[str, str] = {}
+    rows = []
+    skipped = 0
+    for i in items:
+        if i.participant_id is None or i.key not in payloads:
+            continue
+        if pkeys[i] in existing:
+            skipped += 1
+            continue
+        own = payloads[i.key] | {"condition": i.condition, "responseId": str(uuid.uuid4())}
+        aliases[pkeys[i]] = alias_to(i.key, own["responseId"])
+        rows.append(generation_row(i.participant_id, i.task_id, own))
+    fresh = {k: json.dumps(p) for k, p in payloads.items() if k not in existing}
+    await cache.set_many(fresh | aliases, ttl_s=settings.BATCH_CACHE_TTL_S)
+    for start in range(0, len(rows), LOAD_CHUNK_ROWS):
+        await insert_generations(rows[start:start + LOAD_CHUNK_ROWS])
+    return {
+        "generations": len(fresh),
+        "participantRows": len(rows),
+        "skipped": skipped,
+        "missing": sum(1 for i in items if i.key not in payloads),
+    }
@@ -1,6 +1,8 @@
 import json
 from pathlib import Path
 
+import numpy as np
+
 # Local, immutable copy of IPIP-50 keyed map with +/− items and trait mapping
 _IPIP_FILE = Path(__file__).resolve().parents[1] / "prompts" / "ipip50_keyed.json"
 
@@ -15,18 +17,47 @@ with _IPIP_FILE.open("r", encoding="utf-8") as f:
 # }
 
 TRAITS = ["O","C","E","A","N"]
+N_ITEMS = len(IPIP_KEY["items"])
+
+# Scoring key compiled once at import: per item, its trait's position in TRAITS
+# and whether it is reverse keyed (−: 1->5..5->1)
+TRAIT_INDEX = np.array([TRAITS.index(it["trait"]) for it in IPIP_KEY["items"]], dtype=np.intp)
+REVERSE_MASK = np.array([it["key"] != "+" for it in IPIP_KEY["items"]], dtype=bool)
+# (items x traits) 0/1 matrix, so trait sums are a single matmul
+_TRAIT_ONEHOT = np.zeros((N_ITEMS, len(TRAITS)), dtype=np.int64)
+_TRAIT_ONEHOT[np.arange(N_ITEMS), TRAIT_INDEX] = 1
+# the same key as plain tuples for the one-participant path
+_ITEM_TRAITS = tuple(TRAITS[i] for i in TRAIT_INDEX)
+_ITEM_REVERSED = tuple(bool(r) for r in REVERSE_MASK)
 
 def score_ipip50(answers: list[int]) -> dict:
     if len(answers) != 50:
         raise ValueError("answers must be length 50")
     sums = {t: 0 for t in TRAITS}
-    for i, ans in enumerate(answers, start=1):
-        item = IPIP_KEY["items"][i-1]
-        trait = item["trait"]
-        key = item["key"]
+    for trait, reverse, ans in zip(_ITEM_TRAITS, _ITEM_REVERSED, answers):
         if not (1 <= ans <= 5):
             raise ValueError("answers must be integers 1–5")
-        mapped = ans if key == "+" else (6 - ans)  # +:1->1..5->5 ; −:1->5..5->1
-        sums[trait] += mapped
+        sums[trait] += 6 - ans if reverse else ans  # +:1->1..5->5 ; −:1->5..5->1
     # each trait has 10 items; sums already 10–50 integers by construction
     return sums
+
+def score_ipip50_batch(answers) -> np.ndarray:
+    """
+    Score an N x 50 matrix of answers in one pass. Returns an N x 5 int
+    array of trait sums, columns in TRAITS order.
+    """
+    a = np.asarray(answers)
+    if a.ndim != 2 or a.shape[1] != N_ITEMS:
+        raise ValueError(f"answers must be an N x {N_ITEMS} matrix")
+    if not np.issubdtype(a.dtype, np.integer):
+        raise ValueError("answers must be integers 1–5")
+    bad = (a < 1) | (a > 5)
+    if bad.any():
+        row = int(np.argmax(bad.any(axis=1)))
+        raise ValueError(f"answers must be integers 1–5 (row {row})")
+    mapped = np.where(REVERSE_MASK, 6 - a, a)
+    return mapped @ _TRAIT_ONEHOT
+
+def sums_to_dicts(sums: np.ndarray) -> list[dict]:
+    """Rows of score_ipip50_batch as score_ipip50-style {trait: sum} dicts."""
+    return [dict(zip(TRAITS, map(int, row))) for row in sums]
@@ -1,8 +1,13 @@
 # app/services/cache.py
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import time
-from typing import Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
 # Try Redis (async); fall back to in-memory cache if not available or URL is missing
 try:
@@ -13,51 +18,223 @@ except Exception:  # pragma: no cover
 
 class InMemoryCache:
     """
-    Simple in-process cache with TTL.
-    Stores key -> (expires_at_epoch_seconds | None, value_str).
+    Bounded in-process cache with TTL and LRU eviction.
+    Stores key -> (expires_at_epoch_seconds | None, value_str) in recency order.
+    Once max_entries or max_bytes (approximated as len(key) + len(value)) is
+    exceeded, least-recently-used keys are evicted. Expired keys are dropped
+    lazily on get and by a periodic sweep task on the running event loop.
     """
-    def __init__(self) -> None:
-        self._data: dict[str, tuple[Optional[float], str]] = {}
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        sweep_interval_s: float = 60.0,
+    ) -> None:
+        self._data: OrderedDict[str, tuple[Optional[float], str]] = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval_s = sweep_interval_s
+        self._bytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value)
+
+    def _remove(self, key: str) -> bool:
+        item = self._data.pop(key, None)
+        if item is None:
+            return False
+        self._bytes -= self._size(key, item[1])
+        return True
 
     async def get(self, key: str) -> Optional[str]:
         item = self._data.get(key)
         if not item:
+            self.misses += 1
             return None
         expires_at, value = item
         if expires_at is not None and time.time() >= expires_at:
             # expired: remove and miss
-            self._data.pop(key, None)
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
             return None
+        self._data.move_to_end(key)
+        self.hits += 1
         return value
 
     async def setex(self, key: str, ttl: int, value: str) -> None:
+        self._ensure_sweeper()
         expires_at = (time.time() + ttl) if ttl and ttl > 0 else None
+        self._remove(key)
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return  # would flush everything else and still not fit
         self._data[key] = (expires_at, value)
+        self._bytes += size
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def sweep(self) -> int:
+        """Drop every expired key; returns how many were removed."""
+        now = time.time()
+        expired = [k for k, (exp, _) in self._data.items() if exp is not None and now >= exp]
+        for k in expired:
+            self._remove(k)
+        self.expirations += len(expired)
+        return len(expired)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval_s)
+            self.sweep()
+
+    def _ensure_sweeper(self) -> None:
+        if self.sweep_interval_s <= 0:
+            return
+        if self._sweeper is not None and not self._sweeper.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sweeper = loop.create_task(self._sweep_loop())
 
     def clear(self) -> None:
         self._data.clear()
+        self._bytes = 0
 
     def delete(self, key: str) -> None:
-        self._data.pop(key, None)
+        self._remove(key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "maxEntries": self.max_entries,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
 
 
 class Cache:
     """
     Unified cache wrapper used by services.
     - If REDIS_URL is provided and redis.asyncio is installed, uses Redis.
-    - Otherwise uses an in-memory TTL cache (per-process, non-shared).
+      With l1_ttl_s > 0 it runs tiered: a small per-worker InMemoryCache (L1)
+      answers hot keys before Redis (L2). delete/clear publish on a pub/sub
+      channel so every worker drops the key(s) from its L1.
+    - Otherwise uses a bounded in-memory LRU/TTL cache (per-process, non-shared).
     """
-    def __init__(self, url: Optional[str], ttl_s: int) -> None:
+    INVALIDATE_CHANNEL = "cache:invalidate"
+
+    def __init__(
+        self,
+        url: Optional[str],
+        ttl_s: int,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        sweep_interval_s: float = 60.0,
+        l1_max_entries: int = 1_000,
+        l1_ttl_s: int = 0,
+    ) -> None:
         self.ttl = ttl_s
         self._is_redis = bool(url and redis is not None)
+        self.l1: Optional[InMemoryCache] = None
+        self.l1_ttl = l1_ttl_s
+        self._listener: Optional[asyncio.Task] = None
         if self._is_redis:
             # decode_responses=True -> str in/out
             self.client = redis.from_url(url, encoding="utf-8", decode_responses=True)  # type: ignore
+            if l1_ttl_s > 0:
+                self.l1 = InMemoryCache(l1_max_entries, max_bytes, sweep_interval_s)
         else:
-            self.client = InMemoryCache()
+            self.client = InMemoryCache(max_entries, max_bytes, sweep_interval_s)
+
+    # ---- L1 invalidation (tiered mode only) ----
+    def _ensure_listener(self) -> None:
+        if self.l1 is None:
+            return
+        if self._listener is not None and not self._listener.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._listener = loop.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.client.pubsub()  # type: ignore[attr-defined]
+            try:
+                await pubsub.subscribe(self.INVALIDATE_CHANNEL)
+                # anything published while we were not subscribed is lost
+                self.l1.clear()  # type: ignore[union-attr]
+                async for msg in pubsub.listen():
+                    if msg.get("type") != "message":
+                        continue
+                    if msg["data"] == "*":
+                        self.l1.clear()  # type: ignore[union-attr]
+                    else:
+                        self.l1.delete(msg["data"])  # type: ignore[union-attr]
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(1.0)  # Redis hiccup: resubscribe
+            finally:
+                try:
+                    close = getattr(pubsub, "aclose", None) or pubsub.reset  # redis-py 5 / 4
+                    await close()
+                except Exception:
+                    pass
 
+    async def _publish_invalidation(self, message: str) -> None:
+        if self.l1 is not None:
+            await self.client.publish(self.INVALIDATE_CHANNEL, message)  # type: ignore[attr-defined]
+
+    # ---- reads / writes ----
     async def get(self, key: str) -> Optional[str]:
-        return await self.client.get(key)
+        if self.l1 is None:
+            return await self.client.get(key)
+        self._ensure_listener()
+        value = await self.l1.get(key)
+        if value is not None:
+            return value
+        value = await self.client.get(key)
+        if value is not None:
+            await self.l1.setex(key, self.l1_ttl, value)
+        return value
+
+    async def get_many(self, keys: list[str]) -> dict[str, Optional[str]]:
+        """Look up several keys at once; Redis misses are fetched with one MGET."""
+        if not self._is_redis:
+            return {k: await self.client.get(k) for k in keys}
+        out: dict[str, Optional[str]] = {}
+        remote = keys
+        if self.l1 is not None:
+            self._ensure_listener()
+            remote = []
+            for k in keys:
+                out[k] = await self.l1.get(k)
+                if out[k] is None:
+                    remote.append(k)
+        if remote:
+            values = await self.client.mget(remote)  # type: ignore[attr-defined]
+            for k, v in zip(remote, values):
+                out[k] = v
+                if v is not None and self.l1 is not None:
+                    await self.l1.setex(k, self.l1_ttl, v)
+        return out
 
     async def set(self, key: str, value: str) -> None:
         # Prefer setex; fall back to set(ex=...) if needed
@@ -66,12 +243,41 @@ class Cache:
                 await self.client.setex(key, self.ttl, value)  # type: ignore[attr-defined]
             except AttributeError:
                 await self.client.set(key, value, ex=self.ttl)  # type: ignore[attr-defined]
+            if self.l1 is not None:
+                # values are write-once per key, so other L1s need no push here
+                await self.l1.setex(key, self.l1_ttl, value)
         else:
             await self.client.setex(key, self.ttl, value)
 
+    async def set_many(self, items: dict[str, str], ttl_s: Optional[int] = None) -> None:
+        """
+        Write several keys with the shared TTL, or ttl_s (0: no expiry);
+        Redis gets one pipelined round trip.
+        """
+        if not items:
+            return
+        ttl = self.ttl if ttl_s is None else ttl_s
+        if self._is_redis:
+            async with self.client.pipeline(transaction=False) as pipe:  # type: ignore[attr-defined]
+                for key, value in items.items():
+                    if ttl > 0:
+                        pipe.setex(key, ttl, value)
+                    else:
+                        pipe.set(key, value)
+                await pipe.execute()
+            if self.l1 is not None:
+                for key, value in items.items():
+                    await self.l1.setex(key, self.l1_ttl, value)
+        else:
+            for key, value in items.items():
+                await self.client.setex(key, ttl, value)
+
     async def delete(self, key: str) -> None:
         if self._is_redis:
             await self.client.delete(key)  # type: ignore[attr-defined]
+            if self.l1 is not None:
+                self.l1.delete(key)
+                await self._publish_invalidation(key)
         else:
             self.client.delete(key)
 
@@ -79,9 +285,55 @@ class Cache:
         if self._is_redis:
             # Clears only the selected Redis DB
             await self.client.flushdb()  # type: ignore[attr-defined]
+            if self.l1 is not None:
+                self.l1.clear()
+                await self._publish_invalidation("*")
         else:
             self.client.clear()
 
+    def stats(self) -> dict:
+        if self._is_redis:
+            tier = {"l1": self.l1.stats()} if self.l1 is not None else {}
+            return {"backend": "redis"} | tier
+        return {"backend": "memory"} | self.client.stats()
+
+    @asynccontextmanager
+    async def lock(self, key: str, timeout_s: float) -> AsyncIterator[Optional[bool]]:
+        """
+        Cross-worker lock for filling `key`. Yields True when the Redis lock is
+        held and False when waiting for it timed out; either way the caller
+        waited on another worker and should re-check the cache. In-memory mode
+        has nothing to coordinate with and yields None.
+        """
+        if not self._is_redis:
+            yield None
+            return
+        lock = self.client.lock(f"lock:{key}", timeout=timeout_s + 5, blocking_timeout=timeout_s)  # type: ignore[attr-defined]
+        acquired = await lock.acquire()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                try:
+                    await lock.release()
+                except Exception:
+                    pass  # lock expired while we held it; nothing to release
+
     @staticmethod
     def make_key(participant_id: str, task_id: str, condition: str) -> str:
         return f"resp:{participant_id}:{task_id}:{condition}"
+
+    @staticmethod
+    def content_key(
+        model: str,
+        temperature: float,
+        top_p: float,
+        seed: Optional[int],
+        system_prompt: str,
+        user_prompt: str,
+        prompt_version: str,
+    ) -> str:
+        """Key for one generation by everything that determines it, independent of who asked."""
+        parts = [model, temperature, top_p, seed, system_prompt, user_prompt, prompt_version]
+        digest = hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return f"gen:{digest}"
@@ -0,0 +1,295 @@
+# app/services/exporting.py
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.config import settings
+from app.db import insert_ignore
+from app.services.formats import encode_batch
+from app.models import CachedResponse, ExportColumn, ExportWatermark, PromptBlob
+
+# rows fetched per round trip from a server-side cursor
+YIELD_PER = 1000
+
+# column -> dtype ("str" | "int" | "float" | "bool" | "datetime"), used to type columnar exports
+GENERATION_DTYPES = {
+    "participant_id": "str",
+    "task_id": "str",
+    "condition": "str",
+    "response_id": "str",
+    "model": "str",
+    "tokens_in": "int",
+    "tokens_out": "int",
+    "latency_ms": "int",
+    "created_at": "datetime",
+    "system_prompt": "str",
+    "user_prompt": "str",
+    "prompt_text": "str",
+    "text": "str",
+}
+
+RATING_DTYPES = {
+    "participant_id": "str",
+    "task_id": "str",
+    "condition": "str",
+    "response_id": "str",
+    "usefulness": "int",
+    "novelty": "int",
+    "shown_slot": "int",
+    "created_at": "datetime",
+}
+
+BIG5_DTYPES = {
+    "participant_id": "str",
+    "O": "int",
+    "C": "int",
+    "E": "int",
+    "A": "int",
+    "N": "int",
+    "created_at": "datetime",
+}
+
+GENERATION_COLUMNS = list(GENERATION_DTYPES)
+RATING_COLUMNS = list(RATING_DTYPES)
+BIG5_COLUMNS = list(BIG5_DTYPES)
+
+
+def flatten(value, parent_key="", sep="_"):
+    items = {}
+    if isinstance(value, dict):
+        for key, nested in value.items():
+            new_key = f"{parent_key}{sep}{key}" if parent_key else key
+            items.update(flatten(nested, new_key, sep))
+    elif isinstance(value, list):
+        for idx, nested in enumerate(value):
+            new_key = f"{parent_key}{sep}{idx}" if parent_key else str(idx)
+            items.update(flatten(nested, new_key, sep))
+    elif parent_key:
+        items[parent_key] = value
+    return items
+
+
+def flatten_text(raw_text: Optional[str]) -> Dict[str, Any]:
+    """Flattened keys of a model response, or {} when it is not a JSON object/array."""
+    if not raw_text:
+        return {}
+    try:
+        parsed = json.loads(raw_text)
+    except json.JSONDecodeError:
+        return {}
+    return flatten(parsed) if isinstance(parsed, (dict, list)) else {}
+
+
+def json_dtype(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "str"
+
+
+def merge_dtype(a: Optional[str], b: str) -> str:
+    """Narrowest type that holds values of both; null never widens anything."""
+    if a is None or a == b or b == "null":
+        return a or b
+    if a == "null":
+        return b
+    if {a, b} == {"int", "float"}:
+        return "float"
+    return "str"
+
+
+async def stream_rows(session: AsyncSession, query, yield_per: int = YIELD_PER) -> AsyncIterator[Sequence]:
+    """Rows from a server-side cursor, fetched yield_per at a time."""
+    result = await session.stream(query.execution_options(yield_per=yield_per))
+    async for partition in result.partitions():
+        for row in partition:
+            yield row
+
+
+async def high_water_mark(session: AsyncSession, model=CachedResponse) -> int:
+    """Current max id of `model`; exports pin their upper bound to it so header, rows and watermark agree."""
+    return (await session.execute(select(func.max(model.id)))).scalar() or 0
+
+
+def window(query, model, max_id: int, after_id: int = 0, since: Optional[datetime] = None):
+    """Restrict `query` to after_id < id <= max_id (and created_at >= since), in id order."""
+    query = query.where(model.id <= max_id)
+    if after_id:
+        query = query.where(model.id > after_id)
+    if since is not None:
+        query = query.where(model.created_at >= since)
+    return query.order_by(model.id)
+
+
+async def get_watermark(session: AsyncSession, table_name: str) -> int:
+    row = await session.get(ExportWatermark, table_name)
+    return row.last_id if row is not None else 0
+
+
+async def set_watermark(session: AsyncSession, table_name: str, last_id: int) -> None:
+    """Record the highest exported id; the caller commits."""
+    await session.merge(ExportWatermark(table_name=table_name, last_id=last_id))
+
+
+def _observe(columns: Dict[str, str], texts: Iterable[Optional[str]]) -> Dict[str, str]:
+    for raw_text in texts:
+        for key, value in flatten_text(raw_text).items():
+            columns[key] = merge_dtype(columns.get(key), json_dtype(value))
+    return columns
+
+
+def observe_texts(texts: List[Optional[str]]) -> Dict[str, str]:
+    """Flattened keys and dtypes of one batch of `text` values (picklable, for process pools)."""
+    return _observe({}, texts)
+
+
+def merge_columns(columns: Dict[str, str], other: Dict[str, str]) -> Dict[str, str]:
+    """Fold a later batch's keys into `columns`, keeping first-seen order."""
+    for key, dtype in other.items():
+        columns[key] = merge_dtype(columns.get(key), dtype)
+    return columns
+
+
+def expand_generation_row(row: Sequence, flattened_keys: List[str]) -> List[Any]:
+    """A GENERATION_COLUMNS row plus one value per flattened key of its `text`."""
+    flattened = flatten_text(row[-1])
+    return list(row) + [flattened.get(k) for k in flattened_keys]
+
+
+def encode_generation_batch(fmt: str, names: List[str], rows: List[Sequence], flattened_keys: List[str]) -> bytes:
+    """Flatten and encode one batch of raw generation rows; runs in a worker process."""
+    return encode_batch(fmt, names, [expand_generation_row(r, flattened_keys) for r in rows])
+
+
+async def scan_columns(
+    session: AsyncSession,
+    max_id: int,
+    after_id: int = 0,
+    since: Optional[datetime] = None,
+) -> Dict[str, str]:
+    """First pass: stream only `text` and collect every flattened key (first-seen order) with its type."""
+    columns: Dict[str, str] = {}
+    texts = window(select(CachedResponse.text), CachedResponse, max_id, after_id, since)
+    async for (raw_text,) in stream_rows(session, texts):
+        _observe(columns, (raw_text,))
+    return columns
+
+
+async def registry_columns(session: AsyncSession) -> Dict[str, str]:
+    """Header known ahead of time from export_columns; no pass over the data."""
+    res = await session.execute(
+        select(ExportColumn.key, ExportColumn.dtype).order_by(ExportColumn.position, ExportColumn.key)
+    )
+    return {key: dtype for key, dtype in res.all()}
+
+
+async def register_columns(session: AsyncSession, texts: Iterable[Optional[str]]) -> None:
+    """
+    Write-time half of the registry: add keys first seen in `texts` and widen
+    the dtype of known ones. Runs inside the caller's transaction.
+    """
+    seen = _observe({}, texts)
+    if not seen:
+        return
+    known = await registry_columns(session)
+    new = {k: t for k, t in seen.items() if k not in known}
+    if new:
+        start = len(known)
+        await insert_ignore(session, ExportColumn, [
+            {"key": k, "position": start + i, "dtype": t} for i, (k, t) in enumerate(new.items())
+        ])
+    for key, dtype in seen.items():
+        if key in known and merge_dtype(known[key], dtype) != known[key]:
+            await session.execute(
+                update(ExportColumn).where(ExportColumn.key == key).values(dtype=merge_dtype(known[key], dtype))
+            )
+
+
+async def rebuild_registry(session: AsyncSession) -> Dict[str, str]:
+    """Backfill export_columns from every stored row (e.g. rows written before the registry existed)."""
+    columns = await scan_columns(session, await high_water_mark(session))
+    known = await registry_columns(session)
+    new = [k for k in columns if k not in known]
+    if new:
+        await insert_ignore(session, ExportColumn, [
+            {"key": k, "position": len(known) + i, "dtype": columns[k]} for i, k in enumerate(new)
+        ])
+    for key in known:
+        if key in columns and columns[key] != known[key]:
+            await session.execute(update(ExportColumn).where(ExportColumn.key == key).values(dtype=columns[key]))
+    await session.commit()
+    return await registry_columns(session)
+
+
+def table_rows(
+    session: AsyncSession,
+    model,
+    columns: List[str],
+    max_id: int,
+    after_id: int = 0,
+    since: Optional[datetime] = None,
+) -> AsyncIterator[Sequence]:
+    q = select(*(getattr(model, c) for c in columns))
+    return stream_rows(session, window(q, model, max_id, after_id, since))
+
+
+def _generation_select():
+    """
+    GENERATION_COLUMNS, with PROMPT_BLOBS on dereferenced from prompt_blobs
+    for rows stored by hash (rows with inline prompts pass through). Without
+    it the query touches neither prompt_blobs nor the hash columns, so keep
+    it on once rows have been stored by hash.
+    """
+    if not settings.PROMPT_BLOBS:
+        return select(*(getattr(CachedResponse, c) for c in GENERATION_COLUMNS))
+    sys_blob, user_blob = aliased(PromptBlob), aliased(PromptBlob)
+    deref = {
+        "system_prompt": (CachedResponse.system_prompt_hash, sys_blob),
+        "user_prompt": (CachedResponse.user_prompt_hash, user_blob),
+        "prompt_text": (CachedResponse.user_prompt_hash, user_blob),  # prompt_text is the user prompt
+    }
+    columns = []
+    for c in GENERATION_COLUMNS:
+        col = getattr(CachedResponse, c)
+        if c in deref:
+            hash_col, blob = deref[c]
+            col = case((hash_col.is_not(None), blob.text), else_=col).label(c)
+        columns.append(col)
+    return (
+        select(*columns)
+        .outerjoin(sys_blob, sys_blob.hash == CachedResponse.system_prompt_hash)
+        .outerjoin(user_blob, user_blob.hash == CachedResponse.user_prompt_hash)
+    )
+
+
+def raw_generation_rows(
+    session: AsyncSession,
+    max_id: int,
+    after_id: int = 0,
+    since: Optional[datetime] = None,
+) -> AsyncIterator[Sequence]:
+    """GENERATION_COLUMNS tuples (prompts dereferenced), before flattening."""
+    return stream_rows(session, window(_generation_select(), CachedResponse, max_id, after_id, since))
+
+
+async def generation_rows(
+    session: AsyncSession,
+    flattened_keys: List[str],
+    max_id: int,
+    after_id: int = 0,
+    since: Optional[datetime] = None,
+) -> AsyncIterator[List[Any]]:
+    """Second pass: GENERATION_COLUMNS plus one value per flattened key, streamed."""
+    async for row in raw_generation_rows(session, max_id, after_id, since):
+        yield expand_generation_row(row, flattened_keys)
@@ -0,0 +1,199 @@
+# app/services/formats.py
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from io import StringIO
+from typing import Any, AsyncIterator, Dict, List, Sequence, Union
+
+# Parquet / Arrow IPC need pyarrow; CSV and NDJSON work without it
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:  # pragma: no cover
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+
+# bytes/characters buffered per chunk handed to the client or file
+CHUNK_SIZE = 64 * 1024
+# rows per Arrow record batch (and Parquet row group)
+BATCH_ROWS = 10_000
+
+# format -> (file extension, media type)
+FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.stream"),
+    "ndjson.gz": ("ndjson.gz", "application/gzip"),
+}
+ARROW_FORMATS = ("parquet", "arrow")
+
+Chunk = Union[str, bytes]
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def arrow_schema(columns: Dict[str, str]):
+    """Arrow schema for {name: dtype}; dtypes are the ones exporting.json_dtype produces plus "datetime"."""
+    types = {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "bool": pa.bool_(),
+        "datetime": pa.timestamp("us", tz="UTC"),
+        "str": pa.string(),
+        "null": pa.string(),
+    }
+    return pa.schema([pa.field(name, types[dtype]) for name, dtype in columns.items()])
+
+
+def _arrow_column(values: Sequence, type_) -> Any:
+    if pa.types.is_string(type_):
+        # flattened keys seen with mixed types are declared "str"
+        values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+    return pa.array(values, type=type_)
+
+
+def _record_batch(schema, rows: List[Sequence]):
+    columns = list(zip(*rows))
+    return pa.record_batch([_arrow_column(col, f.type) for col, f in zip(columns, schema)], schema=schema)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written so far; tell() keeps counting across drains."""
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+async def _batches(rows: AsyncIterator[Sequence], size: int) -> AsyncIterator[List[Sequence]]:
+    batch: List[Sequence] = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _to_csv(columns: Dict[str, str], rows: AsyncIterator[Sequence], header: bool) -> AsyncIterator[str]:
+    # buffer many rows per chunk instead of one StringIO round trip per row
+    buf = StringIO()
+    w = csv.writer(buf)
+    if header:
+        w.writerow(columns)
+    async for row in rows:
+        w.writerow(row)
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue(); buf.seek(0); buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+async def _to_ndjson_gz(columns: Dict[str, str], rows: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    # one gzip member per export; appending another member to a file is still valid gzip
+    names = list(columns)
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending: List[str] = []
+    size = 0
+    async for row in rows:
+        line = json.dumps(dict(zip(names, row)), default=_json_default, ensure_ascii=False)
+        pending.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            out = gz.compress(("\n".join(pending) + "\n").encode("utf-8"))
+            pending, size = [], 0
+            if out:
+                yield out
+    if pending:
+        out = gz.compress(("\n".join(pending) + "\n").encode("utf-8"))
+        if out:
+            yield out
+    yield gz.flush()
+
+
+async def _to_arrow(fmt: str, columns: Dict[str, str], rows: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+    try:
+        async for batch in _batches(rows, BATCH_ROWS):
+            writer.write_batch(_record_batch(schema, batch))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def encode_header(names: List[str]) -> str:
+    buf = StringIO()
+    csv.writer(buf).writerow(names)
+    return buf.getvalue()
+
+
+def encode_batch(fmt: str, names: List[str], rows: List[Sequence]) -> bytes:
+    """
+    One self-contained chunk of csv rows (no header) or of ndjson.gz (its own
+    gzip member, so chunks concatenate into a valid file). Plain function of
+    picklable arguments so batches can be encoded in a process pool.
+    """
+    if fmt == "csv":
+        buf = StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue().encode("utf-8")
+    if fmt == "ndjson.gz":
+        lines = [json.dumps(dict(zip(names, row)), default=_json_default, ensure_ascii=False) for row in rows]
+        return zlib.compress(("\n".join(lines) + "\n").encode("utf-8"), wbits=31)
+    raise ValueError(f"{fmt} cannot be encoded in independent batches")
+
+
+def encode(
+    fmt: str,
+    columns: Dict[str, str],
+    rows: AsyncIterator[Sequence],
+    header: bool = True,
+) -> AsyncIterator[Chunk]:
+    """
+    Stream `rows` (tuples in `columns` order) as `fmt`. `columns` maps each
+    name to its dtype, which types the Arrow/Parquet schema; CSV and NDJSON
+    only use the names. header=False continues an existing CSV file.
+    """
+    if fmt == "csv":
+        return _to_csv(columns, rows, header)
+    if fmt == "ndjson.gz":
+        return _to_ndjson_gz(columns, rows)
+    if fmt in ARROW_FORMATS:
+        if pa is None:
+            raise RuntimeError(f"{fmt} export requires pyarrow")
+        return _to_arrow(fmt, columns, rows)
+    raise ValueError(f"unknown export format: {fmt}")
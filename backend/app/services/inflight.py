@@ -0,0 +1,46 @@
+# app/services/inflight.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    In-flight registry that coalesces concurrent calls for the same key.
+    The first caller for a key starts the work as a task; callers arriving
+    while it is still running await the same task instead of repeating it.
+    Cancelling any caller, the first one included, leaves the work running
+    for the others.
+    The registry is per-process; cross-worker dedup is the caller's lock.
+    """
+    def __init__(self) -> None:
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # the work runs in its own task, owned by the registry rather than
+            # by the first caller, so that caller disconnecting cannot cancel it
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda t: self._done(key, t))
+        # shield: a cancelled caller (leader or follower) must not cancel the shared work
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller has gone away
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "inFlight": self.in_flight()}
@@ -1,36 +1,125 @@
 # --- app/services/llm.py ---
-import os, asyncio, json, uuid
-from typing import Dict, Optional
-from pathlib import Path
-from time import perf_counter
-
-# --------- light settings (no DB!) ----------
-class Settings:
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
-    LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
-    LLM_TOP_P = float(os.getenv("LLM_TOP_P", "1.0"))
-    LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "350"))
-    LLM_SEED = int(os.getenv("LLM_SEED")) if os.getenv("LLM_SEED") else None
-    TIMEOUT_S = int(os.getenv("TIMEOUT_S", "25"))
-    STRIP_PII = os.getenv("STRIP_PII", "false").lower() == "true"
-    CACHE_TTL_S = int(os.getenv("CACHE_TTL_S", "3600"))
-    REDIS_URL = os.getenv("REDIS_URL")  # optional
-
-settings = Settings()
-
-# --------- cache (use your Redis cache if set, else in-memory) ----------
-class _MemCache:
-    def __init__(self): self._d = {}
-    async def get(self, k): return self._d.get(k)
-    async def set(self, k, v): self._d[k] = v
-    def make_key(self, pid, tid, cond): return f"{pid}:{tid}:{cond}"
-
-if settings.REDIS_URL:
-    from app.services.cache import Cache  # your redis impl
-    cache = Cache(settings.REDIS_URL, settings.CACHE_TTL_S)
-else:
-    cache = _MemCache()
+import asyncio, json, uuid
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+from time import monotonic, perf_counter
+
+from app.config import settings
+from app.services.cache import Cache
+from app.services.inflight import SingleFlight
+from app.services.persistence import generation_row, insert_generations, insert_scores
+from app.services.personas import invalidate_personas
+from app.services.prompts import PromptTemplate, get_registry
+from app.services.providers import LLMProvider, MockProvider, OpenAIProvider
+from app.services.ratelimit import Admission, estimate_tokens
+from app.services.resilience import Resilience
+from app.services.writebehind import WriteBehind
+
+# --------- shared components, built on first use ----------
+@lru_cache
+def get_cache() -> Cache:
+    # Redis + per-worker L1 if REDIS_URL is set, else bounded in-memory LRU
+    return Cache(
+        settings.REDIS_URL,
+        settings.CACHE_TTL_S,
+        max_entries=settings.CACHE_MAX_ENTRIES,
+        max_bytes=settings.CACHE_MAX_BYTES,
+        sweep_interval_s=settings.CACHE_SWEEP_S,
+        l1_max_entries=settings.CACHE_L1_MAX_ENTRIES,
+        l1_ttl_s=settings.CACHE_L1_TTL_S,
+    )
+
+@lru_cache
+def get_inflight() -> SingleFlight:
+    # concurrent misses on the same key share one generation
+    return SingleFlight()
+
+@lru_cache
+def get_admission() -> Admission:
+    # every OpenAI call is admitted here first (in-flight cap + RPM/TPM buckets)
+    return Admission(settings.LLM_MAX_CONCURRENCY, settings.LLM_RPM, settings.LLM_TPM)
+
+@lru_cache
+def get_resilience() -> Resilience:
+    # retries with decorrelated jitter + hedging, inside the TIMEOUT_S deadline
+    return Resilience(
+        settings.LLM_MAX_ATTEMPTS,
+        settings.LLM_RETRY_BASE_S,
+        settings.LLM_RETRY_CAP_S,
+        settings.LLM_HEDGE_PERCENTILE,
+    )
+
+@lru_cache
+def get_generation_writer() -> WriteBehind:
+    # fresh generations go to cached_responses off the request path
+    return WriteBehind(
+        insert_generations,
+        max_batch=settings.PERSIST_BATCH_SIZE,
+        flush_interval_s=settings.PERSIST_FLUSH_S,
+        maxsize=settings.PERSIST_QUEUE_SIZE,
+    )
+
+async def write_scores(rows: list, sessions=None) -> None:
+    """Store new Big5 scores; every writer of big5_scores goes through here."""
+    await insert_scores(rows, sessions)
+    # a new latest Big5Score changes the participant's mirror/comp personas
+    await invalidate_personas(get_cache(), (r["participant_id"] for r in rows))
+
+@lru_cache
+def get_score_writer() -> WriteBehind:
+    # /score-big5 answers + sums go to participants/big5_scores the same way
+    return WriteBehind(
+        write_scores,
+        max_batch=settings.PERSIST_BATCH_SIZE,
+        flush_interval_s=settings.PERSIST_FLUSH_S,
+        maxsize=settings.PERSIST_QUEUE_SIZE,
+    )
+
+@lru_cache
+def get_client():
+    """
+    AsyncOpenAI client for OpenAI or LLM_BASE_URL, or None without either
+    or the openai package. Retries belong to Resilience, not the SDK.
+    """
+    if not (settings.OPENAI_API_KEY or settings.LLM_BASE_URL):
+        return None
+    try:
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY or "unused",  # local compatible servers ignore it
+            base_url=settings.LLM_BASE_URL,
+            max_retries=0,
+        )
+    except Exception:
+        return None
+
+@lru_cache
+def get_provider() -> LLMProvider:
+    # LLM_PROVIDER=auto: a configured OpenAI(-compatible) endpoint, else mocked responses
+    if settings.LLM_PROVIDER == "mock":
+        return MockProvider()
+    client = get_client()
+    if client is None:
+        if settings.LLM_PROVIDER == "auto":
+            return MockProvider()
+        raise RuntimeError("LLM_PROVIDER=openai needs OPENAI_API_KEY or LLM_BASE_URL and the openai package")
+    return OpenAIProvider(client, "compatible" if settings.LLM_BASE_URL else "openai")
+
+_LAZY = {
+    "cache": get_cache,
+    "inflight": get_inflight,
+    "admission": get_admission,
+    "resilience": get_resilience,
+    "generation_writer": get_generation_writer,
+    "score_writer": get_score_writer,
+    "provider": get_provider,
+}
+
+def __getattr__(name: str):
+    # `from app.services.llm import cache` etc. still work, built on first access
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --------- tiny timer (no external utils) ----------
 class timer_ms:
@@ -42,131 +131,340 @@ def scrub_pii(text: str) -> str:
     # keep your own if you prefer; no-op here
     return text
 
-# --------- OpenAI client ----------
-try:
-    from openai import AsyncOpenAI
-    _client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
-except Exception:
-    _client = None
-
-PROMPTS_DIR = Path(__file__).resolve().parents[1] / "prompts"
-
-FILES = {
-    "A": {
-        "baseline": PROMPTS_DIR / "style_a_baseline.txt",
-        "persona":  PROMPTS_DIR / "style_a_persona.txt",
-        "creative": PROMPTS_DIR / "style_a_creative.txt",
-    },
-    "B": {
-        "baseline": PROMPTS_DIR / "style_b_baseline.txt",
-        "persona":  PROMPTS_DIR / "style_b_persona.txt",
-        "creative": PROMPTS_DIR / "style_b_creative.txt",
-    },
+_FALLBACKS = {
+    "generic":  PromptTemplate.compile("generic", "Produce a concise, high-quality answer in the requested style."),
+    "creative": PromptTemplate.compile("creative", "Favor unconventional, high-variance ideas; tolerate ambiguity."),
+    "persona":  PromptTemplate.compile("persona", "Adopt the given personality (O,C,E,A,N) and respond accordingly."),
+    "baseline": PromptTemplate.compile("baseline", "Provide a sensible, neutral, concise answer."),
 }
 
-def _read(path: Path, fallback: str) -> str:
-    try: return path.read_text(encoding="utf-8")
-    except Exception: return fallback
-
-def _inject_persona(system_prompt: str, persona: Optional[Dict[str, int]]) -> str:
-    if not persona:
-        return system_prompt
-
-    if "(dynamic)" in system_prompt:
-        mapping = (
-            ("O", "Openness"),
-            ("C", "Conscientiousness"),
-            ("E", "Extraversion"),
-            ("A", "Agreeableness"),
-            ("N", "Neuroticism"),
-        )
-        for key, label in mapping:
-            value = persona.get(key)
-            if value is None:
-                continue
-            system_prompt = system_prompt.replace(f"{label}: (dynamic);", f"{label}: {value};")
-            system_prompt = system_prompt.replace(f"{label}: (dynamic)", f"{label}: {value}")
-
-    return system_prompt
-
-
 def system_prompt_for(
     style: str,
     condition: str,
     persona: Optional[Dict[str, int]] = None,
 ) -> str:
-    group = FILES.get(style.upper())
-    if not group:
-        base = "Produce a concise, high-quality answer in the requested style."
-    elif condition == "creative":
-        base = _read(group["creative"], "Favor unconventional, high-variance ideas; tolerate ambiguity.")
+    style = style.upper()
+    if style not in ("A", "B"):
+        return _FALLBACKS["generic"].render(persona)
+    if condition == "creative":
+        kind = "creative"
     elif condition in ("mirror", "comp"):
-        base = _read(group["persona"], "Adopt the given personality (O,C,E,A,N) and respond accordingly.")
+        kind = "persona"
     else:
-        base = _read(group["baseline"], "Provide a sensible, neutral, concise answer.")
-
-    return _inject_persona(base, persona)
-
-async def _call_openai(system_prompt: str, user_prompt: str) -> dict:
-    if _client is None:
-        return {"text": f"[MOCKED]\n{user_prompt[:160]}...", "model": "mock", "usage": {"prompt_tokens": 0, "completion_tokens": 0}}
-    resp = await asyncio.wait_for(
-        _client.chat.completions.create(
-            model=settings.LLM_MODEL,
-            temperature=settings.LLM_TEMPERATURE,
-            top_p=settings.LLM_TOP_P,
-            max_tokens=settings.LLM_MAX_TOKENS,
-            seed=settings.LLM_SEED,
-            messages=[{"role":"system","content":system_prompt},{"role":"user","content":user_prompt}],
-            response_format={"type": "json_object"},
-
-        ),
-        timeout=settings.TIMEOUT_S,
+        kind = "baseline"
+    template = get_registry().template(f"style_{style.lower()}_{kind}.txt") or _FALLBACKS[kind]
+    if settings.PROMPT_CACHE_LAYOUT:
+        return template.render_prefixed(persona)
+    return template.render(persona)
+
+# a per-participant key holding ALIAS + content key points at a shared generation
+# style family of every live generation; keep "A" unless tasks are split by blocks/arms
+STUDY_STYLE = "A"
+
+def task_inputs(task_id: str, task_prompt: Optional[str] = None) -> Tuple[str, str]:
+    """
+    (style, user prompt) for a task, resolved the way /generate-task does.
+    Cache keys carry neither, so warm-up and the batch pipeline must go
+    through here to fill the cache with what the live route would generate.
+    """
+    return STUDY_STYLE, task_prompt or task_id
+
+ALIAS = "@"
+
+def content_key(system_prompt: str, user_prompt: str) -> str:
+    return Cache.content_key(
+        settings.LLM_MODEL,
+        settings.LLM_TEMPERATURE,
+        settings.LLM_TOP_P,
+        settings.LLM_SEED,
+        system_prompt,
+        user_prompt,
+        settings.LOG_PROMPT_VERSION,
     )
-    text = (resp.choices[0].message.content or "").strip()
-    usage = getattr(resp, "usage", None)
+
+def alias_to(key: str, response_id: str) -> str:
+    """Cache value pointing a participant's key at the shared entry `key`, under their own responseId."""
+    return f"{ALIAS}{key} {response_id}"
+
+async def _get_payloads(cache: Cache, keys: dict[str, str]) -> dict[str, Optional[dict]]:
+    """cond -> cached payload for each key in `keys`, following aliases to their shared entries."""
+    values = await cache.get_many(list(keys.values()))
+    out: dict[str, Optional[dict]] = {}
+    aliased: dict[str, list[str]] = {}
+    for c, k in keys.items():
+        v = values.get(k)
+        if v and v.startswith(ALIAS):
+            aliased[c] = v[len(ALIAS):].split(" ", 1)
+        else:
+            out[c] = json.loads(v) if v else None
+    if aliased:
+        targets = await cache.get_many([k for k, *_ in aliased.values()])
+        for c, (k, *response_id) in aliased.items():
+            target = targets.get(k)
+            out[c] = json.loads(target) | {"responseId": r for r in response_id} if target else None
+    return out
+
+def chat_request(system_prompt: str, user_prompt: str) -> dict:
+    """Chat completion parameters for one generation; the live path and offline batches send the same."""
+    return dict(
+        model=settings.LLM_MODEL,
+        temperature=settings.LLM_TEMPERATURE,
+        top_p=settings.LLM_TOP_P,
+        max_tokens=settings.LLM_MAX_TOKENS,
+        seed=settings.LLM_SEED,
+        messages=[{"role":"system","content":system_prompt},{"role":"user","content":user_prompt}],
+        response_format={"type": "json_object"},
+    )
+
+async def _call_openai(
+    system_prompt: str,
+    user_prompt: str,
+    deadline: Optional[float] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> dict:
+    """One chat completion; with on_delta it streams and reports each text chunk as it arrives."""
+    provider = get_provider()
+    request = chat_request(system_prompt, user_prompt)
+    if not provider.remote:
+        return await provider.complete(request, on_delta)
+    # one deadline bounds queueing for admission and the call itself together
+    if deadline is None:
+        deadline = monotonic() + settings.TIMEOUT_S
+    cost = estimate_tokens(system_prompt, user_prompt, settings.LLM_MAX_TOKENS)
+    async with get_admission().slot(cost, deadline):
+        return await asyncio.wait_for(
+            provider.complete(request, on_delta),
+            timeout=max(0.0, deadline - monotonic()),
+        )
+
+CONDITION_ORDER = ["baseline", "mirror", "comp", "creative"]
+
+async def _generate(
+    cond: str,
+    sys_prompt: str,
+    user_msg: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> dict:
+    deadline = monotonic() + settings.TIMEOUT_S
+    with timer_ms() as t:
+        llm = await get_resilience().call(
+            lambda: _call_openai(sys_prompt, user_msg, deadline, on_delta),
+            deadline,
+            hedge=on_delta is None,  # two interleaved token streams would garble the preview
+        )
+    latency_ms = t()
+
+    text = scrub_pii(llm["text"]) if settings.STRIP_PII else llm["text"]
     return {
+        "condition": cond,
+        "responseId": str(uuid.uuid4()),
         "text": text,
-        "model": getattr(resp, "model", settings.LLM_MODEL),
-        "usage": {
-            "prompt_tokens": getattr(usage, "prompt_tokens", 0) if usage else 0,
-            "completion_tokens": getattr(usage, "completion_tokens", 0) if usage else 0,
-        },
+        "model": llm["model"],
+        "tokensIn": llm["usage"]["prompt_tokens"],
+        "tokensOut": llm["usage"]["completion_tokens"],
+        "generationTimeMs": latency_ms,
+        "systemPrompt": sys_prompt,
+        "userPrompt": user_msg,
     }
 
-CONDITION_ORDER = ["baseline", "mirror", "comp", "creative"]
+async def _fill(
+    participant_id: str,
+    task_id: str,
+    keys: dict[str, str],
+    jobs: dict[str, str],
+    user_msg: str,
+    on_result: Optional[Callable[[dict], None]] = None,
+    on_delta: Optional[Callable[[str, str], None]] = None,
+) -> dict[str, dict]:
+    """
+    Generate the missing conditions `jobs` (cond -> system prompt) and write them in one batch.
+    A condition that still fails after retries comes back as {"condition", "error"}
+    and is not cached, so the next request for it generates again.
+    on_result sees each condition as soon as it finishes; on_delta(cond, text) sees tokens.
+    """
+    # hold the cross-worker lock (Redis only) for the whole generate + write;
+    # it covers the (participant, task) so a waiter can re-check every key
+    cache = get_cache()
+    lock_key = cache.make_key(participant_id, task_id, "*")
+    async with cache.lock(lock_key, settings.TIMEOUT_S) as locked:
+        out: dict[str, dict] = {}
+        if locked is not None:
+            # another worker may have filled some keys while we waited, also
+            # when the wait timed out: only what is still missing is generated
+            again = await _get_payloads(cache, {c: keys[c] for c in jobs})
+            for cond in jobs:
+                cached = again.get(cond)
+                if cached:
+                    out[cond] = cached | {"condition": cond, "fromCache": True}
+                    if on_result:
+                        on_result(out[cond])
 
-async def generate_four(personas: list[dict], participant_id: str, task_id: str, style: str, prompt_text: str):
-    async def one(cond: str, persona_payload: dict):
-        persona_dict = persona_payload.get("persona") if persona_payload else None
-        sys_prompt = system_prompt_for(style, cond, persona_dict)
+        async def one(cond: str) -> dict:
+            tokens = (lambda d: on_delta(cond, d)) if on_delta else None
+            try:
+                res = await _generate(cond, jobs[cond], user_msg, tokens)
+            except Exception as e:
+                res = {"condition": cond, "error": f"{type(e).__name__}: {e}", "_exc": e}
+            if on_result:
+                on_result(res)
+            return res
+
+        todo = [c for c in jobs if c not in out]
+        payloads = await asyncio.gather(*[one(c) for c in todo])
+        fresh: dict[str, dict] = {}
+        for cond, res in zip(todo, payloads):
+            if "error" in res:
+                out[cond] = res
+            else:
+                fresh[cond] = res
+        if fresh:
+            if settings.CACHE_CONTENT_KEYS:
+                shared = {c: content_key(jobs[c], user_msg) for c in fresh}
+                await cache.set_many(
+                    {shared[c]: json.dumps(p) for c, p in fresh.items()}
+                    | {keys[c]: alias_to(shared[c], p["responseId"]) for c, p in fresh.items()}
+                )
+            else:
+                await cache.set_many({keys[c]: json.dumps(p) for c, p in fresh.items()})
+            if settings.PERSIST_GENERATIONS:
+                for p in fresh.values():
+                    get_generation_writer().put(generation_row(participant_id, task_id, p))
+        return out | fresh
 
-        key = cache.make_key(participant_id, task_id, cond)
-        cached = await cache.get(key)
+async def _lookup(
+    participant_id: str,
+    task_id: str,
+    keys: dict[str, str],
+    personas: list[dict],
+    style: str,
+    prompt_text: str,
+) -> tuple[dict[str, dict], dict[str, str]]:
+    """
+    Cached results (cond -> payload) and the conditions left to generate
+    (cond -> system prompt). With CACHE_CONTENT_KEYS a miss on the participant's
+    key is retried on the content key of the prompt it would send; a hit there
+    is aliased to the participant under a responseId of their own and
+    persisted for them like a fresh result.
+    """
+    cache = get_cache()
+    hits = await _get_payloads(cache, keys)
+    results: dict[str, dict] = {}
+    jobs: dict[str, str] = {}
+    for cond, persona_payload in zip(keys, personas):
+        cached = hits.get(cond)
         if cached:
-            data = json.loads(cached)
-            return data | {"fromCache": True}
-
-        user_msg = prompt_text
-
-        with timer_ms() as t:
-            llm = await _call_openai(sys_prompt, user_msg)
-        latency_ms = t()
-
-        text = scrub_pii(llm["text"]) if settings.STRIP_PII else llm["text"]
-        payload = {
-            "condition": cond,
-            "responseId": str(uuid.uuid4()),
-            "text": text,
-            "model": llm["model"],
-            "tokensIn": llm["usage"]["prompt_tokens"],
-            "tokensOut": llm["usage"]["completion_tokens"],
-            "generationTimeMs": latency_ms,
-            "systemPrompt": sys_prompt,
-            "userPrompt": user_msg,
+            # an aliased entry may have been generated for another condition with the same prompts
+            results[cond] = cached | {"condition": cond, "fromCache": True}
+            continue
+        persona_dict = persona_payload.get("persona") if persona_payload else None
+        jobs[cond] = system_prompt_for(style, cond, persona_dict)
+
+    if jobs and settings.CACHE_CONTENT_KEYS:
+        shared = {c: content_key(sys_prompt, prompt_text) for c, sys_prompt in jobs.items()}
+        found = await cache.get_many(list(shared.values()))
+        reused = {
+            c: json.loads(found[k]) | {"condition": c, "responseId": str(uuid.uuid4())}
+            for c, k in shared.items() if found.get(k)
         }
-        await cache.set(key, json.dumps(payload))
-        return payload
+        if reused:
+            await cache.set_many({keys[c]: alias_to(shared[c], reused[c]["responseId"]) for c in reused})
+            for cond, payload in reused.items():
+                if settings.PERSIST_GENERATIONS:
+                    get_generation_writer().put(generation_row(participant_id, task_id, payload))
+                results[cond] = payload | {"fromCache": True}
+                del jobs[cond]
+    return results, jobs
+
+async def generate_four(
+    personas: list[dict],
+    participant_id: str,
+    task_id: str,
+    style: str,
+    prompt_text: str,
+    partial: bool = False,
+):
+    """
+    One result per condition in CONDITION_ORDER. By default any failed
+    condition raises; with partial=True failed ones come back as
+    {"condition", "error"} entries and the rest are returned as usual.
+    """
+    cache = get_cache()
+    conds = [c for c, _ in zip(CONDITION_ORDER, personas)]
+    keys = {c: cache.make_key(participant_id, task_id, c) for c in conds}
+
+    # one batched lookup (L1, then a single MGET) for all four conditions
+    results, jobs = await _lookup(participant_id, task_id, keys, personas, style, prompt_text)
+
+    if jobs:
+        # concurrent requests missing the same conditions share one fill
+        flight_key = cache.make_key(participant_id, task_id, ",".join(jobs))
+        results |= await get_inflight().do(flight_key, lambda: _fill(participant_id, task_id, keys, jobs, prompt_text))
+
+    ordered = [results[c] for c in conds]
+    if not partial:
+        for r in ordered:
+            if "error" in r:
+                raise r["_exc"]
+    return ordered
+
+# keeps fills alive after a streaming client disconnects (the results still get cached)
+_detached: set[asyncio.Future] = set()
+
+async def stream_four(
+    personas: list[dict],
+    participant_id: str,
+    task_id: str,
+    style: str,
+    prompt_text: str,
+    tokens: bool = False,
+) -> AsyncIterator[tuple[str, dict]]:
+    """
+    Like generate_four(partial=True), but yields ("condition", result) as each
+    condition finishes instead of waiting for all four; cache hits come first.
+    With tokens=True it also yields ("token", {"condition", "delta"}) while
+    generating. A request that joins another request's in-flight fill only
+    sees its conditions once that whole fill is done.
+    """
+    cache = get_cache()
+    conds = [c for c, _ in zip(CONDITION_ORDER, personas)]
+    keys = {c: cache.make_key(participant_id, task_id, c) for c in conds}
+    cached, jobs = await _lookup(participant_id, task_id, keys, personas, style, prompt_text)
+    for cond in conds:
+        if cond in cached:
+            yield "condition", cached[cond]
+    if not jobs:
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+    on_result = lambda r: queue.put_nowait(("condition", r))
+    on_delta = (lambda c, d: queue.put_nowait(("token", {"condition": c, "delta": d}))) if tokens else None
+    flight_key = cache.make_key(participant_id, task_id, ",".join(jobs))
+    fill = asyncio.ensure_future(
+        get_inflight().do(flight_key, lambda: _fill(participant_id, task_id, keys, jobs, prompt_text, on_result, on_delta))
+    )
 
-    tasks = [one(c, p) for c, p in zip(CONDITION_ORDER, personas)]
-    return await asyncio.gather(*tasks)
+    seen: set[str] = set()
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, fill}, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                break
+            kind, item = getter.result()
+            if kind == "condition":
+                seen.add(item["condition"])
+            yield kind, item
+        while not queue.empty():
+            kind, item = queue.get_nowait()
+            if kind == "condition":
+                seen.add(item["condition"])
+            yield kind, item
+        # coalesced onto someone else's fill: our callbacks never ran
+        for cond, res in (await fill).items():
+            if cond not in seen:
+                yield "condition", res
+    finally:
+        if not fill.done():
+            _detached.add(fill)
+            fill.add_done_callback(_detached.discard)
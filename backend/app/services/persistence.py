@@ -0,0 +1,97 @@
+# app/services/persistence.py
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import settings
+from app.db import get_sessionmaker, insert_ignore
+from app.models import Big5Score, CachedResponse, Participant, PromptBlob
+from app.services.exporting import register_columns
+
+
+def generation_row(participant_id: str, task_id: str, payload: Dict) -> Dict:
+    """CachedResponse columns for one freshly generated payload from generate_four."""
+    return {
+        "participant_id": participant_id,
+        "task_id": task_id,
+        "condition": payload["condition"],
+        "response_id": payload["responseId"],
+        "system_prompt": payload["systemPrompt"],
+        "user_prompt": payload["userPrompt"],
+        "prompt_text": payload["userPrompt"],
+        "text": payload["text"],
+        "model": payload["model"],
+        "tokens_in": payload["tokensIn"],
+        "tokens_out": payload["tokensOut"],
+        "latency_ms": payload["generationTimeMs"],
+    }
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _dedup_prompts(rows: List[Dict]) -> tuple[List[Dict], List[Dict]]:
+    """Rows referencing their prompts by hash, plus the distinct prompt_blobs rows they need."""
+    blobs: Dict[str, str] = {}
+    out = []
+    for r in rows:
+        sys_hash, user_hash = prompt_hash(r["system_prompt"]), prompt_hash(r["user_prompt"])
+        blobs[sys_hash] = r["system_prompt"]
+        blobs[user_hash] = r["user_prompt"]
+        out.append(r | {
+            "system_prompt": "", "user_prompt": "", "prompt_text": "",
+            "system_prompt_hash": sys_hash, "user_prompt_hash": user_hash,
+        })
+    return out, [{"hash": h, "text": t} for h, t in blobs.items()]
+
+
+async def insert_generations(rows: List[Dict]) -> None:
+    # one executemany; SQLAlchemy renders it as batched multi-row INSERT ... VALUES
+    async with get_sessionmaker()() as session:
+        texts = [r["text"] for r in rows]
+        if settings.PROMPT_BLOBS:
+            rows, blobs = _dedup_prompts(rows)
+            await insert_ignore(session, PromptBlob, blobs)
+        await session.execute(insert(CachedResponse), rows)
+        # keep the export header registry current in the same transaction, but
+        # in a savepoint: the rows matter more than the header, which
+        # rebuild_registry can backfill from them later
+        try:
+            async with session.begin_nested():
+                await register_columns(session, texts)
+        except SQLAlchemyError:
+            pass
+        await session.commit()
+
+
+def score_row(participant_id: str, answers: List[int], sums: Dict[str, int]) -> Dict:
+    """Big5Score columns for one /score-big5 call; stamped now, not at flush time."""
+    return {
+        "participant_id": participant_id,
+        **{t: sums[t] for t in ("O", "C", "E", "A", "N")},
+        "answers": json.dumps(answers, separators=(",", ":")),
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+async def insert_scores(rows: List[Dict], sessions: Optional[async_sessionmaker] = None) -> None:
+    """
+    Every score is a new big5_scores row, re-scores included: the persona
+    lookup reads the latest by (participant_id, created_at), history is kept
+    and id-watermarked exports pick re-scores up. Participants are upserted
+    (insert, ignore existing) in the same transaction, so the big5_scores
+    foreign key always resolves.
+    """
+    async with (sessions or get_sessionmaker())() as session:
+        participant_ids = dict.fromkeys(r["participant_id"] for r in rows)
+        await insert_ignore(session, Participant, [{"participant_id": pid} for pid in participant_ids])
+        await session.execute(insert(Big5Score), rows)
+        await session.commit()
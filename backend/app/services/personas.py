@@ -1,14 +1,15 @@
 from __future__ import annotations
-from pathlib import Path
-from typing import Dict, List, Optional
+import json
+from typing import Dict, Iterable, List, Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.models import Big5Score
+from app.services.cache import Cache
+from app.services.prompts import get_registry
 
-PROMPTS_DIR = Path(__file__).resolve().parents[1] / "prompts"
-CREATIVE_PROFILE_PATH = PROMPTS_DIR / "creative_profile.json"
+CREATIVE_PROFILE = "creative_profile.json"
 
 def _clamp(v: int, lo: int = 10, hi: int = 50) -> int:
     return max(lo, min(hi, v))
@@ -17,9 +18,8 @@ def _mid() -> Dict[str, int]:
     return {"O": 30, "C": 30, "E": 30, "A": 30, "N": 30}
 
 def _read_creative_profile() -> Dict:
-    import json
-    if CREATIVE_PROFILE_PATH.exists():
-        data = json.loads(CREATIVE_PROFILE_PATH.read_text(encoding="utf-8"))
+    data = get_registry().data(CREATIVE_PROFILE)
+    if data is not None:
         persona = data.get("persona") or data
         guidance = data.get("guidance") or (
             "Favor unconventional, high-variance ideas; tolerate ambiguity; "
@@ -34,17 +34,22 @@ def _read_creative_profile() -> Dict:
     }
 
 async def _load_user_scores(participant_id: str, session: AsyncSession) -> Optional[Dict[str, int]]:
-    stmt = select(Big5Score).where(Big5Score.participant_id == participant_id).order_by(Big5Score.created_at.desc())
+    # served by ix_big5_scores_participant_created; id breaks same-timestamp ties
+    stmt = (
+        select(Big5Score.O, Big5Score.C, Big5Score.E, Big5Score.A, Big5Score.N)
+        .where(Big5Score.participant_id == participant_id)
+        .order_by(Big5Score.created_at.desc(), Big5Score.id.desc())
+        .limit(1)
+    )
     res = await session.execute(stmt)
-    row = res.scalars().first()
+    row = res.first()
     if not row:
         return None
     return {"O": row.O, "C": row.C, "E": row.E, "A": row.A, "N": row.N}
 
-async def personas_for_participant(participant_id: str, session: AsyncSession) -> List[Dict]:
-    scores = await _load_user_scores(participant_id, session)
+def personas_from_traits(mirror: Dict[str, int]) -> List[Dict]:
+    """The four condition personas (CONDITION_ORDER) for a known O/C/E/A/N profile."""
     base = _mid()
-    mirror = scores or base
     comp = {k: _clamp(60 - v) for k, v in mirror.items()}
     creative = _read_creative_profile()
     version = "v1"
@@ -54,3 +59,32 @@ async def personas_for_participant(participant_id: str, session: AsyncSession) -
         {"type": "comp",     "persona": comp,   "guidance": None,                 "version": version},
         {"type": "creative", "persona": creative["persona"], "guidance": creative["guidance"], "version": creative["version"]},
     ]
+
+def persona_cache_key(participant_id: str) -> str:
+    # the prompt version is part of the key: a reloaded creative profile misses
+    return f"personas:{get_registry().version}:{participant_id}"
+
+async def personas_for_participant(
+    participant_id: str,
+    session: AsyncSession,
+    cache: Optional[Cache] = None,
+) -> List[Dict]:
+    """
+    Read-through: with a cache, the persona set is computed from the latest
+    Big5Score once and then served without a database round trip until
+    invalidate_personas() runs for this participant (on re-score) or it expires.
+    """
+    key = persona_cache_key(participant_id)
+    if cache is not None:
+        hit = await cache.get(key)
+        if hit is not None:
+            return json.loads(hit)
+    scores = await _load_user_scores(participant_id, session)
+    personas = personas_from_traits(scores or _mid())
+    if cache is not None:
+        await cache.set(key, json.dumps(personas, separators=(",", ":")))
+    return personas
+
+async def invalidate_personas(cache: Cache, participant_ids: Iterable[str]) -> None:
+    for participant_id in set(participant_ids):
+        await cache.delete(persona_cache_key(participant_id))
@@ -0,0 +1,153 @@
+# app/services/prompts.py
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+PROMPTS_DIR = Path(__file__).resolve().parents[1] / "prompts"
+
+TRAIT_LABELS = (
+    ("O", "Openness"),
+    ("C", "Conscientiousness"),
+    ("E", "Extraversion"),
+    ("A", "Agreeableness"),
+    ("N", "Neuroticism"),
+)
+_SLOT = re.compile(r"(%s): \(dynamic\)" % "|".join(label for _, label in TRAIT_LABELS))
+_KEY_FOR_LABEL = {label: key for key, label in TRAIT_LABELS}
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    A prompt file split once around its "<Trait>: (dynamic)" slots.
+    parts has one more element than slots; render() interleaves them.
+    """
+    name: str
+    text: str
+    parts: tuple[str, ...]
+    slots: tuple[tuple[str, str], ...]  # (trait key, label)
+
+    @classmethod
+    def compile(cls, name: str, text: str) -> "PromptTemplate":
+        parts, slots, pos = [], [], 0
+        for m in _SLOT.finditer(text):
+            parts.append(text[pos:m.start()])
+            slots.append((_KEY_FOR_LABEL[m.group(1)], m.group(1)))
+            pos = m.end()
+        parts.append(text[pos:])
+        return cls(name, text, tuple(parts), tuple(slots))
+
+    def render(self, persona: Optional[Mapping[str, int]]) -> str:
+        if not persona or not self.slots:
+            return self.text
+        out = [self.parts[0]]
+        for (key, label), tail in zip(self.slots, self.parts[1:]):
+            value = persona.get(key)
+            # traits missing from the persona keep their placeholder
+            out.append(f"{label}: {value}" if value is not None else f"{label}: (dynamic)")
+            out.append(tail)
+        return "".join(out)
+
+    def render_prefixed(self, persona: Optional[Mapping[str, int]]) -> str:
+        """
+        Same content as render(), laid out for provider-side prompt caching:
+        the template text comes first byte-for-byte (slots left as
+        "(dynamic)") and the trait values follow at the end, so every
+        participant's prompt shares the whole template as a common prefix.
+        """
+        if not persona or not self.slots:
+            return self.text
+        values = "\n".join(
+            f"{label}: {persona[key]};" for key, label in self.slots if persona.get(key) is not None
+        )
+        if not values:
+            return self.text
+        return f"{self.text.rstrip()}\n\n# PERSONALITY VALUES (fill the (dynamic) traits above)\n{values}\n"
+
+
+@dataclass(frozen=True)
+class PromptSnapshot:
+    version: str
+    templates: Mapping[str, PromptTemplate]
+    data: Mapping[str, Any]
+
+
+def _load(directory: Path) -> PromptSnapshot:
+    templates: Dict[str, PromptTemplate] = {}
+    data: Dict[str, Any] = {}
+    digest = hashlib.sha256()
+    for path in sorted(directory.iterdir()):
+        if not path.is_file():
+            continue
+        raw = path.read_bytes()
+        digest.update(path.name.encode() + b"\0" + raw + b"\0")
+        if path.suffix == ".txt":
+            templates[path.name] = PromptTemplate.compile(path.name, raw.decode("utf-8"))
+        elif path.suffix == ".json":
+            data[path.name] = json.loads(raw)
+    return PromptSnapshot(
+        version=digest.hexdigest()[:12],
+        templates=MappingProxyType(templates),
+        data=MappingProxyType(data),
+    )
+
+
+class PromptRegistry:
+    """
+    All files under app/prompts, loaded once and compiled in memory.
+    refresh() compares file mtimes and swaps in a new snapshot in one
+    assignment, so readers never see a half-loaded set. A reload that
+    fails (e.g. a JSON file mid-edit) keeps the previous snapshot.
+    """
+    def __init__(self, directory: Path = PROMPTS_DIR) -> None:
+        self.directory = directory
+        self._mtimes = self._scan()
+        self._snapshot = _load(directory)
+        self.reloads = 0
+
+    def _scan(self) -> Dict[str, int]:
+        return {p.name: p.stat().st_mtime_ns for p in self.directory.iterdir() if p.is_file()}
+
+    @property
+    def version(self) -> str:
+        return self._snapshot.version
+
+    def template(self, name: str) -> Optional[PromptTemplate]:
+        return self._snapshot.templates.get(name)
+
+    def data(self, name: str) -> Any:
+        """Parsed JSON file; a private copy, so callers may mutate it."""
+        value = self._snapshot.data.get(name)
+        return copy.deepcopy(value) if value is not None else None
+
+    def refresh(self) -> bool:
+        mtimes = self._scan()
+        if mtimes == self._mtimes:
+            return False
+        snapshot = _load(self.directory)
+        self._snapshot, self._mtimes = snapshot, mtimes
+        self.reloads += 1
+        return True
+
+    async def watch(self, interval_s: float) -> None:
+        # stat/read run in a thread so the event loop never blocks on disk
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                pass
+
+
+@lru_cache
+def get_registry() -> PromptRegistry:
+    return PromptRegistry()
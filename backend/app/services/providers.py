@@ -0,0 +1,72 @@
+# app/services/providers.py
+from __future__ import annotations
+
+from typing import Callable, Optional
+
+Delta = Optional[Callable[[str], None]]
+
+
+def mock_text(user_prompt: str) -> str:
+    return f"[MOCKED]\n{user_prompt[:160]}..."
+
+
+def _usage_dict(usage) -> dict:
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) if usage else 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) if usage else 0,
+    }
+
+
+class LLMProvider:
+    """
+    One chat completion per complete() call. `request` holds the
+    llm.chat_request() parameters; the result is {"text", "model", "usage"}.
+    With on_delta the provider streams and reports each text chunk.
+    remote=False providers skip admission and timeouts in the caller.
+    """
+    name = "base"
+    remote = True
+
+    async def complete(self, request: dict, on_delta: Delta = None) -> dict:
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI, or any OpenAI-compatible server (LLM_BASE_URL), through an AsyncOpenAI client."""
+    def __init__(self, client, name: str = "openai") -> None:
+        self.client = client
+        self.name = name
+
+    async def complete(self, request: dict, on_delta: Delta = None) -> dict:
+        if on_delta is None:
+            resp = await self.client.chat.completions.create(**request)
+            return {
+                "text": (resp.choices[0].message.content or "").strip(),
+                "model": getattr(resp, "model", request["model"]),
+                "usage": _usage_dict(getattr(resp, "usage", None)),
+            }
+        stream = await self.client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True},
+        )
+        parts, model, usage = [], request["model"], None
+        async for chunk in stream:
+            model = getattr(chunk, "model", None) or model
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+        return {"text": "".join(parts).strip(), "model": model, "usage": _usage_dict(usage)}
+
+
+class MockProvider(LLMProvider):
+    """Inline stand-in when no endpoint is configured: echoes the prompt instantly."""
+    name = "mock"
+    remote = False
+
+    async def complete(self, request: dict, on_delta: Delta = None) -> dict:
+        text = mock_text(request["messages"][-1]["content"])
+        if on_delta:
+            on_delta(text)
+        return {"text": text, "model": "mock", "usage": {"prompt_tokens": 0, "completion_tokens": 0}}
@@ -0,0 +1,137 @@
+# app/services/ratelimit.py
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+
+class AdmissionTimeout(TimeoutError):
+    """The call could not be admitted before its deadline."""
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at per_minute / 60 per second.
+    reserve() debits immediately (the balance may go negative) and returns
+    how long the caller must wait, so concurrent callers queue in FIFO order
+    without a background refill task.
+    """
+    def __init__(self, per_minute: float, capacity: Optional[float] = None) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)  # never wait for more than a full bucket
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+class Admission:
+    """
+    Admission control for outbound LLM calls: at most max_in_flight at once,
+    plus optional requests/min and tokens/min buckets (0 disables each).
+    Callers pass an absolute time.monotonic() deadline; if the bucket wait
+    or the semaphore would run past it they get AdmissionTimeout instead of
+    queueing forever.
+    """
+    def __init__(self, max_in_flight: int, rpm: float = 0, tpm: float = 0) -> None:
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def _semaphore(self) -> Optional[asyncio.Semaphore]:
+        if self.max_in_flight <= 0:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem, self._sem_loop = asyncio.Semaphore(self.max_in_flight), loop
+        return self._sem
+
+    def _reserve(self, cost_tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(cost_tokens))
+        return wait
+
+    def _refund(self, cost_tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.refund(1)
+        if self.tokens is not None:
+            self.tokens.refund(cost_tokens)
+
+    @asynccontextmanager
+    async def slot(self, cost_tokens: int, deadline: float) -> AsyncIterator[None]:
+        sem = self._semaphore()
+        t0 = time.monotonic()
+        self.waiting += 1
+        try:
+            wait = self._reserve(cost_tokens)
+            if t0 + wait > deadline:
+                self._refund(cost_tokens)
+                self.rejected += 1
+                raise AdmissionTimeout(f"rate limit wait {wait:.1f}s exceeds deadline")
+            try:
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if sem is not None:
+                    try:
+                        await asyncio.wait_for(sem.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+                    except asyncio.TimeoutError:
+                        self.rejected += 1
+                        raise AdmissionTimeout("no free LLM slot before deadline") from None
+            except (TimeoutError, asyncio.CancelledError):
+                # the call never goes out: give its bucket reservation back
+                self._refund(cost_tokens)
+                raise
+        finally:
+            self.waiting -= 1
+
+        waited_ms = (time.monotonic() - t0) * 1000
+        self.admitted += 1
+        self.wait_ms_total += waited_ms
+        self.wait_ms_max = max(self.wait_ms_max, waited_ms)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if sem is not None:
+                sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "queueDepth": self.waiting,
+            "inFlight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "waitMsAvg": round(self.wait_ms_total / self.admitted, 1) if self.admitted else 0.0,
+            "waitMsMax": round(self.wait_ms_max, 1),
+        }
+
+
+def estimate_tokens(system_prompt: str, user_prompt: str, max_tokens: int) -> int:
+    """Rough TPM cost: ~4 chars per prompt token plus the full completion budget."""
+    return (len(system_prompt) + len(user_prompt)) // 4 + max_tokens
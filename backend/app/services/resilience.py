@@ -0,0 +1,126 @@
+# app/services/resilience.py
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.services.ratelimit import AdmissionTimeout
+
+T = TypeVar("T")
+
+_RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429s, 5xx, timeouts and connection drops; never our own admission deadline."""
+    if isinstance(exc, AdmissionTimeout):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in _RETRY_STATUS
+    # openai.APIConnectionError / APITimeoutError carry no status code
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class LatencyWindow:
+    """Sliding window of recent successful call latencies (seconds)."""
+    def __init__(self, size: int = 200, min_samples: int = 20) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+
+class Resilience:
+    """
+    Retries with decorrelated jitter (sleep = min(cap, U(base, prev * 3)))
+    and a hedged second attempt once the first has run longer than the
+    hedge_percentile of recent latencies. Everything stops at the caller's
+    time.monotonic() deadline: a retry whose backoff would cross it is not
+    attempted and the last error is raised instead.
+    """
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_s: float = 0.25,
+        cap_s: float = 4.0,
+        hedge_percentile: float = 95,
+    ) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.base_s = base_s
+        self.cap_s = cap_s
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyWindow()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def call(self, fn: Callable[[], Awaitable[T]], deadline: float, hedge: bool = True) -> T:
+        sleep = self.base_s
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await self._hedged(fn, deadline, hedge)
+            except Exception as e:
+                if attempt >= self.max_attempts or not is_retryable(e):
+                    raise
+                sleep = min(self.cap_s, random.uniform(self.base_s, sleep * 3))
+                if time.monotonic() + sleep >= deadline:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(sleep)
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]], deadline: float, hedge: bool) -> T:
+        threshold = self.latency.percentile(self.hedge_percentile) if hedge and self.hedge_percentile > 0 else None
+        started = {}
+        t0 = time.monotonic()
+        first = asyncio.ensure_future(fn())
+        started[first] = t0
+        pending = {first}
+        try:
+            if threshold is not None and t0 + threshold < deadline:
+                done, _ = await asyncio.wait(pending, timeout=threshold)
+                if not done:
+                    self.hedges += 1
+                    second = asyncio.ensure_future(fn())
+                    started[second] = time.monotonic()
+                    pending.add(second)
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.add(time.monotonic() - started[task])
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        p = self.latency.percentile(self.hedge_percentile) if self.hedge_percentile > 0 else None
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedgeWins": self.hedge_wins,
+            "hedgeAfterMs": round(p * 1000) if p is not None else None,
+        }
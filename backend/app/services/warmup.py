@@ -0,0 +1,103 @@
+# app/services/warmup.py
+from __future__ import annotations
+
+import asyncio
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import settings
+from app.db import get_sessionmaker
+from app.models import Task
+from app.services.llm import generate_four, task_inputs
+from app.services.personas import personas_from_traits
+
+TaskLoader = Callable[[], Awaitable[List[Task]]]
+
+
+async def load_study_tasks(sessions: Optional[async_sessionmaker] = None) -> List[Task]:
+    """The first TASKS_STYLE_A style-A and TASKS_STYLE_B style-B tasks, by ordinal."""
+    async with (sessions or get_sessionmaker())() as session:
+        res = await session.execute(select(Task).order_by(Task.ordinal))
+        tasks = res.scalars().all()
+    style_a = [t for t in tasks if t.style.upper() == "A"][: settings.TASKS_STYLE_A]
+    style_b = [t for t in tasks if t.style.upper() == "B"][: settings.TASKS_STYLE_B]
+    return style_a + style_b
+
+
+class WarmupQueue:
+    """
+    Pre-generates every study task for a participant right after scoring,
+    so /generate-task is a cache hit by the time the respondent gets there.
+    A fixed pool of workers bounds concurrency; submit() never waits and
+    drops the job when the queue is full. Cache keys are the same ones the
+    live route uses, and in-flight coalescing in generate_four means a live
+    request racing a warm-up for the same task waits on it instead of
+    generating twice.
+    """
+    def __init__(self, concurrency: int, maxsize: int, load_tasks: TaskLoader = load_study_tasks) -> None:
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self.load_tasks = load_tasks
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [asyncio.create_task(self._worker(self._queue)) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def submit(self, participant_id: str, traits: Dict[str, int]) -> bool:
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait((participant_id, dict(traits)))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            participant_id, traits = await queue.get()
+            try:
+                await self._warm(participant_id, traits)
+                self.completed += 1
+            except Exception:
+                self.failed += 1  # best effort: the live request will generate
+            finally:
+                queue.task_done()
+
+    async def _warm(self, participant_id: str, traits: Dict[str, int]) -> None:
+        personas = personas_from_traits(traits)
+        for task in await self.load_tasks():
+            # the live route's style and prompt: its cache keys cannot tell them apart
+            style, prompt_text = task_inputs(task.task_id, task.prompt_text)
+            await generate_four(personas, participant_id, task.task_id, style, prompt_text)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+@lru_cache
+def get_warmup() -> WarmupQueue:
+    return WarmupQueue(settings.WARMUP_CONCURRENCY, settings.WARMUP_QUEUE_SIZE)
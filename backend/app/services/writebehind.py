@@ -0,0 +1,119 @@
+# app/services/writebehind.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+BatchWriter = Callable[[List[Any]], Awaitable[None]]
+
+_STOP = object()
+
+
+class WriteBehind:
+    """
+    Write-behind queue: put() hands a row to a background task and returns
+    immediately, so persistence never adds latency to a request. The task
+    writes rows in batches of up to max_batch, or whatever arrived within
+    flush_interval_s of the first queued row. A failing batch is retried
+    with exponential backoff before it is dropped. stop() drains the queue.
+    put() also drops (and counts) rows when the queue is full or the writer
+    was never started.
+    """
+    def __init__(
+        self,
+        write_batch: BatchWriter,
+        max_batch: int = 200,
+        flush_interval_s: float = 1.0,
+        maxsize: int = 10_000,
+        max_retries: int = 5,
+        retry_base_s: float = 0.5,
+    ) -> None:
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.flush_interval_s = flush_interval_s
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.retry_base_s = retry_base_s
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.retries = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = asyncio.create_task(self._run(self._queue))
+
+    async def stop(self) -> None:
+        if self._queue is None or self._task is None:
+            return
+        queue, task = self._queue, self._task
+        self._queue = None  # refuse new rows; flush what is already queued
+        await queue.put(_STOP)
+        await task
+        self._task = None
+
+    def put(self, row: Any) -> bool:
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        stopping = False
+        while not stopping:
+            first = await queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            flush_at = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.max_batch:
+                timeout = flush_at - time.monotonic()
+                try:
+                    item = queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # drain anything still queued behind the stop marker
+        rest = []
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item is not _STOP:
+                rest.append(item)
+        for i in range(0, len(rest), self.max_batch):
+            await self._flush(rest[i:i + self.max_batch])
+
+    async def _flush(self, batch: List[Any]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.write_batch(batch)
+            except Exception:
+                if attempt == self.max_retries:
+                    self.dropped += len(batch)
+                    return
+                self.retries += 1
+                await asyncio.sleep(self.retry_base_s * 2 ** attempt)
+            else:
+                self.written += len(batch)
+                self.batches += 1
+                return
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,5 @@
+# bench/asgi.py
+# The study app as benchmarked, served in-process by bench.run or by
+# `uvicorn bench.asgi:app`. Kept as its own module so the benchmark can wrap
+# the app without touching app.main.
+from app.main import app  # noqa: F401
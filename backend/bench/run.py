@@ -0,0 +1,341 @@
+# bench/run.py
+import argparse, asyncio, json, math, os, platform, random, socket, subprocess, sys, tempfile, time
+from pathlib import Path
+
+import httpx
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+# benchmarked as a migrated copy, so the app's own schema upgrade runs like on a real deployment
+SHIPPED_DB = BASE_DIR / "study.db"
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+SCENARIOS = ("generate", "score", "export")
+# p95 latency up, or throughput down, by more than this share of the baseline is a regression
+DEFAULT_THRESHOLD = 0.15
+TRAIT_FIELDS = ("trait_openness", "trait_conscientiousness", "trait_extraversion",
+                "trait_agreeableness", "trait_neuroticism")
+
+# ----------------- measuring -----------------
+def percentile(ordered, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[min(len(ordered), max(1, rank)) - 1]
+
+def summarize(latencies_s, errors: int, elapsed_s: float) -> dict:
+    ordered = sorted(latencies_s)
+    ms = lambda s: round(s * 1000, 2)
+    return {
+        "requests": len(ordered) + errors,
+        "errors": errors,
+        "elapsedS": round(elapsed_s, 3),
+        "rps": round(len(ordered) / elapsed_s, 2) if elapsed_s > 0 else 0.0,
+        "p50Ms": ms(percentile(ordered, 50)),
+        "p95Ms": ms(percentile(ordered, 95)),
+        "p99Ms": ms(percentile(ordered, 99)),
+        "meanMs": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+    }
+
+async def run_load(client: httpx.AsyncClient, make_request, n: int, concurrency: int) -> dict:
+    """
+    Closed loop: `concurrency` simulated participants send n requests in
+    total, each waiting for its response (body included) before the next.
+    make_request(i) returns (method, url, httpx kwargs); >= 400 counts as an error.
+    """
+    latencies, errors = [], 0
+    todo = iter(range(n))
+
+    async def participant():
+        nonlocal errors
+        for i in todo:
+            method, url, kwargs = make_request(i)
+            t0 = time.perf_counter()
+            try:
+                resp = await client.request(method, url, **kwargs)
+                ok = resp.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[participant() for _ in range(concurrency)])
+    return summarize(latencies, errors, time.perf_counter() - t0)
+
+# ----------------- scenarios -----------------
+def _task_body(pid: str) -> dict:
+    rng = random.Random(pid)  # the same participant always sends the same traits
+    return {"participantId": pid, "taskId": "bench-task", "taskPrompt": "Pitch a product for remote teams.",
+            **{f: rng.randint(10, 50) for f in TRAIT_FIELDS}}
+
+def generate_requests(tag: str, hit_ratio: float, warm_ids, seed: int):
+    """/generate-task where a hit_ratio share of requests repeat an already generated participant."""
+    rng = random.Random(seed)
+
+    def make(i):
+        pid = rng.choice(warm_ids) if warm_ids and rng.random() < hit_ratio else f"{tag}-cold-{i}"
+        return "POST", "/api/generate-task", {"json": _task_body(pid)}
+    return make
+
+def score_requests(tag: str, seed: int):
+    rng = random.Random(seed)
+    return lambda i: ("POST", "/api/score-big5",
+                      {"json": {"participantId": f"{tag}-{i}", "answers": [rng.randint(1, 5) for _ in range(50)]}})
+
+def export_requests(fmt: str):
+    return lambda i: ("GET", f"/api/export/generations.{fmt}", {})
+
+async def sweep(client: httpx.AsyncClient, args, log=print) -> list:
+    results = []
+    for scenario in args.scenarios:
+        for conc in args.concurrency:
+            levels = args.hit_ratio if scenario == "generate" else [None]
+            for hit in levels:
+                tag = f"{scenario}-c{conc}-h{hit}-{args.seed}"
+                if scenario == "generate":
+                    warm_ids = [f"{tag}-warm-{j}" for j in range(args.warm_participants)] if hit else []
+                    if warm_ids:
+                        # not measured: fills the cache the hit_ratio share then reuses
+                        warm = lambda j: ("POST", "/api/generate-task", {"json": _task_body(warm_ids[j])})
+                        await run_load(client, warm, len(warm_ids), conc)
+                    make, n = generate_requests(tag, hit, warm_ids, args.seed), args.requests
+                elif scenario == "score":
+                    make, n = score_requests(tag, args.seed), args.requests
+                else:
+                    make, n = export_requests(args.export_format), args.export_requests
+                res = {"scenario": scenario, "concurrency": conc, "hitRatio": hit} | await run_load(client, make, n, conc)
+                results.append(res)
+                log(_row(res))
+    return results
+
+# ----------------- baselines -----------------
+def _key(res: dict) -> tuple:
+    return res["scenario"], res["concurrency"], res["hitRatio"]
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """Regression messages for every result that got slower, lost throughput or started failing."""
+    base = {_key(r): r for r in baseline["results"]}
+    out = []
+    for cur in current["results"]:
+        old = base.get(_key(cur))
+        if old is None:
+            continue
+        name = "{} c={} hit={}".format(*_key(cur))
+        if old["p95Ms"] > 0 and cur["p95Ms"] > old["p95Ms"] * (1 + threshold):
+            out.append(f"{name}: p95 {old['p95Ms']} -> {cur['p95Ms']} ms")
+        if old["rps"] > 0 and cur["rps"] < old["rps"] * (1 - threshold):
+            out.append(f"{name}: throughput {old['rps']} -> {cur['rps']} req/s")
+        if cur["errors"] > old["errors"]:
+            out.append(f"{name}: errors {old['errors']} -> {cur['errors']}")
+    return out
+
+def _baseline_path(name: str) -> Path:
+    path = Path(name)
+    return path if path.suffix == ".json" else BASELINE_DIR / f"{name}.json"
+
+def _row(res: dict) -> str:
+    hit = "-" if res["hitRatio"] is None else f"{res['hitRatio']:.2f}"
+    return (f"{res['scenario']:<9} c={res['concurrency']:<4} hit={hit:<5} {res['rps']:>9.1f} req/s  "
+            f"p50 {res['p50Ms']:>8.1f}  p95 {res['p95Ms']:>8.1f}  p99 {res['p99Ms']:>8.1f} ms  "
+            f"errors {res['errors']}/{res['requests']}")
+
+# ----------------- running the app -----------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _spawn(cmd) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=BASE_DIR)
+
+async def _wait_ready(url: str, proc: subprocess.Popen, timeout_s: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                sys.exit(f"{url}: process exited with {proc.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    sys.exit(f"{url}: not ready after {timeout_s:.0f}s")
+
+def _stop(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+def _copy_shipped_db(dest: Path) -> None:
+    # SQLite backup API from a read-only connection: the shipped file is never written
+    import sqlite3
+    src = sqlite3.connect(f"file:{SHIPPED_DB}?mode=ro", uri=True)
+    dst = sqlite3.connect(dest)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+async def prepare_db(path: Path, export_rows: int) -> None:
+    """
+    A copy of the shipped study.db brought up to date by app.db.init_db, the
+    same migration the server runs at startup, plus the cached_responses
+    rows the export scenario reads.
+    """
+    from sqlalchemy import insert
+    from app.db import build_engine, init_db
+    from app.models import CachedResponse
+
+    if SHIPPED_DB.exists():
+        _copy_shipped_db(path)
+    engine = build_engine(f"sqlite+aiosqlite:///{path}")
+    await init_db(engine)
+    async with engine.begin() as conn:
+        rows = [{
+            "participant_id": f"export-{i // 4}", "task_id": "bench-task", "condition": "baseline",
+            "response_id": f"r{i}", "system_prompt": "system", "user_prompt": "user", "prompt_text": "user",
+            "text": json.dumps({"narrative": "idea " * 40, "score": i}), "model": "mock",
+            "tokens_in": 100, "tokens_out": 40, "latency_ms": 800,
+        } for i in range(export_rows)]
+        for start in range(0, len(rows), 1000):
+            await conn.execute(insert(CachedResponse), rows[start:start + 1000])
+    await engine.dispose()
+
+def _client(**kwargs) -> httpx.AsyncClient:
+    # generous: a request queued behind admission can take up to TIMEOUT_S
+    return httpx.AsyncClient(timeout=httpx.Timeout(120.0), **kwargs)
+
+async def _in_process(args) -> list:
+    from bench.asgi import app
+    async with app.router.lifespan_context(app):
+        async with _client(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            return await sweep(client, args)
+
+async def _uvicorn(args) -> list:
+    port = _free_port()
+    proc = _spawn([sys.executable, "-m", "uvicorn", "bench.asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(args.workers), "--log-level", "warning"])
+    try:
+        await _wait_ready(f"http://127.0.0.1:{port}/api/health", proc)
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with _client(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+            return await sweep(client, args)
+    finally:
+        _stop(proc)
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        mock_port = _free_port()
+        mock_url = f"http://127.0.0.1:{mock_port}"
+        db_path = Path(tmp) / "bench.db"
+        # before anything reads app settings; uvicorn workers inherit them
+        os.environ.update({
+            "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+            "LLM_PROVIDER": "openai",
+            "LLM_BASE_URL": f"{mock_url}/v1",
+            "WARMUP_ENABLED": "false",
+            "PROMPT_RELOAD_S": "0",
+        })
+        await prepare_db(db_path, args.export_rows if "export" in args.scenarios else 0)
+        mock = _spawn([sys.executable, "-m", "app.mock_llm", "--port", str(mock_port),
+                       "--latency-ms", str(args.llm_latency_ms), "--latency-sigma", str(args.llm_latency_sigma),
+                       "--rate-429", str(args.llm_rate_429), "--seed", str(args.seed)])
+        try:
+            await _wait_ready(f"{mock_url}/stats", mock)
+            print(f"mode={args.mode} workers={args.workers if args.mode == 'uvicorn' else 1} "
+                  f"llm latency {args.llm_latency_ms} ms (sigma {args.llm_latency_sigma})")
+            results = await (_in_process(args) if args.mode == "inproc" else _uvicorn(args))
+            async with httpx.AsyncClient() as client:
+                llm_stats = (await client.get(f"{mock_url}/stats")).json()
+        finally:
+            _stop(mock)
+    meta = {
+        "mode": args.mode,
+        "workers": args.workers if args.mode == "uvicorn" else 1,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "llmLatencyMs": args.llm_latency_ms,
+        "llmLatencySigma": args.llm_latency_sigma,
+        "llmRate429": args.llm_rate_429,
+        "seed": args.seed,
+        "llmCalls": llm_stats,
+    }
+    return {"meta": meta, "results": results}
+
+# ----------------- CLI -----------------
+def _floats(s: str):
+    return [float(x) for x in s.split(",") if x]
+
+def _ints(s: str):
+    return [int(x) for x in s.split(",") if x]
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Load-test the study API against the local mock LLM")
+    p.add_argument("--mode", choices=["inproc", "uvicorn"], default="inproc",
+                   help="drive the app in-process over the ASGI transport, or over HTTP via uvicorn workers")
+    p.add_argument("--workers", type=int, default=2, help="uvicorn workers (--mode uvicorn); more than one needs REDIS_URL for hit ratios")
+    p.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS),
+                   help="comma-separated subset of " + ",".join(SCENARIOS))
+    p.add_argument("--concurrency", type=_ints, default=[1, 8, 32], help="concurrent participants to sweep")
+    p.add_argument("--hit-ratio", type=_floats, default=[0.0, 0.5, 0.9],
+                   help="share of /generate-task requests for already generated participants")
+    p.add_argument("--requests", type=int, default=200, help="measured requests per generate/score step")
+    p.add_argument("--warm-participants", type=int, default=20, help="participants generated before a hit-ratio step")
+    p.add_argument("--export-requests", type=int, default=10)
+    p.add_argument("--export-rows", type=int, default=5000)
+    p.add_argument("--export-format", default="csv")
+    p.add_argument("--llm-latency-ms", type=float, default=800.0)
+    p.add_argument("--llm-latency-sigma", type=float, default=0.5)
+    p.add_argument("--llm-rate-429", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--results", type=Path, default=None,
+                   help="compare an existing results file instead of running")
+    p.add_argument("--out", type=Path, default=None, help="write this run's results as JSON")
+    p.add_argument("--save-baseline", metavar="NAME", default=None,
+                   help="store the results as bench/baselines/NAME.json")
+    p.add_argument("--compare", metavar="NAME", default=None,
+                   help="baseline name or .json path; exit 1 on regressions")
+    p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                   help="relative p95/throughput change that counts as a regression")
+    args = p.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        p.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if (args.mode == "uvicorn" and args.workers > 1 and "generate" in args.scenarios and any(args.hit_ratio)
+            and not os.environ.get("REDIS_URL")):
+        # the warm-up step fills one worker's in-process cache; the others would miss
+        p.error("hit ratios across several uvicorn workers need a shared cache: set REDIS_URL, "
+                "or use --workers 1 or --hit-ratio 0")
+    return args
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.results:
+        current = json.loads(args.results.read_text(encoding="utf-8"))
+        for res in current["results"]:
+            print(_row(res))
+    else:
+        current = asyncio.run(run(args))
+    for path in filter(None, [args.out, args.save_baseline and _baseline_path(args.save_baseline)]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(current, indent=2), encoding="utf-8")
+        print(f"Results -> {path}")
+    if args.compare:
+        baseline = json.loads(_baseline_path(args.compare).read_text(encoding="utf-8"))
+        if (baseline["meta"]["mode"], baseline["meta"]["workers"]) != (current["meta"]["mode"], current["meta"]["workers"]):
+            print("warning: baseline was recorded with a different mode/worker count", file=sys.stderr)
+        regressions = compare(baseline, current, args.threshold)
+        for msg in regressions:
+            print(f"REGRESSION {msg}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (threshold {args.threshold:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import batch_generate as cli
+from app.db import Base
+from app.models import Big5Score, CachedResponse, Participant, Task
+from app.services import llm, persistence
+from app.services.cache import Cache
+from app.services.personas import personas_from_traits
+
+TRAITS = {"O": 40, "C": 20, "E": 35, "A": 25, "N": 15}
+
+
+def _sessions():
+    """In-memory SQLite with two style-A tasks and one scored participant."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(Task), [
+                {"task_id": f"t{i}", "style": "A", "prompt_text": f"Task {i}", "ordinal": i} for i in (1, 2)
+            ])
+            await conn.execute(insert(Participant), [{"participant_id": "p1"}])
+            await conn.execute(insert(Big5Score), [{"participant_id": "p1", **TRAITS}])
+
+    asyncio.run(setup())
+    return sessions
+
+
+def test_batch_submit_resume_and_live_path_serves_results(tmp_path, monkeypatch):
+    sessions = _sessions()
+    cache = Cache(None, 3600)
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+    monkeypatch.setattr(cli, "get_cache", lambda: cache)
+    monkeypatch.setattr(llm, "get_cache", lambda: cache)
+    monkeypatch.setattr(llm.settings, "CACHE_CONTENT_KEYS", True)
+    monkeypatch.setattr(llm.settings, "PERSIST_GENERATIONS", False)
+
+    work = tmp_path / "batch"
+    cli.main(["--participants", "p1", "nobody", "--client", "local", "--work-dir", str(work), "--no-wait"],
+             sessions=sessions)
+    assert asyncio.run(cache.get(cache.make_key("p1", "t1", "baseline"))) is None
+    cli.main(["--resume", str(work), "--poll-s", "0"], sessions=sessions)
+
+    manifest = json.loads((work / "manifest.json").read_text(encoding="utf-8"))
+    requests = (work / "input.jsonl").read_text(encoding="utf-8").splitlines()
+    # p1's baseline/creative prompts are the shared ones: one request each
+    assert len(manifest["items"]) == 2 * (2 + 4) and len(requests) == 2 * 4
+
+    calls = []
+
+    async def fake_call(system_prompt, user_prompt, deadline=None, on_delta=None):
+        calls.append(system_prompt)
+        return {"text": "{}", "model": "fake", "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    monkeypatch.setattr(llm, "_call_openai", fake_call)
+
+    async def run():
+        async with sessions() as s:
+            stored = dict((await s.execute(
+                select(CachedResponse.response_id, CachedResponse.task_id).where(CachedResponse.participant_id == "p1")
+            )).all())
+        own = await llm.generate_four(personas_from_traits(TRAITS), "p1", "t1", "A", "Task 1")
+        stranger = personas_from_traits({"O": 10, "C": 10, "E": 10, "A": 10, "N": 10})
+        other = await llm.generate_four(stranger, "p2", "t1", "A", "Task 1")
+        return stored, own, other
+
+    stored, own, other = asyncio.run(run())
+    assert len(stored) == 2 * 4  # a distinct responseId per participant row, shared arms included
+    assert all(r["fromCache"] for r in own) and own[0]["text"].startswith("[MOCKED]")
+    assert all(stored.get(r["responseId"]) == "t1" for r in own)  # the live path returns the persisted ids
+    assert [r.get("fromCache", False) for r in other] == [True, False, False, True]
+    assert len(calls) == 2
+
+
+def test_build_items_match_the_live_route():
+    task = SimpleNamespace(task_id="b1", style="B", prompt_text="Task B")
+    style, prompt_text = llm.task_inputs("b1", "Task B")  # what /generate-task sends for taskPrompt "Task B"
+
+    items = cli.build_items([task], {"p1": TRAITS})
+
+    assert {i.user_prompt for i in items} == {prompt_text}
+    mirror = next(i for i in items if i.participant_id == "p1" and i.condition == "mirror")
+    assert mirror.system_prompt == llm.system_prompt_for(style, "mirror", TRAITS)
+
+
+def test_build_items_skip_generations_already_shown():
+    task = SimpleNamespace(task_id="t1", style="A", prompt_text="Task 1")
+
+    items = cli.build_items([task], {"p1": TRAITS}, generated={("p1", "t1", "mirror")})
+
+    assert sorted(i.condition for i in items if i.participant_id == "p1") == ["baseline", "comp", "creative"]
+
+
+def test_load_results_keeps_live_generations_and_does_not_expire(monkeypatch):
+    from app.services import batch
+
+    cache = Cache(None, 3600)
+    stored = []
+
+    async def fake_insert(rows):
+        stored.extend(rows)
+
+    monkeypatch.setattr(batch, "insert_generations", fake_insert)
+    monkeypatch.setattr(llm.settings, "BATCH_CACHE_TTL_S", 0)
+    task = SimpleNamespace(task_id="t1", style="A", prompt_text="Task 1")
+    items = cli.build_items([task], {"p1": TRAITS, "p2": TRAITS})
+    results = {i.key: {"text": "batch", "model": "m", "usage": {}} for i in items}
+    live = {"condition": "mirror", "responseId": "live", "text": "shown live"}
+
+    async def run():
+        # p1 generated mirror live after the batch was submitted
+        await cache.set(cache.make_key("p1", "t1", "mirror"), json.dumps(live))
+        loaded = await batch.load_results(items, results, cache)
+        p1 = await llm._get_payloads(cache, {"mirror": cache.make_key("p1", "t1", "mirror")})
+        return loaded, p1
+
+    loaded, p1 = asyncio.run(run())
+
+    assert loaded["skipped"] == 1 and loaded["participantRows"] == 7
+    assert p1["mirror"]["responseId"] == "live"
+    assert not any(r["participant_id"] == "p1" and r["condition"] == "mirror" for r in stored)
+    p2_key = cache.make_key("p2", "t1", "mirror")
+    assert cache.client._data[p2_key][0] is None  # no expiry: loaded well before it is used
@@ -0,0 +1,48 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from bench.run import compare, percentile, run_load
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert [percentile(values, p) for p in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert percentile([], 95) == 0.0
+
+
+def test_run_load_counts_requests_and_errors():
+    app = FastAPI()
+
+    @app.get("/ok/{i}")
+    async def ok(i: int):
+        if i % 5 == 0:
+            raise HTTPException(status_code=500)
+        return {"i": i}
+
+    @app.get("/fail")
+    async def fail():
+        raise ValueError("boom")
+
+    async def run():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            good = await run_load(client, lambda i: ("GET", f"/ok/{i}", {}), 20, 4)
+            bad = await run_load(client, lambda i: ("GET", "/fail", {}), 3, 2)
+        return good, bad
+
+    good, bad = asyncio.run(run())
+    assert good["requests"] == 20 and good["errors"] == 4 and good["rps"] > 0  # i = 0, 5, 10, 15
+    assert bad["requests"] == 3 and bad["errors"] == 3
+
+
+def test_compare_flags_slower_p95_lower_throughput_and_new_errors():
+    def doc(p95, rps, errors=0):
+        return {"results": [{"scenario": "generate", "concurrency": 8, "hitRatio": 0.5,
+                             "p95Ms": p95, "rps": rps, "errors": errors}]}
+
+    assert compare(doc(100, 50), doc(110, 48)) == []
+    regressions = compare(doc(100, 50), doc(130, 30, errors=2), threshold=0.15)
+    assert len(regressions) == 3
+    assert regressions[0].startswith("generate c=8 hit=0.5: p95")
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import score_big5 as cli
+from app.routes import scoring
+from app.services.big5 import IPIP_KEY, TRAITS, score_ipip50, score_ipip50_batch, sums_to_dicts
+
+
+def _random_answers(n, seed=0):
+    rng = random.Random(seed)
+    return [[rng.randint(1, 5) for _ in range(50)] for _ in range(n)]
+
+
+def test_batch_matches_single_scorer():
+    answers = _random_answers(200)
+    batch = sums_to_dicts(score_ipip50_batch(answers))
+
+    assert batch == [score_ipip50(a) for a in answers]
+
+
+def test_batch_extremes():
+    hi = [5 if it["key"] == "+" else 1 for it in IPIP_KEY["items"]]
+    lo = [1 if it["key"] == "+" else 5 for it in IPIP_KEY["items"]]
+
+    sums = score_ipip50_batch([hi, lo])
+
+    assert sums.shape == (2, len(TRAITS))
+    assert sums_to_dicts(sums) == [score_ipip50(hi), score_ipip50(lo)]
+
+
+def test_batch_validation():
+    with pytest.raises(ValueError):
+        score_ipip50_batch([[3] * 49])
+    bad = _random_answers(3)
+    bad[2][7] = 0
+    with pytest.raises(ValueError, match="row 2"):
+        score_ipip50_batch(bad)
+
+
+def test_batch_endpoint():
+    app = FastAPI()
+    app.include_router(scoring.router)
+    answers = _random_answers(2, seed=1)
+    items = [{"participantId": "p1", "answers": answers[0]}, {"participantId": "p2", "answers": str(answers[1])}]
+
+    r = TestClient(app).post("/score-big5/batch", json={"items": items})
+
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [x["participantId"] for x in results] == ["p1", "p2"]
+    assert results[1]["traits"]["trait_openness"] == score_ipip50(answers[1])["O"]
+
+
+def test_cli_scores_csv_file(tmp_path):
+    answers = _random_answers(3, seed=2)
+    src = tmp_path / "answers.csv"
+    src.write_text("participant_id," + ",".join(f"q{i}" for i in range(1, 51)) + "\n"
+                   + "".join(f"p{i}," + ",".join(map(str, a)) + "\n" for i, a in enumerate(answers)))
+    out = tmp_path / "scores.csv"
+
+    cli.main([str(src), "--out", str(out)])
+
+    lines = out.read_text().splitlines()
+    assert lines[0] == "participant_id,O,C,E,A,N"
+    expected = score_ipip50(answers[2])
+    assert lines[3] == "p2," + ",".join(str(expected[t]) for t in TRAITS)
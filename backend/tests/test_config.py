@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+from app.config import get_settings, settings
+
+
+def test_importing_the_app_builds_nothing():
+    code = (
+        "import app.main, app.routes.admin, app.routes.export\n"
+        "from app.config import get_settings\n"
+        "from app.db import get_engine\n"
+        "from app.services import llm\n"
+        "print(get_settings.cache_info().currsize, get_engine.cache_info().currsize,"
+        " llm.get_cache.cache_info().currsize, llm.get_client.cache_info().currsize)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert out.stdout.split() == ["0", "0", "0", "0"]
+
+
+def test_settings_proxy_reads_and_writes_the_single_instance(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_TOKENS", 123)
+
+    assert get_settings().LLM_MAX_TOKENS == 123
+    assert settings.LLM_MAX_TOKENS == 123
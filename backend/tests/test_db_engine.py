@@ -0,0 +1,160 @@
+import asyncio
+
+from sqlalchemy import inspect, text
+
+from app.db import TimedQueuePool, build_engine, init_db, pool_stats
+
+# the schema study.db was created with, before any later table or column
+BASELINE_SCHEMA = [
+    """CREATE TABLE participants (participant_id VARCHAR(64) NOT NULL,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL, PRIMARY KEY (participant_id))""",
+    """CREATE TABLE tasks (task_id VARCHAR(64) NOT NULL, style VARCHAR(16) NOT NULL,
+        prompt_text TEXT NOT NULL, ordinal INTEGER NOT NULL, PRIMARY KEY (task_id))""",
+    """CREATE TABLE cached_responses (id INTEGER NOT NULL, participant_id VARCHAR(64) NOT NULL,
+        task_id VARCHAR(64) NOT NULL, condition VARCHAR(16) NOT NULL, response_id VARCHAR(64) NOT NULL,
+        prompt_text TEXT NOT NULL, text TEXT NOT NULL, model VARCHAR(64) NOT NULL, tokens_in INTEGER NOT NULL,
+        tokens_out INTEGER NOT NULL, latency_ms INTEGER NOT NULL,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL, system_prompt TEXT, user_prompt TEXT,
+        PRIMARY KEY (id))""",
+    """CREATE TABLE ratings (id INTEGER NOT NULL, participant_id VARCHAR(64) NOT NULL,
+        task_id VARCHAR(64) NOT NULL, condition VARCHAR(16) NOT NULL, response_id VARCHAR(64) NOT NULL,
+        usefulness INTEGER NOT NULL, novelty INTEGER NOT NULL, shown_slot INTEGER NOT NULL,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL, PRIMARY KEY (id))""",
+    """CREATE TABLE big5_scores (id INTEGER NOT NULL, participant_id VARCHAR(64) NOT NULL,
+        "O" INTEGER NOT NULL, "C" INTEGER NOT NULL, "E" INTEGER NOT NULL, "A" INTEGER NOT NULL,
+        "N" INTEGER NOT NULL, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL, PRIMARY KEY (id),
+        FOREIGN KEY(participant_id) REFERENCES participants (participant_id) ON DELETE CASCADE)""",
+    "INSERT INTO participants (participant_id) VALUES ('p1')",
+    """INSERT INTO big5_scores (participant_id, "O", "C", "E", "A", "N") VALUES ('p1', 40, 20, 30, 35, 25)""",
+]
+
+
+def _baseline_engine(tmp_path):
+    engine = build_engine(f"sqlite+aiosqlite:///{tmp_path / 'study.db'}")
+
+    async def setup():
+        async with engine.begin() as conn:
+            for stmt in BASELINE_SCHEMA:
+                await conn.execute(text(stmt))
+
+    return engine, setup
+
+
+def test_sqlite_file_engine_sets_pragmas_and_pools(tmp_path):
+    engine = build_engine(f"sqlite+aiosqlite:///{tmp_path / 'study.db'}")
+    before = TimedQueuePool.metrics.checkouts
+
+    async def run():
+        async with engine.connect() as conn:
+            mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+            sync = (await conn.execute(text("PRAGMA synchronous"))).scalar()
+            busy = (await conn.execute(text("PRAGMA busy_timeout"))).scalar()
+        stats = pool_stats(engine)
+        await engine.dispose()
+        return mode, sync, busy, stats
+
+    mode, sync, busy, stats = asyncio.run(run())
+
+    assert isinstance(engine.sync_engine.pool, TimedQueuePool)
+    assert (mode, sync, busy) == ("wal", 1, 5000)  # synchronous=NORMAL is 1
+    assert stats["checkouts"] > before and stats["checkedOut"] == 0
+
+
+def test_sqlite_memory_engine_keeps_static_pool():
+    engine = build_engine("sqlite+aiosqlite://")
+
+    assert not isinstance(engine.sync_engine.pool, TimedQueuePool)
+
+
+def test_init_db_migrates_baseline_schema_in_place(tmp_path):
+    engine, setup = _baseline_engine(tmp_path)
+
+    async def run():
+        await setup()
+        await init_db(engine)
+        await init_db(engine)  # idempotent
+        async with engine.connect() as conn:
+            tables = await conn.run_sync(lambda c: set(inspect(c).get_table_names()))
+            columns = await conn.run_sync(lambda c: {
+                t: {col["name"] for col in inspect(c).get_columns(t)} for t in ("big5_scores", "cached_responses")
+            })
+            indexes = await conn.run_sync(lambda c: {i["name"] for i in inspect(c).get_indexes("big5_scores")})
+            kept = (await conn.execute(text('SELECT "O", answers FROM big5_scores'))).one()
+        await engine.dispose()
+        return tables, columns, indexes, kept
+
+    tables, columns, indexes, kept = asyncio.run(run())
+
+    assert {"export_columns", "export_watermarks", "prompt_blobs"} <= tables
+    assert "answers" in columns["big5_scores"]
+    assert {"system_prompt_hash", "user_prompt_hash"} <= columns["cached_responses"]
+    assert "ix_big5_scores_participant_created" in indexes
+    assert tuple(kept) == (40, None)
+
+
+def test_insert_scores_on_migrated_baseline_schema(tmp_path, monkeypatch):
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from app.models import Big5Score
+    from app.services import persistence
+
+    engine, setup = _baseline_engine(tmp_path)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+
+    async def run():
+        await setup()
+        await init_db(engine)
+        await persistence.insert_scores([persistence.score_row("p1", [1] * 50, dict.fromkeys("OCEAN", 10))])
+        async with sessions() as s:
+            stored = (await s.execute(select(Big5Score.O, Big5Score.answers).order_by(Big5Score.id))).all()
+        await engine.dispose()
+        return stored
+
+    # the baseline row stays as history; the new score is a row of its own
+    assert [tuple(r) for r in asyncio.run(run())] == [(40, None), (10, "[" + ",".join(["1"] * 50) + "]")]
+
+
+def test_generation_export_reads_unmigrated_schema_without_prompt_blobs(tmp_path):
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from app.services.exporting import high_water_mark, raw_generation_rows
+
+    engine, setup = _baseline_engine(tmp_path)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def run():
+        await setup()
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "INSERT INTO cached_responses (participant_id, task_id, condition, response_id, prompt_text, text,"
+                " model, tokens_in, tokens_out, latency_ms, system_prompt, user_prompt)"
+                " VALUES ('p1', 't1', 'baseline', 'r1', 'user', '{}', 'm', 1, 2, 3, 'system', 'user')"
+            ))
+        async with sessions() as s:
+            rows = [tuple(r) async for r in raw_generation_rows(s, await high_water_mark(s))]
+        await engine.dispose()
+        return rows
+
+    (row,) = asyncio.run(run())  # PROMPT_BLOBS is off by default: no join, no hash columns
+    assert row[0] == "p1" and row[-4:] == ("system", "user", "user", "{}")
+
+
+def test_rescore_cli_migrates_baseline_schema(tmp_path, monkeypatch):
+    from app import score_big5
+
+    engine, setup = _baseline_engine(tmp_path)
+
+    async def prepare():
+        await setup()
+        await engine.dispose()
+
+    asyncio.run(prepare())
+    monkeypatch.setattr(score_big5.settings, "DATABASE_URL", str(engine.url))
+    out = tmp_path / "scores.csv"
+
+    score_big5.main(["--from-db", "--out", str(out)])  # no big5_scores.answers until init_db runs
+
+    # the baseline score predates stored answers, so there is nothing to re-score
+    assert out.read_text().splitlines() == ["participant_id,O,C,E,A,N"]
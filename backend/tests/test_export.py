@@ -1,52 +1,338 @@
 import asyncio
 import csv
+import gzip
+import io
+import json
 
+import pytest
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models import CachedResponse
 from app.routes.export import export_generations
+from app.services.exporting import merge_dtype, rebuild_registry, register_columns, registry_columns
 
 
-class DummyResult:
-    def __init__(self, rows):
-        self._rows = rows
+def _sessions(rows):
+    """In-memory SQLite with the given cached_responses rows."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
 
-    def all(self):
-        return self._rows
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            if rows:
+                await conn.execute(insert(CachedResponse), rows)
 
+    return sessions, setup
 
-class DummySession:
-    def __init__(self, rows):
-        self._rows = rows
 
-    async def execute(self, _query):
-        return DummyResult(self._rows)
+def _row(**overrides):
+    row = {
+        "participant_id": "participant-1",
+        "task_id": "task-1",
+        "condition": "baseline",
+        "response_id": "resp-1",
+        "model": "gpt-test",
+        "tokens_in": 10,
+        "tokens_out": 20,
+        "latency_ms": 30,
+        "system_prompt": "system",
+        "user_prompt": "user",
+        "prompt_text": "Prompt body",
+        "text": '{"answer":"value"}',
+    }
+    return row | overrides
 
 
-def test_export_generations_includes_prompts():
-    row = (
-        "participant-1",
-        "task-1",
-        "baseline",
-        "resp-1",
-        "gpt-test",
-        10,
-        20,
-        30,
-        "2024-01-01T00:00:00",
-        "system",
-        "user",
-        "Prompt body",
-        '{"answer":"value"}',
-    )
+def _export(rows, columns="scan", before=None, since_id=0):
+    sessions, setup = _sessions(rows)
 
     async def call_export():
-        response = await export_generations(session=DummySession([row]))
+        await setup()
+        if before is not None:
+            async with sessions() as session:
+                await before(session)
+        response = await export_generations(fmt="csv", columns=columns, since_id=since_id, since=None, sessions=sessions)
         chunks = []
         async for chunk in response.body_iterator:
             chunks.append(chunk)
         return "".join(chunks)
 
-    csv_payload = asyncio.run(call_export())
-    reader = list(csv.reader(csv_payload.splitlines()))
+    return list(csv.reader(asyncio.run(call_export()).splitlines()))
+
+
+def test_export_generations_includes_prompts():
+    reader = _export([_row()])
     header, data = reader[0], reader[1]
 
     assert header[9:13] == ["system_prompt", "user_prompt", "prompt_text", "text"]
     assert data[9:13] == ["system", "user", "Prompt body", '{"answer":"value"}']
+
+
+def test_export_generations_flattens_keys_across_rows():
+    reader = _export([
+        _row(text='{"answer":"a","meta":{"score":1}}'),
+        _row(response_id="resp-2", text='{"idea":["x","y"]}'),
+        _row(response_id="resp-3", text="not json"),
+    ])
+    header, rows = reader[0], reader[1:]
+
+    assert header[13:] == ["answer", "meta_score", "idea_0", "idea_1"]
+    assert [r[13:] for r in rows] == [["a", "1", "", ""], ["", "", "x", "y"], ["", "", "", ""]]
+
+
+def test_export_generations_registry_header_comes_from_write_time_registry():
+    rows = [
+        _row(text='{"answer":"a","meta":{"score":1}}'),
+        _row(response_id="resp-2", text='{"idea":["x"],"meta":{"score":1.5}}'),
+    ]
+
+    async def register(session):
+        await register_columns(session, [rows[0]["text"]])
+        await register_columns(session, [rows[1]["text"]])
+        await session.commit()
+        assert await registry_columns(session) == {
+            "answer": "str", "meta_score": "float", "idea_0": "str",
+        }
+
+    reader = _export(rows, columns="registry", before=register)
+
+    assert reader[0][13:] == ["answer", "meta_score", "idea_0"]
+    assert [r[13:] for r in reader[1:]] == [["a", "1", ""], ["", "1.5", "x"]]
+
+
+def test_rebuild_registry_backfills_existing_rows():
+    async def rebuild(session):
+        assert await rebuild_registry(session) == {"answer": "str", "n": "int"}
+
+    reader = _export([_row(text='{"answer":"a","n":null}'), _row(text='{"n":2}')],
+                     columns="registry", before=rebuild)
+
+    assert reader[0][13:] == ["answer", "n"]
+
+
+def test_merge_dtype_widens():
+    assert merge_dtype(None, "int") == "int"
+    assert merge_dtype("int", "null") == "int"
+    assert merge_dtype("null", "bool") == "bool"
+    assert merge_dtype("int", "float") == "float"
+    assert merge_dtype("bool", "int") == "str"
+
+
+def test_export_since_id_returns_only_newer_rows_and_high_water_mark():
+    sessions, setup = _sessions([_row(response_id=f"resp-{i}") for i in range(1, 4)])
+
+    async def call_export():
+        await setup()
+        response = await export_generations(fmt="csv", columns="scan", since_id=2, since=None, sessions=sessions)
+        chunks = [chunk async for chunk in response.body_iterator]
+        return response.headers, "".join(chunks)
+
+    headers, body = asyncio.run(call_export())
+    rows = list(csv.reader(body.splitlines()))[1:]
+
+    assert headers["x-export-high-water-mark"] == "3"
+    assert [r[3] for r in rows] == ["resp-3"]
+
+
+def test_export_csv_append_writes_only_new_rows(tmp_path, monkeypatch):
+    db_url = f"sqlite+aiosqlite:///{tmp_path / 'export.db'}"
+    monkeypatch.setenv("DATABASE_URL", db_url)  # app.config requires it at import
+    from app import export_csv
+
+    monkeypatch.setattr(export_csv.settings, "DATABASE_URL", db_url)
+    engine = create_async_engine(db_url)
+
+    async def add(rows):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(CachedResponse), rows)
+
+    def read():
+        with (tmp_path / "generations.csv").open(newline="", encoding="utf-8") as f:
+            return list(csv.reader(f))
+
+    argv = ["--append", "--out-dir", str(tmp_path)]
+    asyncio.run(add([_row(response_id="resp-1")]))
+    asyncio.run(export_csv.main(argv))
+    asyncio.run(add([_row(response_id="resp-2")]))
+    asyncio.run(export_csv.main(argv))
+
+    assert [r[3] for r in read()[1:]] == ["resp-1", "resp-2"]
+
+    # a key the file has no column for forces a full rewrite
+    asyncio.run(add([_row(response_id="resp-3", text='{"extra":1}')]))
+    asyncio.run(export_csv.main(argv))
+    reader = read()
+
+    assert reader[0][13:] == ["answer", "extra"]
+    assert [r[3] for r in reader[1:]] == ["resp-1", "resp-2", "resp-3"]
+    asyncio.run(engine.dispose())
+
+
+
+def test_export_csv_without_append_leaves_watermarks_alone(tmp_path, monkeypatch):
+    from sqlalchemy import text
+
+    db_url = f"sqlite+aiosqlite:///{tmp_path / 'export.db'}"
+    monkeypatch.setenv("DATABASE_URL", db_url)
+    from app import export_csv
+    from app.models import Big5Score, Participant, Rating
+
+    monkeypatch.setattr(export_csv.settings, "DATABASE_URL", db_url)
+    monkeypatch.setattr(export_csv.settings, "DB_MIGRATE", False)
+    engine = create_async_engine(db_url)
+    study_tables = [m.__table__ for m in (Participant, Big5Score, CachedResponse, Rating)]
+
+    async def setup():
+        # a database from before export_watermarks existed
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda c: Base.metadata.create_all(c, tables=study_tables))
+            await conn.execute(insert(CachedResponse), [_row()])
+
+    async def table_names():
+        async with engine.connect() as conn:
+            res = await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+            names = set(res.scalars())
+        await engine.dispose()
+        return names
+
+    asyncio.run(setup())
+    asyncio.run(export_csv.main(["--out-dir", str(tmp_path), "--workers", "0"]))
+    assert "export_watermarks" not in asyncio.run(table_names())
+    assert len((tmp_path / "generations.csv").read_text().splitlines()) == 2
+
+    monkeypatch.setattr(export_csv.settings, "DB_MIGRATE", True)
+    asyncio.run(export_csv.main(["--out-dir", str(tmp_path), "--workers", "0"]))
+    assert {"export_watermarks", "export_columns", "prompt_blobs"} <= asyncio.run(table_names())
+
+def _export_bytes(rows, fmt):
+    sessions, setup = _sessions(rows)
+
+    async def call_export():
+        await setup()
+        response = await export_generations(fmt=fmt, columns="scan", since_id=0, since=None, sessions=sessions)
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(call_export())
+
+
+def test_export_generations_ndjson_gz_keeps_json_types():
+    body = _export_bytes([_row(text='{"answer":"a","n":2}'), _row(text='{"n":1.5}')], "ndjson.gz")
+    records = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+
+    assert [r["n"] for r in records] == [2, 1.5]
+    assert records[0]["tokens_in"] == 10 and records[1]["answer"] is None
+
+
+def test_export_generations_parquet_is_typed():
+    pq = pytest.importorskip("pyarrow.parquet")
+    import pyarrow as pa
+
+    rows = [_row(text='{"answer":"a","n":2,"ok":true}'), _row(text='{"n":1.5}')]
+    table = pq.read_table(io.BytesIO(_export_bytes(rows, "parquet")))
+
+    assert table.schema.field("tokens_in").type == pa.int64()
+    assert pa.types.is_timestamp(table.schema.field("created_at").type)
+    assert table.schema.field("n").type == pa.float64()
+    assert table.schema.field("ok").type == pa.bool_()
+    assert table.column("n").to_pylist() == [2.0, 1.5]
+
+
+def test_export_generations_arrow_stream_roundtrips():
+    pa = pytest.importorskip("pyarrow")
+
+    table = pa.ipc.open_stream(_export_bytes([_row(), _row(text="not json")], "arrow")).read_all()
+
+    assert table.num_rows == 2
+    assert table.column("answer").to_pylist() == ["value", None]
+
+
+def test_export_csv_process_pool_matches_in_process(tmp_path, monkeypatch):
+    db_url = f"sqlite+aiosqlite:///{tmp_path / 'export.db'}"
+    monkeypatch.setenv("DATABASE_URL", db_url)
+    from app import export_csv
+
+    monkeypatch.setattr(export_csv.settings, "DATABASE_URL", db_url)
+    monkeypatch.setattr(export_csv, "POOL_BATCH_ROWS", 2)
+    engine = create_async_engine(db_url)
+
+    async def add(rows):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(CachedResponse), rows)
+        await engine.dispose()
+
+    asyncio.run(add([_row(response_id=f"resp-{i}", text=f'{{"k{i % 3}":{i}}}') for i in range(7)]))
+
+    outputs = {}
+    for workers in ("0", "2"):
+        out = tmp_path / workers
+        asyncio.run(export_csv.main(["--out-dir", str(out), "--workers", workers]))
+        outputs[workers] = {name: (out / name).read_bytes() for name in ("generations.csv", "ratings.csv", "big5_scores.csv")}
+
+    assert outputs["0"] == outputs["2"]
+    assert outputs["2"]["generations.csv"].decode().splitlines()[0].endswith("k0,k1,k2")
+
+
+def test_prompt_blobs_dedup_and_export_dereferences(monkeypatch):
+    from sqlalchemy import func, select
+
+    from app.config import settings
+    from app.models import PromptBlob
+    from app.services import persistence
+
+    sessions, setup = _sessions([])
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+    monkeypatch.setattr(settings, "PROMPT_BLOBS", True)
+    rows = [
+        _row(participant_id=f"p{i}", response_id=f"r{i}", system_prompt="shared system", user_prompt="Task body",
+             prompt_text="Task body")
+        for i in range(3)
+    ]
+
+    async def run():
+        await setup()
+        await persistence.insert_generations(rows)
+        async with sessions() as s:
+            n_blobs = (await s.execute(select(func.count()).select_from(PromptBlob))).scalar()
+            stored = (await s.execute(select(CachedResponse.system_prompt))).scalars().all()
+        response = await export_generations(fmt="csv", columns="scan", since_id=0, since=None, sessions=sessions)
+        return n_blobs, stored, "".join([c async for c in response.body_iterator])
+
+    n_blobs, stored, body = asyncio.run(run())
+    data = list(csv.reader(body.splitlines()))[1:]
+
+    assert n_blobs == 2 and stored == ["", "", ""]
+    assert [r[9:12] for r in data] == [["shared system", "Task body", "Task body"]] * 3
+
+
+def test_insert_generations_keeps_rows_when_registry_fails(monkeypatch):
+    from sqlalchemy import func, select, text
+
+    from app.services import persistence
+
+    sessions, setup = _sessions([])
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+
+    async def run():
+        await setup()
+        async with sessions() as s:
+            await s.execute(text("DROP TABLE export_columns"))  # a database created before the registry
+            await s.commit()
+        await persistence.insert_generations([_row()])
+        async with sessions() as s:
+            return (await s.execute(select(func.count()).select_from(CachedResponse))).scalar()
+
+    assert asyncio.run(run()) == 1
+
+
+def test_export_routes_are_mounted_on_the_app():
+    from app.main import app
+
+    paths = {route.path for route in app.routes}
+    assert {"/api/export/generations.{fmt}", "/api/export/ratings.{fmt}", "/api/export/big5_scores.{fmt}"} <= paths
@@ -12,3 +12,107 @@ async def _roundtrip():
 
 def test_cache_event_loop():
     asyncio.run(_roundtrip())
+
+def test_lru_evicts_oldest_entry():
+    async def run():
+        c = Cache(None, 3600, max_entries=2)
+        await c.set("a", "1")
+        await c.set("b", "2")
+        await c.get("a")          # a is now most recent
+        await c.set("c", "3")     # evicts b
+        return c, [await c.get(k) for k in ("a", "b", "c")]
+
+    c, got = asyncio.run(run())
+    assert got == ["1", None, "3"]
+    assert c.stats()["evictions"] == 1
+    assert c.stats()["hits"] == 3 and c.stats()["misses"] == 1
+
+def test_byte_budget_and_sweep():
+    async def run():
+        c = Cache(None, 3600, max_bytes=20)
+        await c.set("k1", "x" * 8)
+        await c.set("k2", "x" * 8)    # 20 bytes total, fits
+        await c.set("k3", "x" * 8)    # over budget -> evicts k1
+        assert await c.get("k1") is None
+        assert c.stats()["bytes"] <= 20
+        await c.client.setex("old", -1, "v")  # no TTL
+        await c.client.setex("gone", 1, "v")
+        c.client._data["gone"] = (0.0, "v")    # force-expire
+        assert c.client.sweep() == 1
+        assert "old" in c.client._data
+
+    asyncio.run(run())
+
+def test_get_many_set_many_in_memory():
+    async def run():
+        c = Cache(None, 3600)
+        await c.set_many({"a": "1", "b": "2"})
+        return await c.get_many(["a", "b", "c"])
+
+    assert asyncio.run(run()) == {"a": "1", "b": "2", "c": None}
+
+def test_content_keys_share_generations_across_participants(monkeypatch):
+    from app.services import llm
+
+    calls = []
+
+    async def fake_call(system_prompt, user_prompt, deadline=None, on_delta=None):
+        calls.append(system_prompt)
+        return {"text": "{}", "model": "fake", "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    cache = Cache(None, 3600)
+    monkeypatch.setattr(llm, "_call_openai", fake_call)
+    monkeypatch.setattr(llm, "get_cache", lambda: cache)
+    monkeypatch.setattr(llm.settings, "CACHE_CONTENT_KEYS", True)
+    monkeypatch.setattr(llm.settings, "PERSIST_GENERATIONS", False)
+    same = {"persona": {"O": 30, "C": 30, "E": 30, "A": 30, "N": 30}}
+
+    async def run():
+        first = await llm.generate_four([same] * 4, "p1", "t1", "A", "prompt")
+        # identical traits: every condition renders the same prompts as p1's
+        second = await llm.generate_four([same] * 4, "p2", "t1", "A", "prompt")
+        alias = await cache.get(cache.make_key("p2", "t1", "baseline"))
+        again = await llm.generate_four([same] * 4, "p2", "t1", "A", "prompt")
+        monkeypatch.setattr(llm.settings, "LLM_MODEL", "other-model")
+        await llm.generate_four([same] * 4, "p3", "t1", "A", "prompt")
+        return first, second, again, alias
+
+    first, second, again, alias = asyncio.run(run())
+    assert all(r.get("fromCache") for r in second)
+    assert [r["text"] for r in second] == [r["text"] for r in first]
+    # p2's rows get their own responseIds, and keep them on later hits
+    assert not {r["responseId"] for r in second} & {r["responseId"] for r in first}
+    assert [r["responseId"] for r in again] == [r["responseId"] for r in second]
+    assert alias.startswith(llm.ALIAS + "gen:")
+    assert len(calls) == 8  # p1 and p3 (new model) generate, p2 does not
+
+def test_fill_rechecks_cache_when_lock_wait_times_out(monkeypatch):
+    from contextlib import asynccontextmanager
+
+    from app.services import llm
+
+    calls = []
+
+    async def fake_call(system_prompt, user_prompt, deadline=None, on_delta=None):
+        calls.append(system_prompt)
+        return {"text": "{}", "model": "fake", "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    cache = Cache(None, 3600)
+    filled = {"condition": "baseline", "responseId": "other-worker", "text": "{}"}
+
+    @asynccontextmanager
+    async def timed_out_lock(key, timeout_s):
+        # another worker filled the key while this one waited, then the wait timed out
+        await cache.set(cache.make_key("p1", "t1", "baseline"), json.dumps(filled))
+        yield False
+
+    monkeypatch.setattr(cache, "lock", timed_out_lock)
+    monkeypatch.setattr(llm, "_call_openai", fake_call)
+    monkeypatch.setattr(llm, "get_cache", lambda: cache)
+    monkeypatch.setattr(llm.settings, "PERSIST_GENERATIONS", False)
+    keys = {"baseline": cache.make_key("p1", "t1", "baseline"), "mirror": cache.make_key("p1", "t1", "mirror")}
+
+    out = asyncio.run(llm._fill("p1", "t1", keys, {"baseline": "sys-b", "mirror": "sys-m"}, "prompt"))
+
+    assert out["baseline"]["responseId"] == "other-worker" and out["baseline"]["fromCache"]
+    assert calls == ["sys-m"]
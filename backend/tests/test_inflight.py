@@ -0,0 +1,111 @@
+import asyncio
+from app.services import llm
+from app.services.inflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    async def run():
+        sf = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"ok": True}
+
+        results = await asyncio.gather(*[sf.do("k", work) for _ in range(5)])
+        return sf, calls, results
+
+    sf, calls, results = asyncio.run(run())
+    assert calls == 1
+    assert all(r == {"ok": True} for r in results)
+    assert sf.coalesced == 4
+    assert sf.in_flight() == 0
+
+
+def test_followers_see_leader_error():
+    async def run():
+        sf = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream 429")
+
+        return await asyncio.gather(sf.do("k", boom), sf.do("k", boom), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_generate_four_dedupes_concurrent_requests(monkeypatch):
+    calls = []
+
+    async def fake_call(system_prompt, user_prompt, deadline=None, on_delta=None):
+        calls.append(user_prompt)
+        await asyncio.sleep(0.01)
+        return {"text": "{}", "model": "fake", "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    monkeypatch.setattr(llm, "_call_openai", fake_call)
+    personas = [{"persona": {"O": 30, "C": 30, "E": 30, "A": 30, "N": 30}}] * 4
+
+    async def run():
+        return await asyncio.gather(*[
+            llm.generate_four(personas, "p-dedupe", "t1", "A", "prompt") for _ in range(3)
+        ])
+
+    results = asyncio.run(run())
+    assert len(calls) == 4
+    assert [r["responseId"] for r in results[0]] == [r["responseId"] for r in results[2]]
+
+
+def test_generate_four_only_calls_llm_for_missing(monkeypatch):
+    calls = []
+
+    async def fake_call(system_prompt, user_prompt, deadline=None, on_delta=None):
+        calls.append(system_prompt)
+        return {"text": "{}", "model": "fake", "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    monkeypatch.setattr(llm, "_call_openai", fake_call)
+    personas = [{"persona": {"O": 30, "C": 30, "E": 30, "A": 30, "N": 30}}] * 4
+
+    async def run():
+        await llm.cache.set(llm.cache.make_key("p-partial", "t1", "baseline"), '{"condition":"baseline","text":"hit"}')
+        return await llm.generate_four(personas, "p-partial", "t1", "A", "prompt")
+
+    results = asyncio.run(run())
+    assert len(calls) == 3
+    assert [r["condition"] for r in results] == llm.CONDITION_ORDER
+    assert results[0]["fromCache"] is True
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def run():
+        sf = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        leader = asyncio.ensure_future(sf.do("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(sf.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()  # e.g. the first client disconnected
+        await asyncio.sleep(0)
+        release.set()
+        return leader, await follower, sf
+
+    leader, result, sf = asyncio.run(run())
+    assert leader.cancelled()
+    assert result == "done"
+    assert sf.in_flight() == 0
+
+
+def test_stats_route_reports_coalescing():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    body = TestClient(app).get("/api/stats").json()
+    assert set(body["singleflight"]) == {"leaders", "coalesced", "inFlight"}
@@ -0,0 +1,80 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.services import llm, persistence, personas
+from app.services.big5 import score_ipip50
+from app.services.cache import Cache
+
+
+def test_personas_cached_until_rescore(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    cache = Cache(None, 3600)
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+    monkeypatch.setattr(llm, "get_cache", lambda: cache)
+
+    lookups = []
+    load = personas._load_user_scores
+
+    async def counting_load(participant_id, session):
+        lookups.append(participant_id)
+        return await load(participant_id, session)
+
+    monkeypatch.setattr(personas, "_load_user_scores", counting_load)
+
+    async def resolve():
+        async with sessions() as s:
+            return await personas.personas_for_participant("p1", s, cache)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        first = await resolve()          # no score yet: mid personas, cached
+        second = await resolve()
+        answers = [5] * 50
+        await llm.write_scores([persistence.score_row("p1", answers, score_ipip50(answers))])
+        third = await resolve()          # invalidated by the write
+        fourth = await resolve()
+        return first, second, third, fourth
+
+    first, second, third, fourth = asyncio.run(run())
+
+    assert first == second and third == fourth
+    assert first[1]["persona"] == {"O": 30, "C": 30, "E": 30, "A": 30, "N": 30}
+    assert third[1]["persona"] == score_ipip50([5] * 50)
+    assert lookups == ["p1", "p1"]
+
+
+def test_persona_profile_route(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.db import get_session
+    from app.routes import personas as personas_route
+
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(personas_route, "get_cache", lambda: Cache(None, 3600))
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    async def session():
+        async with sessions() as s:
+            yield s
+
+    asyncio.run(setup())
+    app = FastAPI()
+    app.include_router(personas_route.router)
+    app.dependency_overrides[get_session] = session
+
+    r = TestClient(app).post("/persona-profile", json={"participantId": "p1"})
+
+    assert r.status_code == 200
+    body = r.json()
+    assert body["participantId"] == "p1"
+    assert [p["type"] for p in body["personas"]] == ["baseline", "mirror", "comp", "creative"]
@@ -0,0 +1,48 @@
+import os
+from app.services.llm import system_prompt_for
+from app.services.prompts import PROMPTS_DIR, PromptRegistry, PromptTemplate
+
+
+def test_render_fills_slots_like_str_replace():
+    text = (PROMPTS_DIR / "style_a_persona.txt").read_text(encoding="utf-8")
+    persona = {"O": 42, "C": 11, "E": 30, "A": 50, "N": 19}
+    expected = text
+    for key, label in (("O", "Openness"), ("C", "Conscientiousness"), ("E", "Extraversion"),
+                       ("A", "Agreeableness"), ("N", "Neuroticism")):
+        expected = expected.replace(f"{label}: (dynamic)", f"{label}: {persona[key]}")
+
+    assert system_prompt_for("A", "mirror", persona) == expected
+    assert "(dynamic)" not in expected
+
+
+def test_missing_trait_keeps_placeholder():
+    t = PromptTemplate.compile("t", "Openness: (dynamic); Neuroticism: (dynamic);")
+    assert t.render({"O": 40}) == "Openness: 40; Neuroticism: (dynamic);"
+    assert t.render(None) == t.text
+
+
+def test_reload_on_mtime_change(tmp_path):
+    (tmp_path / "style_a_baseline.txt").write_text("one", encoding="utf-8")
+    (tmp_path / "creative_profile.json").write_text('{"persona": {"O": 1}}', encoding="utf-8")
+    reg = PromptRegistry(tmp_path)
+    v1 = reg.version
+    assert reg.refresh() is False
+
+    path = tmp_path / "style_a_baseline.txt"
+    path.write_text("two", encoding="utf-8")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert reg.refresh() is True
+    assert reg.template("style_a_baseline.txt").text == "two"
+    assert reg.version != v1
+
+    reg.data("creative_profile.json")["persona"]["O"] = 99
+    assert reg.data("creative_profile.json")["persona"]["O"] == 1
+
+
+def test_render_prefixed_keeps_template_as_prefix():
+    t = PromptTemplate.compile("t", "Openness: (dynamic); Neuroticism: (dynamic);\nAnswer briefly.")
+    out = t.render_prefixed({"O": 40, "N": 12})
+    assert out.startswith(t.text)
+    assert out.endswith("Openness: 40;\nNeuroticism: 12;\n")
+    assert t.render_prefixed(None) == t.text
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from app.mock_llm import MockConfig, create_app
+from app.services import llm
+from app.services.providers import MockProvider, OpenAIProvider
+from app.services.resilience import is_retryable
+
+
+def _provider(**cfg):
+    app = create_app(MockConfig(latency_ms=0, latency_sigma=0, ttft_ms=0, **cfg))
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    client = AsyncOpenAI(api_key="unused", base_url="http://mock/v1", http_client=http, max_retries=0)
+    return OpenAIProvider(client, "compatible")
+
+
+def _request():
+    return llm.chat_request("system", "Write a pitch.")
+
+
+def test_mock_server_answers_like_openai_plain_and_streamed():
+    provider = _provider(min_tokens=20, max_tokens=20, chunk_tokens=2)
+    deltas = []
+
+    async def run():
+        return await provider.complete(_request()), await provider.complete(_request(), deltas.append)
+
+    plain, streamed = asyncio.run(run())
+    assert json.loads(plain["text"])["narrative"].count(" ") == 19
+    assert plain["usage"]["completion_tokens"] == 20 and plain["usage"]["prompt_tokens"] > 0
+    # same prompt -> same text, streamed in several chunks with usage at the end
+    assert streamed["text"] == plain["text"] and len(deltas) > 1
+    assert streamed["usage"] == plain["usage"]
+
+
+def test_mock_server_429_is_retryable():
+    provider = _provider(rate_429=1.0)
+    with pytest.raises(Exception) as exc:
+        asyncio.run(provider.complete(_request()))
+    assert exc.value.status_code == 429 and is_retryable(exc.value)
+
+
+def test_inline_mock_provider_skips_admission(monkeypatch):
+    monkeypatch.setattr(llm, "get_provider", lambda: MockProvider())
+    monkeypatch.setattr(llm, "get_admission", lambda: pytest.fail("mock calls are not admitted"))
+
+    out = asyncio.run(llm._call_openai("system", "user prompt"))
+    assert out["model"] == "mock" and out["text"].startswith("[MOCKED]")
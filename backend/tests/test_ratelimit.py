@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import pytest
+from app.services.ratelimit import Admission, AdmissionTimeout, TokenBucket, estimate_tokens
+
+
+def test_bucket_queues_callers_fifo():
+    b = TokenBucket(per_minute=60, capacity=2)   # 1 token/s
+    assert b.reserve(1) == 0.0
+    assert b.reserve(1) == 0.0
+    assert b.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert b.reserve(1) == pytest.approx(2.0, abs=0.05)
+
+
+def test_semaphore_caps_in_flight():
+    async def run():
+        adm = Admission(max_in_flight=2)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with adm.slot(10, time.monotonic() + 5):
+                peak = max(peak, adm.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[call() for _ in range(6)])
+        return adm, peak
+
+    adm, peak = asyncio.run(run())
+    assert peak == 2
+    assert adm.admitted == 6 and adm.stats()["queueDepth"] == 0
+
+
+def test_rejects_when_wait_exceeds_deadline():
+    async def run():
+        adm = Admission(max_in_flight=0, tpm=600)   # 10 tokens/s, bucket of 600
+        async with adm.slot(600, time.monotonic() + 1):
+            pass
+        with pytest.raises(AdmissionTimeout):
+            async with adm.slot(600, time.monotonic() + 1):
+                pass
+        return adm
+
+    adm = asyncio.run(run())
+    assert adm.rejected == 1
+    assert adm.tokens.tokens == pytest.approx(0, abs=1)  # refunded
+
+
+
+def test_refunds_reservation_on_slot_timeout_and_cancel():
+    async def run():
+        adm = Admission(max_in_flight=1, rpm=60)   # bucket of 60 requests
+        async with adm.slot(10, time.monotonic() + 1):
+            # the only slot is taken: this caller times out on the semaphore
+            with pytest.raises(AdmissionTimeout):
+                async with adm.slot(10, time.monotonic() + 0.05):
+                    pass
+            waiter = asyncio.ensure_future(adm.slot(10, time.monotonic() + 5).__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()  # e.g. the client disconnected while queued
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        return adm
+
+    adm = asyncio.run(run())
+    assert adm.requests.tokens == pytest.approx(59, abs=0.5)  # only the admitted call is charged
+
+def test_estimate_tokens():
+    assert estimate_tokens("x" * 400, "y" * 40, 800) == 910
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+from app.services import llm
+from app.services.resilience import Resilience, is_retryable
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_retries_transient_errors_then_succeeds():
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise RateLimited("slow down")
+        return "ok"
+
+    r = Resilience(max_attempts=3, base_s=0.001, cap_s=0.005, hedge_percentile=0)
+    assert asyncio.run(r.call(flaky, time.monotonic() + 5)) == "ok"
+    assert calls == 3 and r.retries == 2
+
+
+def test_does_not_retry_client_errors():
+    class BadRequest(Exception):
+        status_code = 400
+
+    async def bad():
+        raise BadRequest("nope")
+
+    r = Resilience(max_attempts=3, base_s=0.001, hedge_percentile=0)
+    with pytest.raises(BadRequest):
+        asyncio.run(r.call(bad, time.monotonic() + 5))
+    assert r.retries == 0
+    assert is_retryable(TimeoutError()) and is_retryable(RateLimited())
+
+
+def test_hedge_wins_when_first_attempt_stalls():
+    delays = iter([1.0, 0.0])
+
+    async def call():
+        await asyncio.sleep(next(delays))
+        return "done"
+
+    r = Resilience(hedge_percentile=95)
+    for _ in range(20):
+        r.latency.add(0.01)
+
+    async def run():
+        t0 = time.monotonic()
+        out = await r.call(call, t0 + 5)
+        return out, time.monotonic() - t0
+
+    out, elapsed = asyncio.run(run())
+    assert out == "done" and elapsed < 0.5
+    assert r.hedges == 1 and r.hedge_wins == 1
+
+
+def test_partial_results_mark_failed_conditions(monkeypatch):
+    async def fake_call(system_prompt, user_prompt, deadline=None, on_delta=None):
+        if system_prompt == "prompt for creative":
+            raise ValueError("bad output")
+        return {"text": '{"answer":"fine"}', "model": "fake", "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    monkeypatch.setattr(llm, "_call_openai", fake_call)
+    monkeypatch.setattr(llm, "system_prompt_for", lambda style, cond, persona=None: f"prompt for {cond}")
+    personas = [{"persona": {"O": 30}}] * 4
+
+    async def run():
+        results = await llm.generate_four(personas, "p-partial-2", "t1", "A", "x", partial=True)
+        with pytest.raises(ValueError):
+            await llm.generate_four(personas, "p-partial-2", "t1", "A", "x")
+        return results
+
+    results = asyncio.run(run())
+    assert [("error" in r) for r in results] == [False, False, False, True]
@@ -0,0 +1,129 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import score_big5 as cli
+from app.db import Base
+from app.models import Big5Score, Participant
+from app.routes import scoring
+from app.services import llm, persistence
+from app.services.big5 import score_ipip50
+from app.services.personas import _load_user_scores
+
+ANSWERS = [3] * 50
+
+
+def _sessions():
+    """In-memory SQLite shared by every session of the returned factory."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(setup())
+    return sessions
+
+
+def test_insert_scores_upserts_participants_and_latest_wins(monkeypatch):
+    sessions = _sessions()
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+    first = [5] * 50
+
+    async def run():
+        await persistence.insert_scores([
+            persistence.score_row("p1", ANSWERS, score_ipip50(ANSWERS)),
+            persistence.score_row("p2", ANSWERS, score_ipip50(ANSWERS)),
+        ])
+        await persistence.insert_scores([persistence.score_row("p1", first, score_ipip50(first))])
+        async with sessions() as s:
+            n_participants = (await s.execute(select(func.count()).select_from(Participant))).scalar()
+            stored = (await s.execute(select(Big5Score.answers).order_by(Big5Score.id))).scalars().all()
+            return n_participants, stored, await _load_user_scores("p1", s)
+
+    n_participants, stored, latest = asyncio.run(run())
+
+    assert n_participants == 2
+    assert len(stored) == 3  # the re-score is a new row; p1's first score stays as history
+    assert json.loads(stored[0]) == ANSWERS and json.loads(stored[2]) == first
+    assert latest == score_ipip50(first)
+
+
+def test_rescore_lands_above_the_export_watermark(monkeypatch):
+    from app.services.exporting import high_water_mark, table_rows
+
+    sessions = _sessions()
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+    rescored = [5] * 50
+
+    async def run():
+        await persistence.insert_scores([persistence.score_row("p1", ANSWERS, score_ipip50(ANSWERS))])
+        async with sessions() as s:
+            exported = await high_water_mark(s, Big5Score)  # an --append export ran here
+        await persistence.insert_scores([persistence.score_row("p1", rescored, score_ipip50(rescored))])
+        async with sessions() as s:
+            max_id = await high_water_mark(s, Big5Score)
+            return [tuple(r) async for r in table_rows(s, Big5Score, ["participant_id", "O"], max_id, exported)]
+
+    assert asyncio.run(run()) == [("p1", score_ipip50(rescored)["O"])]
+
+
+def test_score_big5_queues_row_without_waiting(monkeypatch):
+    queued = []
+    monkeypatch.setattr(llm.settings, "PERSIST_SCORES", True)
+    monkeypatch.setattr(llm.settings, "WARMUP_ENABLED", False)
+    monkeypatch.setattr(scoring, "get_score_writer", lambda: SimpleNamespace(put=queued.append))
+    app = FastAPI()
+    app.include_router(scoring.router)
+
+    r = TestClient(app).post("/score-big5", json={"participantId": "p1", "answers": json.dumps(ANSWERS)})
+
+    assert r.status_code == 200
+    assert queued[0]["participant_id"] == "p1" and json.loads(queued[0]["answers"]) == ANSWERS
+    assert queued[0]["O"] == score_ipip50(ANSWERS)["O"]
+
+
+def test_rescore_cli_from_db_saves_new_latest(monkeypatch, tmp_path):
+    sessions = _sessions()
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+    stale = persistence.score_row("p1", ANSWERS, {t: 0 for t in "OCEAN"})  # e.g. scored with a wrong key
+    asyncio.run(persistence.insert_scores([stale]))
+    out = tmp_path / "scores.csv"
+
+    cli.main(["--from-db", "--save", "--out", str(out)], sessions=sessions)
+
+    async def latest():
+        async with sessions() as s:
+            return await _load_user_scores("p1", s)
+
+    assert asyncio.run(latest()) == score_ipip50(ANSWERS)
+    assert out.read_text().splitlines()[1].startswith("p1,")
+
+
+def test_rescore_cli_save_invalidates_cached_personas(monkeypatch, tmp_path):
+    from app.services.cache import Cache
+    from app.services.personas import persona_cache_key
+
+    sessions = _sessions()
+    cache = Cache(None, 3600)
+    monkeypatch.setattr(persistence, "get_sessionmaker", lambda: sessions)
+    monkeypatch.setattr(llm, "get_cache", lambda: cache)
+    monkeypatch.setattr(cli, "get_cache", lambda: cache)
+    asyncio.run(persistence.insert_scores([persistence.score_row("p1", ANSWERS, {t: 0 for t in "OCEAN"})]))
+    asyncio.run(cache.set(persona_cache_key("p1"), "[]"))
+
+    cli.main(["--from-db", "--save", "--out", str(tmp_path / "scores.csv")], sessions=sessions)
+
+    async def stored():
+        async with sessions() as s:
+            return (await s.execute(select(func.count()).select_from(Big5Score))).scalar()
+
+    assert asyncio.run(cache.get(persona_cache_key("p1"))) is None
+    assert asyncio.run(stored()) == 2
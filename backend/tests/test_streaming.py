@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import llm
+
+TASK = {
+    "participantId": "p-stream", "taskId": "t1",
+    "trait_openness": 40, "trait_conscientiousness": 20, "trait_extraversion": 30,
+    "trait_agreeableness": 35, "trait_neuroticism": 25,
+}
+
+
+def _events(body: str):
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+def test_stream_emits_conditions_in_completion_order(monkeypatch):
+    delay = {"baseline": 0.03, "mirror": 0.0, "comp": 0.02, "creative": 0.01}
+
+    async def fake_call(system_prompt, user_prompt, deadline=None, on_delta=None):
+        cond = system_prompt
+        await asyncio.sleep(delay[cond])
+        if on_delta:
+            on_delta('{"answer":')
+            on_delta(f'"{cond}"}}')
+        return {"text": f'{{"answer":"{cond}"}}', "model": "fake", "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    monkeypatch.setattr(llm, "_call_openai", fake_call)
+    monkeypatch.setattr(llm, "system_prompt_for", lambda style, cond, persona=None: cond)
+    monkeypatch.setattr(llm.settings, "PERSIST_GENERATIONS", False)  # keep study.db untouched
+    monkeypatch.setattr(llm.settings, "PERSIST_SCORES", False)
+    monkeypatch.setattr(llm.settings, "DB_MIGRATE", False)
+
+    with TestClient(app) as client:
+        resp = client.post("/api/generate-task/stream?tokens=true", json=TASK)
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = _events(resp.text)
+
+    conditions = [d["condition"] for e, d in events if e == "condition"]
+    assert conditions == ["mirroring", "creative", "complementing", "baseline"]
+    assert sum(1 for e, _ in events if e == "token") == 8
+    assert events[-1] == ("done", {"missing": []})
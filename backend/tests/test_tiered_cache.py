@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services import cache as cache_mod
+from app.services.cache import Cache
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.server.subscribers.append(self.queue)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+    async def aclose(self):
+        self.server.subscribers.remove(self.queue)
+
+
+class FakePipeline:
+    def __init__(self, server):
+        self.server = server
+        self.ops = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def setex(self, key, ttl, value):
+        self.ops.append((key, value))
+
+    async def execute(self):
+        self.server.calls.append("pipeline")
+        for key, value in self.ops:
+            self.server.data[key] = value
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for the tiered cache."""
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+        self.subscribers = []
+
+    async def get(self, key):
+        self.calls.append("get")
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        self.calls.append("mget")
+        return [self.data.get(k) for k in keys]
+
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    async def flushdb(self):
+        self.data.clear()
+
+    async def publish(self, channel, message):
+        for q in self.subscribers:
+            q.put_nowait({"type": "message", "channel": channel, "data": message})
+        return len(self.subscribers)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+
+def _tiered(monkeypatch, server):
+    monkeypatch.setattr(cache_mod, "redis", SimpleNamespace(from_url=lambda *a, **k: server))
+    return Cache("redis://fake", 3600, l1_ttl_s=30)
+
+
+def test_l1_serves_hot_keys_and_batches_misses(monkeypatch):
+    server = FakeRedis()
+
+    async def run():
+        c = _tiered(monkeypatch, server)
+        await c.set("k1", "v1")
+        server.data["k2"] = "v2"
+        got = await c.get_many(["k1", "k2", "k3"])
+        assert got == {"k1": "v1", "k2": "v2", "k3": None}
+        assert server.calls == ["mget"]      # k1 from L1, k2/k3 in one MGET
+        assert await c.get("k2") == "v2"     # now an L1 hit
+        assert server.calls == ["mget"]
+
+    asyncio.run(run())
+
+
+def test_clear_invalidates_other_workers_l1(monkeypatch):
+    server = FakeRedis()
+
+    async def run():
+        a = _tiered(monkeypatch, server)
+        b = _tiered(monkeypatch, server)
+        await a.set("k", "v")
+        assert await b.get("k") == "v"       # b starts its invalidation listener
+        await asyncio.sleep(0)
+        assert await b.get("k") == "v"
+        assert b.l1.stats()["entries"] == 1
+        await a.clear()
+        await asyncio.sleep(0)
+        assert b.l1.stats()["entries"] == 0
+        assert await b.get("k") is None
+
+    asyncio.run(run())
+
+
+def test_set_many_uses_one_pipeline(monkeypatch):
+    server = FakeRedis()
+
+    async def run():
+        c = _tiered(monkeypatch, server)
+        await c.set_many({"a": "1", "b": "2"})
+        assert server.calls == ["pipeline"]
+        assert server.data == {"a": "1", "b": "2"}
+        assert await c.get_many(["a", "b"]) == {"a": "1", "b": "2"}
+        assert server.calls == ["pipeline"]  # both served from L1
+
+    asyncio.run(run())
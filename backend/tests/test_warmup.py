@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services import warmup as warmup_mod
+from app.services.warmup import WarmupQueue
+
+TRAITS = {"O": 40, "C": 20, "E": 30, "A": 35, "N": 25}
+
+
+def test_warmup_generates_every_task(monkeypatch):
+    calls = []
+
+    async def fake_generate_four(personas, participant_id, task_id, style, prompt_text):
+        calls.append((participant_id, task_id, style, prompt_text, personas[1]["persona"]))
+
+    async def tasks():
+        return [SimpleNamespace(task_id="a1", style="A", prompt_text="x"),
+                SimpleNamespace(task_id="b1", style="B", prompt_text="y")]
+
+    monkeypatch.setattr(warmup_mod, "generate_four", fake_generate_four)
+
+    async def run():
+        q = WarmupQueue(concurrency=2, maxsize=10, load_tasks=tasks)
+        q.start()
+        assert q.submit("p1", TRAITS)
+        await q._queue.join()
+        await q.stop()
+        return q
+
+    q = asyncio.run(run())
+    # same style and prompt the live route resolves for taskPrompt == prompt_text
+    assert calls == [("p1", "a1", "A", "x", TRAITS), ("p1", "b1", "A", "y", TRAITS)]
+    assert q.stats()["completed"] == 1
+
+
+def test_submit_drops_when_full():
+    async def run():
+        q = WarmupQueue(concurrency=0, maxsize=1)
+        q.start()
+        assert q.submit("p1", TRAITS) is True
+        assert q.submit("p2", TRAITS) is False
+        await q.stop()
+        return q
+
+    q = asyncio.run(run())
+    assert q.dropped == 1 and q.enqueued == 1
+    assert q.submit("p3", TRAITS) is False  # not started
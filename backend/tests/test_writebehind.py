@@ -0,0 +1,61 @@
+import asyncio
+
+from app.services.writebehind import WriteBehind
+
+
+def test_batches_by_size_and_drains_on_stop():
+    batches = []
+
+    async def write(rows):
+        batches.append(list(rows))
+
+    async def run():
+        w = WriteBehind(write, max_batch=3, flush_interval_s=10)
+        w.start()
+        for i in range(7):
+            assert w.put(i)
+        await asyncio.sleep(0.01)
+        await w.stop()
+        return w
+
+    w = asyncio.run(run())
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert w.written == 7 and w.put(8) is False
+
+
+def test_flushes_partial_batch_after_interval():
+    batches = []
+
+    async def write(rows):
+        batches.append(list(rows))
+
+    async def run():
+        w = WriteBehind(write, max_batch=100, flush_interval_s=0.02)
+        w.start()
+        w.put("a")
+        await asyncio.sleep(0.06)
+        flushed = list(batches)
+        await w.stop()
+        return flushed
+
+    assert asyncio.run(run()) == [["a"]]
+
+
+def test_retries_failed_batches():
+    attempts = 0
+
+    async def flaky(rows):
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise RuntimeError("database is locked")
+
+    async def run():
+        w = WriteBehind(flaky, flush_interval_s=0, retry_base_s=0.001)
+        w.start()
+        w.put({"id": 1})
+        await w.stop()
+        return w
+
+    w = asyncio.run(run())
+    assert attempts == 3 and w.written == 1 and w.retries == 2